@@ -0,0 +1,112 @@
+# Writing of waveform (.wfm) and sequence (.seq) files in the formats that
+# the Tektronix AWGs import, such that a whole sequence can be written to a
+# (shared) directory and loaded by the instrument at once.
+#
+# The waveform data is written through memory maps, block by block, so
+# that even very long waveforms never need to be in memory completely.
+
+import numpy as np
+
+import pulsar
+
+WFM_MAGIC = 'MAGIC 1000\r\n'
+
+def wfm_header(samples):
+    """
+    Returns the header of a real waveform file with the given number of
+    samples (the data follows as an IEEE 488.2 definite length block).
+    """
+    nbytes = samples * pulsar.REAL_WAVEFORM_DTYPE.itemsize
+    return WFM_MAGIC + '#%d%d' % (len(str(nbytes)), nbytes)
+
+def wfm_trailer(clock):
+    return 'CLOCK %.10e\r\n' % clock
+
+class WFMWriter:
+    """
+    Writes a real waveform file of a fixed number of samples; the data is
+    added in blocks with write(start, w, m1, m2), which go to a memory map
+    of the file.
+    """
+
+    def __init__(self, path, samples, clock):
+        self.path = path
+        self.samples = samples
+
+        header = wfm_header(samples)
+        nbytes = samples * pulsar.REAL_WAVEFORM_DTYPE.itemsize
+        f = open(path, 'wb')
+        try:
+            f.write(header)
+            f.seek(len(header) + nbytes)
+            f.write(wfm_trailer(clock))
+        finally:
+            f.close()
+
+        self._data = None
+        if samples > 0:
+            self._data = np.memmap(path, dtype=pulsar.REAL_WAVEFORM_DTYPE,
+                mode='r+', offset=len(header), shape=(samples,))
+
+    def write(self, start, w, m1, m2):
+        pulsar.pack_waveform(w, m1, m2, format='real',
+            out=self._data[start:start+len(w)])
+
+    def close(self):
+        if self._data is not None:
+            self._data.flush()
+            self._data = None
+
+def read_wfm(path):
+    """
+    Returns (data, clock) of a real waveform file; data is a (read-only)
+    memory map with the records of amplitude and markers.
+    """
+    f = open(path, 'rb')
+    try:
+        head = f.read(len(WFM_MAGIC) + 2)
+        if not head.startswith(WFM_MAGIC):
+            raise Exception('%s is not a waveform file.' % path)
+        digits = int(head[-1])
+        nbytes = int(f.read(digits))
+        offset = len(head) + digits
+        f.seek(offset + nbytes)
+        clock = float(f.read().split()[1])
+    finally:
+        f.close()
+
+    data = np.memmap(path, dtype=pulsar.REAL_WAVEFORM_DTYPE, mode='r',
+        offset=offset, shape=(nbytes // pulsar.REAL_WAVEFORM_DTYPE.itemsize,))
+    return data, clock
+
+def write_seq(path, rows, channels=4, jump_mode='LOGIC', jump_timing='SYNC',
+        djump_table=None):
+    """
+    Writes a sequence file. rows are the rows of Pulsar.sequence_table,
+    with waveform file names; channels is the number of channels of the
+    AWG (2 or 4). Loop counts of -1 (infinite) are written as 0, goto and
+    jump targets as element indices (0: none).
+    """
+    lines = ['MAGIC 300%d' % channels, 'LINES %d' % len(rows)]
+
+    for row in rows:
+        files = ['"%s"' % row['waveforms'].get(ch, '') \
+            for ch in range(1, channels+1)]
+        reps = row['repetitions'] if row['repetitions'] != -1 else 0
+        goto = row['goto_target'] if row['goto_target'] != None else 0
+        jump = row['jump_target'] if row['jump_target'] != None else 0
+        lines.append(','.join(files + ['%d' % reps,
+            '%d' % int(row['trigger_wait']), '%d' % goto, '%d' % jump]))
+
+    if djump_table != None:
+        jump_mode = 'TABLE'
+        lines.append('TABLE_JUMP ' + ','.join(['%d' % djump_table.get(i, 0) \
+            for i in range(16)]))
+    lines.append('JUMP_MODE %s' % jump_mode)
+    lines.append('JUMP_TIMING %s' % jump_timing)
+
+    f = open(path, 'wb')
+    try:
+        f.write('\r\n'.join(lines) + '\r\n')
+    finally:
+        f.close()
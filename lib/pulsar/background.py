@@ -0,0 +1,245 @@
+# Background execution of the slow pulsar operations (uploads, sequence
+# programming), such that the console or a measurement is not blocked.
+#
+# A Worker runs the operations submitted to it one after the other in its
+# own thread; every operation is represented by a Task, a handle in the
+# spirit of a future: it tells the progress, can be waited for, cancelled,
+# and calls callbacks when it is done.
+#
+# If the callbacks should be run from the gobject main loop (as in qtlab),
+# create the task with main_loop=True. Like all threads that are used
+# together with gobject, this requires gobject.threads_init() to have been
+# called (qtlab does that).
+
+import sys
+import time
+import Queue
+import logging
+import threading
+
+try:
+    import gobject
+except ImportError:
+    gobject = None
+
+class CancelledError(Exception):
+    pass
+
+class Task:
+    """
+    Handle of an operation that runs in the background.
+
+    Progress is counted in steps (e.g., elements; total is None if unknown)
+    and bytes. States: 'pending', 'running', 'done', 'failed', 'cancelled'.
+    """
+
+    def __init__(self, name, total=None, main_loop=False):
+        self.name = name
+        self.total = total
+        self.main_loop = main_loop
+
+        self.steps_done = 0
+        self.bytes_sent = 0
+        self.state = 'pending'
+        self.t_start = None
+        self.t_stop = None
+
+        self._result = None
+        self._exc_info = None
+        self._cancel = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+        if self.main_loop and gobject == None:
+            raise Exception('gobject is not available; cannot run the ' \
+                'callbacks in the main loop.')
+
+    def __repr__(self):
+        return '<Task %s: %s, %s>' % (self.name, self.state,
+            self.progress_string())
+
+    ### progress
+    def advance(self, steps=1, nbytes=0):
+        """
+        Called by the operation to report progress.
+        """
+        self.steps_done += steps
+        self.bytes_sent += nbytes
+
+    def progress(self):
+        """
+        Returns the fraction of the steps done (None if the total number of
+        steps is unknown).
+        """
+        if self.total == None:
+            return None
+        if self.total == 0:
+            return 1.
+        return float(self.steps_done) / self.total
+
+    def progress_string(self):
+        if self.total == None:
+            return '%d done, %d bytes' % (self.steps_done, self.bytes_sent)
+        return '%d / %d done, %d bytes' % (self.steps_done, self.total,
+            self.bytes_sent)
+
+    def elapsed(self):
+        if self.t_start == None:
+            return 0.
+        if self.t_stop == None:
+            return time.time() - self.t_start
+        return self.t_stop - self.t_start
+
+    ### state
+    def running(self):
+        return self.state == 'running'
+
+    def done(self):
+        """
+        True if the task has finished, whether successfully, with an
+        error, or cancelled.
+        """
+        return self._finished.isSet()
+
+    def cancelled(self):
+        return self.state == 'cancelled'
+
+    def cancel(self):
+        """
+        Asks the task to stop. A pending task is not run at all, a running
+        one stops at the next point where the operation checks (see
+        cancel_requested). Returns False if the task has finished already.
+        """
+        if self.done():
+            return False
+        self._cancel = True
+        return True
+
+    def cancel_requested(self):
+        return self._cancel
+
+    def wait(self, timeout=None):
+        """
+        Waits until the task has finished. Returns False on timeout.
+        """
+        self._finished.wait(timeout)
+        return self.done()
+
+    def result(self, timeout=None):
+        """
+        Waits for the task and returns the result of the operation. Raises
+        the exception of the operation if it failed, and CancelledError
+        if it was cancelled.
+        """
+        if not self.wait(timeout):
+            raise Exception("Task '%s' not finished after %s seconds." % \
+                (self.name, timeout))
+        if self.state == 'cancelled':
+            raise CancelledError("Task '%s' was cancelled." % self.name)
+        if self._exc_info != None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        if not self.wait(timeout):
+            raise Exception("Task '%s' not finished after %s seconds." % \
+                (self.name, timeout))
+        if self._exc_info != None:
+            return self._exc_info[1]
+        return None
+
+    ### callbacks
+    def add_done_callback(self, fn):
+        """
+        fn(task) is called when the task has finished (right away, if it
+        has already). Callbacks run in the worker thread, or in the main
+        loop if the task was created with main_loop=True.
+        """
+        self._lock.acquire()
+        try:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        finally:
+            self._lock.release()
+        self._call(fn)
+
+    def _call(self, fn):
+        if self.main_loop:
+            def idle():
+                self._run_callback(fn)
+                return False
+            gobject.idle_add(idle)
+        else:
+            self._run_callback(fn)
+
+    def _run_callback(self, fn):
+        try:
+            fn(self)
+        except Exception as e:
+            logging.exception("Callback of task '%s' failed: %s" % \
+                (self.name, e))
+
+    ### execution (by the worker)
+    def _run(self, fn):
+        if self._cancel:
+            self._finish('cancelled')
+            return
+
+        self.state = 'running'
+        self.t_start = time.time()
+        try:
+            self._result = fn(self)
+        except:
+            self._exc_info = sys.exc_info()
+            logging.error("Task '%s' failed: %s" % (self.name,
+                self._exc_info[1]))
+            self._finish('failed')
+            return
+
+        self._finish('cancelled' if self._cancel else 'done')
+
+    def _finish(self, state):
+        self._lock.acquire()
+        try:
+            self.state = state
+            self.t_stop = time.time()
+            self._finished.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        finally:
+            self._lock.release()
+
+        for fn in callbacks:
+            self._call(fn)
+
+class Worker:
+    """
+    Runs submitted tasks one after the other, in the order of submission,
+    in a daemon thread.
+    """
+
+    def __init__(self, name='worker'):
+        self.name = name
+        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._loop,
+            name='%s background worker' % name)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def submit(self, task, fn):
+        """
+        Schedules fn(task); its return value becomes the result of the
+        task.
+        """
+        self._queue.put((task, fn))
+        return task
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _loop(self):
+        while True:
+            task, fn = self._queue.get()
+            task._run(fn)
@@ -0,0 +1,314 @@
+# Benchmarks for element compilation and sequencing. They do not need qtlab
+# or any hardware; run them from this directory with
+#
+#   python benchmark.py
+#
+# Every benchmark prints a small table of timings.
+
+import time
+from copy import deepcopy
+import numpy as np
+
+import pulse
+import pulselib
+import element
+import pulsar
+import simawg
+import synthesis
+
+def best_time(f, repeat=3):
+    """
+    Returns the best wall clock time out of a few runs of f().
+    """
+    ts = []
+    for i in range(repeat):
+        _t0 = time.time()
+        f()
+        ts.append(time.time() - _t0)
+    return min(ts)
+
+def _channels(elt):
+    elt.define_channel('RF', delay=20e-9, high=1., low=-1.)
+    elt.define_channel('MW_Imod', delay=27e-9, high=.9, low=-.9)
+    elt.define_channel('MW_pulsemod', type='marker', delay=44e-9,
+        high=2., low=0.)
+
+def incremental_recompile(element_lengths=[1e-5, 1e-4, 1e-3],
+        span_lengths=[1e-8, 1e-7, 1e-6]):
+    """
+    Replaces a single pulse in the middle of an element that is filled with
+    1 us long pulses and compares the time for a full compilation with the
+    time for recompiling only the changed span.
+    """
+    sine = pulse.SinePulse('RF', amplitude=0.5, frequency=10e6, length=1e-6)
+    square = pulse.SquarePulse('MW_pulsemod', amplitude=1, length=1e-6)
+
+    print 'Incremental recompilation after replacing one pulse:'
+    print '%12s %12s %12s %12s' % ('element (s)', 'span (s)', 'full (s)',
+        'incr. (s)')
+
+    for l in element_lengths:
+        for sl in span_lengths:
+            elts = []
+            for incremental in [False, True]:
+                elt = element.Element('incremental', min_samples=0,
+                    incremental=incremental, use_cache=False)
+                _channels(elt)
+
+                for i in range(int(l/1e-6)):
+                    elt.append(pulse.cp(sine, phase=i), pulse.cp(square))
+                elt.add(pulse.cp(sine, length=sl), name='swept',
+                    start=l/2.)
+                elts.append(elt)
+
+            full_elt, elt = elts
+            t_full = best_time(full_elt.normalized_waveforms)
+            elt.normalized_waveforms()
+
+            state = {'phase' : 0.}
+            def replace():
+                state['phase'] += 10.
+                elt.replace('swept', pulse.cp(sine, length=sl,
+                    phase=state['phase']))
+                elt.normalized_waveforms()
+            t_incr = best_time(replace)
+
+            print '%12.0e %12.0e %12.4f %12.4f' % (l, sl, t_full, t_incr)
+    print
+
+def element_construction(n=5000):
+    """
+    Builds an element out of n pulses (the way the measurement scripts do, 
+    via pulse.cp and append) and compares pulse cloning with deep copies.
+    """
+    mw = pulselib.MW_IQmod_pulse('mw', 'MW_Imod', 'MW_Qmod', 'MW_pulsemod',
+        PM_risetime=10e-9, length=50e-9)
+    square = pulse.SquarePulse('MW_pulsemod', amplitude=1, length=1e-6)
+    pulses = [mw, square]
+
+    def build():
+        elt = element.Element('construction', min_samples=0)
+        _channels(elt)
+        elt.define_channel('MW_Qmod', delay=27e-9, high=.9, low=-.9)
+        for i in range(n):
+            elt.append(pulse.cp(pulses[i % 2]))
+
+    print 'Construction of an element with %d pulses:' % n
+    print '%12s %12s %12s' % ('', 'clone (s)', 'deepcopy (s)')
+    print '%12s %12.4f %12.4f' % ('copy only', 
+        best_time(lambda: [p.clone() for p in pulses*n]),
+        best_time(lambda: [deepcopy(p) for p in pulses*n]))
+    t_clone = best_time(build)
+
+    # same construction, with the deep copies the element used to make
+    clone = pulse.clone
+    pulse.clone = deepcopy
+    try:
+        t_deepcopy = best_time(build)
+    finally:
+        pulse.clone = clone
+    print '%12s %12.4f %12.4f' % ('element', t_clone, t_deepcopy)
+    print
+
+class _WhereCORPSE(pulselib.IQ_CORPSE_pulse):
+    """
+    CORPSE pulse as it used to be rendered: every segment boundary is found
+    by a scan over all time values, and I and Q are computed separately.
+    """
+    get_wfs = pulse.Pulse.__dict__['get_wfs']
+
+    def chan_wf(self, chan, tvals):
+        if chan == self.PM_channel:
+            return np.ones(len(tvals))
+
+        t0 = tvals[0] + self.PM_risetime
+        bounds = [t0, t0 + self.length_1, 
+            t0 + self.length_1 + self.pulse_delay,
+            t0 + self.length_1 + self.pulse_delay + self.length_2,
+            t0 + self.length_1 + 2*self.pulse_delay + self.length_2,
+            t0 + self.length_1 + 2*self.pulse_delay + self.length_2 + \
+                self.length_3]
+        idx0 = np.where(tvals >= t0)[0][0]
+        idx1 = np.where(tvals <= tvals[0] + self.length - \
+            self.PM_risetime)[0][-1] + 1
+        idx = [np.where(tvals <= b)[0][-1] for b in bounds]
+
+        if not self.phaselock:
+            tvals = tvals.copy() - tvals[idx0]
+
+        f = np.cos if chan == self.I_channel else np.sin
+        wf = np.zeros(len(tvals))
+        for i, sign in [(0, 1), (2, -1), (4, 1)]:
+            s, e = idx[i], idx[i+1]
+            wf[s:e] += sign * self.amplitude * f(2 * np.pi * \
+                (self.frequency * tvals[s:e] + self.phase/360.))
+        return wf
+
+def batched_synthesis(pulse_counts=[100, 1000, 10000]):
+    """
+    Compiles elements with trains of short sine, IQ and square pulses (all
+    with different parameters, such that each is rendered), with the
+    pulses of a kind rendered together and one by one.
+    """
+    sine = pulse.SinePulse('RF', amplitude=0.5, frequency=10e6, 
+        length=100e-9)
+    mw = pulselib.MW_IQmod_pulse('mw', 'MW_Imod', 'MW_Qmod', 'MW_pulsemod',
+        PM_risetime=10e-9, frequency=50e6, length=50e-9)
+    square = pulse.SquarePulse('MW_pulsemod', amplitude=1, length=20e-9)
+
+    print 'Synthesis of pulse trains:'
+    print '%8s %12s %12s' % ('pulses', 'batched (s)', 'single (s)')
+
+    for n in pulse_counts:
+        elt = element.Element('pulse-train', min_samples=0, use_cache=False)
+        _channels(elt)
+        elt.define_channel('MW_Qmod', delay=27e-9, high=.9, low=-.9)
+        for i in range(n // 3):
+            elt.append(pulse.cp(sine, phase=i), pulse.cp(mw, phase=i),
+                pulse.cp(square, amplitude=0.5 + i*1e-6))
+        t_batched = best_time(elt.normalized_waveforms)
+
+        # same element, with every pulse rendered on its own
+        batchable_class = synthesis.batchable_class
+        synthesis.batchable_class = lambda cls: False
+        try:
+            t_single = best_time(elt.normalized_waveforms)
+        finally:
+            synthesis.batchable_class = batchable_class
+        print '%8d %12.4f %12.4f' % (n // 3 * 3, t_batched, t_single)
+    print
+
+def corpse_train(pulse_counts=[100, 1000], rabi_frequencies=[20e6, 2e6]):
+    """
+    Compiles elements that consist of a train of CORPSE pulses (all with
+    a different phase, such that each is rendered), with the segment
+    indexing of pulselib and with the scans it replaced. Raises if the
+    segments are slower.
+    """
+    print 'Compilation of CORPSE pulse trains:'
+    print '%8s %12s %12s %12s' % ('pulses', 'pulse (s)', 'scans (s)',
+        'segments (s)')
+
+    slower = []
+    for rabi in rabi_frequencies:
+        for n in pulse_counts:
+            ts = []
+            for cls in [_WhereCORPSE, pulselib.IQ_CORPSE_pulse]:
+                corpse = cls('corpse', 'MW_Imod', 'MW_Qmod', 'MW_pulsemod',
+                    PM_risetime=10e-9, frequency=50e6, amplitude=0.5,
+                    eff_rotation_angle=180, rabi_frequency=rabi)
+                elt = element.Element('corpse-train', min_samples=0,
+                    use_cache=False)
+                _channels(elt)
+                elt.define_channel('MW_Qmod', delay=27e-9, high=.9, low=-.9)
+                for i in range(n):
+                    elt.append(pulse.cp(corpse, phase=i))
+                ts.append(best_time(elt.normalized_waveforms))
+
+            print '%8d %12.1e %12.4f %12.4f' % (n, corpse.length, ts[0], 
+                ts[1])
+            if ts[1] > ts[0]:
+                slower.append((n, corpse.length))
+    print
+
+    if len(slower) > 0:
+        raise Exception('Segments are slower than scans for ' + \
+            ', '.join(['%d pulses of %.1e s' % r for r in slower]) + '.')
+
+def _simulated_pulsar(**kw):
+    awg = simawg.SimulatedAWG(**kw)
+    qt_pulsar = pulsar.Pulsar()
+    qt_pulsar.AWG = awg
+    qt_pulsar.waveform_registry_path = None
+    qt_pulsar.clear_waveform_registry()
+
+    qt_pulsar.define_channel(id='ch1', name='RF', type='analog',
+        delay=20e-9, offset=0., high=1., low=-1., active=True)
+    qt_pulsar.define_channel(id='ch1_marker1', name='MW_pulsemod',
+        type='marker', delay=44e-9, offset=0., high=2., low=0., active=True)
+    qt_pulsar.define_channel(id='ch3', name='MW_Imod', type='analog',
+        delay=27e-9, offset=0., high=.9, low=-.9, active=True)
+    qt_pulsar.define_channel(id='ch4', name='MW_Qmod', type='analog',
+        delay=27e-9, offset=0., high=.9, low=-.9, active=True)
+    return qt_pulsar, awg
+
+def _rabi_elements(qt_pulsar, n, length=10e-6):
+    """
+    n elements with a MW pulse of increasing length, followed by an RF
+    pulse (in the style of a Rabi measurement).
+    """
+    mw = pulselib.MW_IQmod_pulse('mw', 'MW_Imod', 'MW_Qmod', 'MW_pulsemod',
+        PM_risetime=10e-9, frequency=50e6)
+    rf = pulse.SinePulse('RF', amplitude=0.5, frequency=10e6, length=2e-6)
+    wait = pulse.SquarePulse('RF', amplitude=0, length=length)
+
+    elts = []
+    for i in range(n):
+        elt = element.Element('rabi-%d' % i, pulsar=qt_pulsar)
+        elt.append(pulse.cp(wait, length=1e-6))
+        elt.append(pulse.cp(mw, length=(i+1)*10e-9))
+        elt.append(pulse.cp(rf))
+        elt.append(pulse.cp(wait))
+        elts.append(elt)
+    return elts
+
+def _rabi_sequence(elts, repetitions=1):
+    seq = pulsar.Sequence('rabi')
+    for i, elt in enumerate(elts):
+        seq.append(name=elt.name, wfname=elt.name, trigger_wait=(i == 0),
+            repetitions=repetitions)
+    return seq
+
+def upload_and_sequencing(element_counts=[10, 100], latency=5e-3,
+        bandwidth=5e6):
+    """
+    Uploads and programs sequences of Rabi-like elements into a simulated
+    AWG. Shows the wall clock time of the pulsar (without the time spent
+    by the AWG), and the time the AWG would take according to its model;
+    programming is shown with and without command batching, and for
+    reprogramming after a change of the loop counts (which only sends the
+    differences).
+    """
+    print 'Upload and sequencing with a simulated AWG ' \
+        '(latency %g s, bandwidth %g B/s):' % (latency, bandwidth)
+    print '%8s %22s %12s %12s %12s' % ('elements', 'operation', 'wall (s)',
+        'AWG (s)', 'transfers')
+
+    def row(n, operation, f, awg):
+        awg.reset_stats()
+        _t0 = time.time()
+        f()
+        print '%8d %22s %12.4f %12.4f %12d' % (n, operation, 
+            time.time() - _t0, awg.elapsed, awg.transfers)
+        if len(awg.errors()) > 0:
+            raise Exception('The simulated AWG reported errors.')
+
+    for n in element_counts:
+        for batch in [True, False]:
+            qt_pulsar, awg = _simulated_pulsar(latency=latency,
+                bandwidth=bandwidth, scpi=batch)
+            elts = _rabi_elements(qt_pulsar, n)
+            seq = _rabi_sequence(elts)
+            mode = 'batched' if batch else 'unbatched'
+
+            if batch:
+                row(n, 'upload', lambda: qt_pulsar.upload(verbose=False,
+                    *elts), awg)
+                row(n, 'upload (unchanged)', lambda: qt_pulsar.upload(
+                    verbose=False, *elts), awg)
+            else:
+                qt_pulsar.upload(verbose=False, *elts)
+
+            row(n, 'program (%s)' % mode, lambda: qt_pulsar.program_sequence(
+                seq, verbose=False), awg)
+            row(n, 'reprogram (%s)' % mode, 
+                lambda: qt_pulsar.program_sequence(_rabi_sequence(elts, 2),
+                    verbose=False), awg)
+    print
+
+if __name__ == '__main__':
+    incremental_recompile()
+    element_construction()
+    batched_synthesis()
+    corpse_train()
+    upload_and_sequencing()
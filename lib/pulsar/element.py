@@ -2,10 +2,15 @@
 #
 # author: Wolfgang Pfaff
 
+import logging
 import numpy as np
-from copy import deepcopy
+from copy import copy, deepcopy
+from collections import OrderedDict
 import pprint
 import pulsar
+import synthesis
+import wfcache
+import pulse as pulse_module
 
 class Element:
     """
@@ -27,9 +32,38 @@ class Element:
         
         self.ignore_delays = kw.pop('ignore_delays',False)
 
+        # reuse rendered pulses from the process-wide waveform cache
+        self.use_cache = kw.pop('use_cache', True)
+
+        # keep the normalized waveforms after compilation, and only
+        # recompute the parts that changed when pulses are added or replaced
+        self.incremental = kw.pop('incremental', False)
+
         self.pulses = {}
         self._channels = {}
         self._last_added_pulse = None
+        self._auto_name_counters = {}
+
+        # how add placed each pulse (start, refpulse, refpoint,
+        # refpoint_new), in the order the pulses were added
+        self._placements = OrderedDict()
+
+        # cached timing information (offset, start/end samples of each
+        # pulse on each channel); built lazily, see _timing_table()
+        self._timing = None
+
+        # compiled (normalized) waveforms and the sample spans per channel
+        # that need to be recomputed, if compiling incrementally
+        self._compiled = None
+        self._dirty = {}
+
+        # number of samples per analog channel that were out of bounds in
+        # the last compilation
+        self.clipped_samples = {}
+
+        # indices of the clipped samples per analog channel in the compiled
+        # waveforms, to keep the counts up to date when recompiling
+        self._compiled_clipped = {}
 
         if self.pulsar != None:
             self.clock = self.pulsar.clock
@@ -52,29 +86,189 @@ class Element:
     def _sample2time(self, s):
         return s / self.clock
 
+    ### timing table
+    def _invalidate_timing(self):
+        """
+        Discards the cached timing table. Needs to be called whenever
+        pulses or channel delays change in a way the table cannot follow
+        incrementally.
+        """
+        self._timing = None
+
+    def _timing_table(self):
+        """
+        Returns the timing table of the element, building it if necessary.
+
+        The table contains the global offset, the delay-corrected (but not
+        offset-corrected) start and end time of each pulse on each of its
+        channels, the corresponding start and end samples, the number of
+        samples of each pulse, as well as the latest end time and sample of
+        the element.
+
+        The table follows add, replace and pulse_changed. A pulse whose
+        timing is changed in place without calling pulse_changed leaves it
+        stale; compiling checks for that (see _check_timing).
+        """
+        if self._timing is None:
+            t0s = []
+            for p in self.pulses:
+                for c in self.pulses[p].channels:
+                    t0s.append(self.pulses[p].t0() - \
+                        self._channels[c]['delay'])
+
+            self._timing = {
+                'offset' : min(t0s),
+                'start_times' : {},
+                'end_times' : {},
+                'start_samples' : {},
+                'end_samples' : {},
+                'samples' : {},
+                'pulse_times' : {},
+                'ideal_end' : None,
+                'last_sample' : None,
+                }
+
+            for p in self.pulses:
+                self._timing_add_pulse(p)
+
+        return self._timing
+
+    def _timing_add_pulse(self, pname):
+        """
+        Adds the timing information of a pulse to the table. Requires that
+        the pulse does not change the global offset.
+        """
+        table = self._timing
+        offset = table['offset']
+        pulse = self.pulses[pname]
+        psamples = self._time2sample(pulse.length)
+
+        starts, ends = {}, {}
+        start_samples, end_samples = {}, {}
+        for c in pulse.channels:
+            delay = self._channels[c]['delay']
+            starts[c] = pulse.t0() - delay
+            ends[c] = pulse.end() - delay
+            start_samples[c] = self._time2sample(starts[c] - offset)
+            end_samples[c] = start_samples[c] + psamples - 1
+
+            if table['ideal_end'] is None or \
+                    ends[c] - offset > table['ideal_end']:
+                table['ideal_end'] = ends[c] - offset
+            if table['last_sample'] is None or \
+                    end_samples[c] > table['last_sample']:
+                table['last_sample'] = end_samples[c]
+
+        table['start_times'][pname] = starts
+        table['end_times'][pname] = ends
+        table['start_samples'][pname] = start_samples
+        table['end_samples'][pname] = end_samples
+        table['samples'][pname] = psamples
+        table['pulse_times'][pname] = (pulse.t0(), pulse.length)
+
+    def _check_timing(self):
+        """
+        Rebuilds the timing table (and drops the compiled waveforms) if
+        the start or length of a pulse has been changed in place without
+        calling pulse_changed. Returns True if it was stale.
+        """
+        if self._timing is None:
+            return False
+
+        times = self._timing['pulse_times']
+        for p in self.pulses:
+            pulse = self.pulses[p]
+            if times[p] != (pulse.t0(), pulse.length):
+                logging.warning("Element '%s': the timing of pulse '%s' " \
+                    "was changed without pulse_changed." % (self.name, p))
+                self._invalidate_timing()
+                self._compiled = None
+                return True
+        return False
+
+    def _timing_update(self, pname, replaced=False):
+        """
+        Updates the timing table after the pulse pname has been added.
+        Only if the pulse moves the global offset (or replaces an existing
+        one) the table is dropped and rebuilt when needed next.
+        """
+        if self._timing is None:
+            return
+
+        if replaced:
+            self._invalidate_timing()
+            return
+
+        pulse = self.pulses[pname]
+        for c in pulse.channels:
+            if c not in self._channels or \
+                    pulse.t0() - self._channels[c]['delay'] < \
+                    self._timing['offset']:
+                self._invalidate_timing()
+                return
+
+        self._timing_add_pulse(pname)
+
+    def _timing_replace(self, pname):
+        """
+        Updates the timing table after the pulse pname has been changed,
+        while the table still contains its old timing.
+        """
+        table = self._timing
+        if table is None:
+            return
+
+        pulse = self.pulses[pname]
+        old_starts = table['start_times'][pname].values()
+
+        # if the pulse defined the offset, or now moves it, everything
+        # else moves as well
+        if len(old_starts) == 0 or min(old_starts) <= table['offset']:
+            self._invalidate_timing()
+            return
+        for c in pulse.channels:
+            if c not in self._channels or \
+                    pulse.t0() - self._channels[c]['delay'] < \
+                    table['offset']:
+                self._invalidate_timing()
+                return
+
+        old_ends = table['end_times'][pname].values()
+        old_end_samples = table['end_samples'][pname].values()
+        for k in ['start_times', 'end_times', 'start_samples', 
+                'end_samples', 'samples', 'pulse_times']:
+            del table[k][pname]
+
+        # the pulse may have been the last one
+        if max(old_ends) - table['offset'] >= table['ideal_end'] or \
+                max(old_end_samples) >= table['last_sample']:
+            table['ideal_end'] = None
+            table['last_sample'] = None
+            for p in table['end_times']:
+                for c in table['end_times'][p]:
+                    t = table['end_times'][p][c] - table['offset']
+                    if table['ideal_end'] is None or t > table['ideal_end']:
+                        table['ideal_end'] = t
+                    s = table['end_samples'][p][c]
+                    if table['last_sample'] is None or \
+                            s > table['last_sample']:
+                        table['last_sample'] = s
+
+        self._timing_add_pulse(pname)
+
     def offset(self):
         """
         Returns the smallest t0 of all pulses/channels after correcting for
         delay.
         """
-        t0s = []
-        for p in self.pulses:
-            for c in self.pulses[p].channels:
-                t0s.append(self.pulses[p].t0() - self._channels[c]['delay'])
-                
-        return min(t0s)
+        return self._timing_table()['offset']
 
     def ideal_length(self):
         """
         Returns the nominal length of the element before taking into account
         the discretization using the clock.
         """
-        ts = []
-        for p in self.pulses:
-            for c in self.pulses[p].channels:
-                ts.append(self.pulse_end_time(p,c))
-
-        return max(ts)
+        return self._timing_table()['ideal_end']
 
     def length(self):
         """
@@ -86,12 +280,7 @@ class Element:
         """
         Returns the number of samples the elements occupies.
         """
-        ends = []
-        for p in self.pulses:
-            for c in self.pulses[p].channels:
-                ends.append(self.pulse_end_sample(p,c))
-
-        samples = max(ends)+1
+        samples = self._timing_table()['last_sample'] + 1
         if samples < self.min_samples:
             samples = self.min_samples
         else:
@@ -124,21 +313,25 @@ class Element:
             'high' : high,
             'low' : low,
             }
+        self._invalidate_timing()
+        self._compiled = None
 
     def channel_delay(self, cname):
         return self._channels[cname]['delay']
 
     ### pulse management
     def _auto_pulse_name(self, base='pulse'):
-        i = 0
+        # continue counting where we stopped the last time for this base
+        i = self._auto_name_counters.get(base, 0)
         while base+'-'+str(i) in self.pulses:
             i += 1
+        self._auto_name_counters[base] = i + 1
         return base+'-'+str(i)
 
     def add(self, pulse, name=None, start=0, 
             refpulse=None, refpoint='end', refpoint_new='start'):
 
-        pulse = deepcopy(pulse)
+        pulse = pulse_module.clone(pulse)
         if name == None:
             name = self._auto_pulse_name(pulse.name)
 
@@ -175,11 +368,80 @@ class Element:
 
 
         pulse._t0 = t0
+        pulse._clock = self.clock
+        self._placements[name] = (start, refpulse, refpoint, refpoint_new)
+        replaced = name in self.pulses
+        if replaced:
+            self._mark_dirty(name)
         self.pulses[name] = pulse
         self._last_added_pulse = name
+        self._timing_update(name, replaced=replaced)
+        self._mark_dirty(name)
 
         return name
 
+    def replace(self, name, pulse, reposition=False):
+        """
+        Replaces the pulse name by (a copy of) the given pulse. The new pulse
+        keeps the logical start time of the old one; pulses that have been 
+        added with reference to the old pulse are not moved.
+
+        With reposition, the new pulse is placed the way the old one was
+        added instead, and so are all pulses that depend on it (see
+        dependent_pulses), as if the element had been built with the new
+        pulse from the start.
+        """
+        if reposition and name in self._placements:
+            last_added = self._last_added_pulse
+            for p in [name] + self.dependent_pulses(name):
+                start, refpulse, refpoint, refpoint_new = self._placements[p]
+                self.add(pulse if p == name else self.pulses[p], name=p,
+                    start=start, refpulse=refpulse, refpoint=refpoint,
+                    refpoint_new=refpoint_new)
+            self._last_added_pulse = last_added
+            return name
+
+        old_pulse = self.pulses[name]
+        pulse = pulse_module.clone(pulse)
+        pulse._t0 = old_pulse.effective_start() - pulse.start_offset
+        pulse._clock = self.clock
+
+        self._mark_dirty(name)
+        self.pulses[name] = pulse
+        self._timing_replace(name)
+        self._mark_dirty(name)
+
+        return name
+
+    def dependent_pulses(self, name):
+        """
+        Returns the names of the pulses that have been added with reference
+        to the pulse name, directly or through other pulses, in the order
+        they were added.
+        """
+        deps = set([name])
+        changed = True
+        while changed:
+            changed = False
+            for p in self._placements:
+                if p not in deps and self._placements[p][1] in deps:
+                    deps.add(p)
+                    changed = True
+
+        return [p for p in self._placements if p in deps and p != name]
+
+    def pulse_changed(self, name):
+        """
+        Needs to be called after the pulse name has been modified in place
+        (e.g., its length or phase), such that the element can update its
+        timing and recompute the affected samples. Changes of the length
+        that are not announced are noticed at the next compilation, which
+        then starts from scratch; other changes are not.
+        """
+        self._mark_dirty(name)
+        self._timing_replace(name)
+        self._mark_dirty(name)
+
     #def append(self, pulse):
     #    n = self.add(pulse, refpulse=self._last_added_pulse, 
     #        refpoint='end')
@@ -215,12 +477,12 @@ class Element:
         return t0 + self.time_offset - self.offset()
 
     def pulse_start_time(self, pname, cname):
-        return self.pulses[pname].t0() - self._channels[cname]['delay'] - \
-            self.offset()
+        table = self._timing_table()
+        return table['start_times'][pname][cname] - table['offset']
 
     def pulse_end_time(self, pname, cname):
-        return self.pulses[pname].end() - self._channels[cname]['delay'] - \
-            self.offset()
+        table = self._timing_table()
+        return table['end_times'][pname][cname] - table['offset']
 
     def pulse_global_end_time(self, pname, cname):
         return self.pulse_end_time(pname, cname) + self.time_offset - self.offset()
@@ -229,14 +491,13 @@ class Element:
         return self.pulses[pname].length
 
     def pulse_start_sample(self, pname, cname):
-        return self._time2sample(self.pulse_start_time(pname, cname))
+        return self._timing_table()['start_samples'][pname][cname]
 
     def pulse_samples(self, pname):
         return self._time2sample(self.pulses[pname].length)
 
     def pulse_end_sample(self, pname, cname):
-        return self.pulse_start_sample(pname, cname) + \
-            self.pulse_samples(pname) - 1
+        return self._timing_table()['end_samples'][pname][cname]
 
     def effective_pulse_start_time(self, pname, cname):
         return self.pulse_start_time(pname, cname) + \
@@ -250,37 +511,87 @@ class Element:
     ### computing the numerical waveform
     def ideal_waveforms(self):
         # tvals = np.arange(self.samples())/self.clock
+        self._check_timing()
         wfs = {}
-        tvals = np.arange(self.samples())/self.clock
+        samples = self.samples()
+        tvals = np.arange(samples)/self.clock
 
         for c in self._channels:
-            wfs[c] = np.zeros(self.samples()) + self._channels[c]['offset']
+            wfs[c] = np.zeros(samples) + self._channels[c]['offset']
 
-        # we first compute the ideal function values
-        for p in self.pulses:
-            psamples = self.pulse_samples(p)            
+        # compute the ideal function values of all pulses
+        cache = wfcache.cache if self.use_cache else None
+        synthesis.render(self, tvals, wfs, cache=cache)
 
-            if not self.global_time:                
-                pulse_tvals = tvals.copy()[:psamples]
-                pulsewfs = self.pulses[p].get_wfs(pulse_tvals)
-            else:                
-                chan_tvals = {}
-                
-                for c in self.pulses[p].channels:
-                    idx0 = self.pulse_start_sample(p,c)
-                    idx1 = self.pulse_end_sample(p,c) + 1
-                    c_tvals = np.round(tvals.copy()[idx0:idx1] + \
-                        self.channel_delay(c) + self.time_offset, pulsar.SIGNIFICANT_DIGITS)
-                    chan_tvals[c] = c_tvals
-                
-                pulsewfs = self.pulses[p].get_wfs(chan_tvals)
+        return tvals, wfs
 
-            for c in self.pulses[p].channels:
-                idx0 = self.pulse_start_sample(p,c)
-                idx1 = self.pulse_end_sample(p,c) + 1
-                wfs[c][idx0:idx1] += pulsewfs[c]
+    def _warn_clipped(self, cname, clipped):
+        logging.warning(
+            "Element '%s': %d sample(s) clipped on channel '%s'" \
+            % (self.name, clipped, cname))
 
-        return tvals, wfs
+    def _clip(self, cname, wf, warn=True, clipped_idx=None):
+        """
+        Truncates all values that are out of the bounds of the channel
+        (in place). For analog channels the number of clipped samples is
+        stored in clipped_samples, and a warning is issued if there are any.
+        If a dictionary clipped_idx is given, the indices of the clipped
+        samples of an analog channel are stored there.
+        """
+        hi = self._channels[cname]['high']
+        lo = self._channels[cname]['low']
+
+        if self._channels[cname]['type'] == 'analog':
+            # the bounds check is two reductions that do not allocate; we
+            # only count (and clip) if it fails
+            idx = np.zeros(0, dtype=int)
+            if len(wf) > 0 and (wf.max() > hi or wf.min() < lo):
+                idx = np.flatnonzero((wf > hi) | (wf < lo))
+                np.clip(wf, lo, hi, out=wf)
+                if warn:
+                    self._warn_clipped(cname, len(idx))
+            self.clipped_samples[cname] = len(idx)
+            if clipped_idx != None:
+                clipped_idx[cname] = idx
+
+        elif self._channels[cname]['type'] == 'marker':
+            np.copyto(wf, hi, where=wf > lo)
+            np.copyto(wf, lo, where=wf < lo)
+
+        return wf
+
+    def _normalize(self, cname, wf):
+        """
+        Maps the (clipped) values of a channel onto the range of the 
+        hardware (in place).
+        """
+        hi = self._channels[cname]['high']
+        lo = self._channels[cname]['low']
+
+        if self._channels[cname]['type'] == 'analog':
+            wf *= 2.0
+            wf -= hi
+            wf -= lo
+            wf /= (hi - lo)
+        elif self._channels[cname]['type'] == 'marker':
+            np.greater(wf, lo, out=wf)
+
+        return wf
+
+    def _clip_normalize(self, cname, wf, warn=True, clipped_idx=None):
+        """
+        Clipping and normalization in one go (in place). Markers are mapped
+        directly onto 0 and 1.
+        """
+        if self._channels[cname]['type'] == 'marker':
+            if self._channels[cname]['high'] > self._channels[cname]['low']:
+                np.greater(wf, self._channels[cname]['low'], out=wf)
+            else:
+                wf.fill(0)
+            return wf
+
+        return self._normalize(cname, self._clip(cname, wf, warn=warn,
+            clipped_idx=clipped_idx))
 
     def waveforms(self):
         """
@@ -288,16 +599,7 @@ class Element:
         """
         tvals, wfs = self.ideal_waveforms()
         for wf in wfs:
-            hi = self._channels[wf]['high']
-            lo = self._channels[wf]['low']
-            
-            # truncate all values that are out of bounds
-            if self._channels[wf]['type'] == 'analog':
-                wfs[wf][wfs[wf] > hi] = hi
-                wfs[wf][wfs[wf] < lo] = lo
-            elif self._channels[wf]['type'] == 'marker':
-                wfs[wf][wfs[wf] > lo] = hi
-                wfs[wf][wfs[wf] < lo] = lo
+            self._clip(wf, wfs[wf])
 
         return tvals, wfs
 
@@ -305,21 +607,169 @@ class Element:
         """
         Returns the final numeric arrays, in which channel-imposed
         restrictions are obeyed (bounds, TTL)
+
+        If the element is compiled incrementally, the arrays are kept by the
+        element and are read-only. After the first call, only the samples
+        affected by pulses that have been added, replaced, or changed since
+        are recomputed.
+        """
+        if self._compiled is not None and not self._check_timing():
+            tvals, wfs = self._compiled
+            if len(tvals) == self.samples() and \
+                    self._compiled_offset == self.offset():
+                self._recompile()
+                return tvals, wfs
+            self._compiled = None
+
+        tvals, wfs = self.ideal_waveforms()
+
+        self._compiled_clipped = {}
+        for wf in wfs:
+            self._clip_normalize(wf, wfs[wf],
+                clipped_idx=self._compiled_clipped)
+
+        if self.incremental:
+            for wf in wfs:
+                wfs[wf].flags.writeable = False
+            self._compiled = (tvals, wfs)
+            self._compiled_offset = self.offset()
+            self._dirty = {}
+
+        return tvals, wfs
+
+    def compact_waveforms(self):
+        """
+        Returns the final numeric arrays like normalized_waveforms, but in
+        the representation the AWG stores: analog channels as float32, and
+        marker channels as uint8 (0 or 1). Clipping, normalization and the
+        conversion are done in one pass over the ideal waveforms.
         """
-        tvals, wfs = self.waveforms()
+        if self.incremental:
+            tvals, wfs = self.normalized_waveforms()
+            compact = {}
+            for wf in wfs:
+                if self._channels[wf]['type'] == 'marker':
+                    compact[wf] = wfs[wf].astype(np.uint8)
+                else:
+                    compact[wf] = wfs[wf].astype(np.float32)
+            return tvals, compact
 
+        tvals, wfs = self.ideal_waveforms()
         for wf in wfs:
             hi = self._channels[wf]['high']
             lo = self._channels[wf]['low']
 
             if self._channels[wf]['type'] == 'analog':
-                wfs[wf] = (2.0*wfs[wf] - hi - lo) / (hi - lo)
+                w = self._clip(wf, wfs[wf])
+                w *= 2.0
+                w -= hi
+                w -= lo
+                wfs[wf] = np.empty(len(w), dtype=np.float32)
+                np.divide(w, hi - lo, out=wfs[wf])
             elif self._channels[wf]['type'] == 'marker':
-                wfs[wf][wfs[wf] > lo] = 1
-                wfs[wf][wfs[wf] <= lo] = 0
+                if hi > lo:
+                    wfs[wf] = (wfs[wf] > lo).view(np.uint8)
+                else:
+                    wfs[wf] = np.zeros(len(wfs[wf]), dtype=np.uint8)
 
         return tvals, wfs
 
+    def iter_waveform_chunks(self, chunk_samples):
+        """
+        Generator that yields the final (normalized) waveforms in blocks of
+        at most chunk_samples, in time order: (tvals, wfs) for each block.
+        Only the pulses overlapping a block are computed, such that very 
+        long elements can be processed with bounded memory.
+        """
+        self._check_timing()
+        cache = wfcache.cache if self.use_cache else None
+        clipped = {}
+
+        for i0, i1, wfs in synthesis.iter_chunks(self, chunk_samples,
+                cache=cache):
+            for wf in wfs:
+                self._clip_normalize(wf, wfs[wf], warn=False)
+                if wf in self.clipped_samples:
+                    clipped[wf] = clipped.get(wf, 0) + \
+                        self.clipped_samples[wf]
+
+            yield np.arange(i0, i1) / self.clock, wfs
+
+        self.clipped_samples = clipped
+        for wf in clipped:
+            if clipped[wf] > 0:
+                self._warn_clipped(wf, clipped[wf])
+
+    def _mark_dirty(self, pname):
+        """
+        Remembers the samples currently covered by pulse pname as dirty,
+        if there are compiled waveforms.
+        """
+        if self._compiled is None:
+            return
+
+        table = self._timing_table()
+        if pname not in table['start_samples']:
+            return
+
+        for c in table['start_samples'][pname]:
+            if c not in self._dirty:
+                self._dirty[c] = []
+            self._dirty[c].append((table['start_samples'][pname][c],
+                table['end_samples'][pname][c] + 1))
+
+    def _recompile(self):
+        """
+        Recomputes the dirty spans of the compiled waveforms.
+        """
+        if len(self._dirty) == 0:
+            return
+
+        tvals, wfs = self._compiled
+        cache = wfcache.cache if self.use_cache else None
+        spans = synthesis.render_spans(self, tvals, self._dirty, cache=cache)
+
+        for c in spans:
+            wf = wfs[c]
+            wf.flags.writeable = True
+            for i0, i1, span_wf in spans[c]:
+                span_clipped = {}
+                wf[i0:i1] = self._clip_normalize(c, span_wf, warn=False,
+                    clipped_idx=span_clipped)
+
+                # the clipped samples of the span replace the ones it had
+                if c in span_clipped:
+                    idx = self._compiled_clipped[c]
+                    self._compiled_clipped[c] = np.concatenate([
+                        idx[(idx < i0) | (idx >= i1)],
+                        span_clipped[c] + i0])
+            wf.flags.writeable = False
+
+            if c in self._compiled_clipped:
+                self.clipped_samples[c] = len(self._compiled_clipped[c])
+                if self.clipped_samples[c] > 0:
+                    self._warn_clipped(c, self.clipped_samples[c])
+
+        self._dirty = {}
+
+    def copy(self):
+        """
+        Returns a copy of the element with clones of its pulses. The pulsar
+        is shared, not copied; compiled waveforms are not copied.
+        """
+        elt = copy(self)
+        elt.pulses = dict([(p, pulse_module.clone(self.pulses[p])) \
+            for p in self.pulses])
+        elt._channels = deepcopy(self._channels)
+        elt._auto_name_counters = dict(self._auto_name_counters)
+        elt._placements = OrderedDict(self._placements)
+        elt._timing = None
+        elt._compiled = None
+        elt._dirty = {}
+        elt.clipped_samples = {}
+        elt._compiled_clipped = {}
+        return elt
+
     ### testing and inspection
     def print_overview(self):
         overview = {}
@@ -350,3 +800,70 @@ class Element:
 
 
 
+
+
+class ElementFamily:
+    """
+    A family of elements that only differ in one parameter of a single 
+    pulse, e.g., the length of the MW pulse in a Rabi sweep.
+
+    The variants are compiled one after the other from one working copy of
+    the template element: for every point only the swept pulse is replaced,
+    and only the samples it affects are recomputed (see 
+    Element.normalized_waveforms). Only one variant is kept in memory at a 
+    time.
+
+    The swept pulse is placed the way it was added to the template, and
+    pulses that were added with reference to it are placed again as well
+    (see Element.replace), such that parameters that change the timing 
+    (e.g., the length) give the same elements as building every point from
+    scratch.
+    
+    A family can be passed to Pulsar.upload just like an element; the 
+    variants are named <name>-<index> (see element_names()).
+    """
+
+    def __init__(self, template, pulse, parameter, values, name=None):
+        self.template = template
+        self.pulse = pulse
+        self.parameter = parameter
+        self.values = values
+        self.name = name if name != None else template.name
+
+    def __len__(self):
+        return len(self.values)
+
+    def element_name(self, i):
+        return '%s-%d' % (self.name, i)
+
+    def element_names(self):
+        return [self.element_name(i) for i in range(len(self))]
+
+    def __iter__(self):
+        return self.elements()
+
+    def elements(self):
+        """
+        Generator that yields each variant as element, ready to upload.
+        Note that this is always the same element object; it is only valid 
+        until the next variant has been generated.
+        """
+        elt = self.template.copy()
+        elt.incremental = True
+
+        template_pulse = self.template.pulses[self.pulse]
+        for i,v in enumerate(self.values):
+            kw = {self.parameter : v}
+            elt.replace(self.pulse, pulse_module.cp(template_pulse, **kw),
+                reposition=True)
+            elt.name = self.element_name(i)
+            yield elt
+
+    def waveforms(self):
+        """
+        Generator that yields (name, tvals, wfs) for each variant; the arrays
+        are read-only and only valid until the next variant is generated.
+        """
+        for elt in self.elements():
+            tvals, wfs = elt.normalized_waveforms()
+            yield elt.name, tvals, wfs
@@ -0,0 +1,214 @@
+# Numerically controlled oscillator for the carriers of sine and IQ pulses.
+#
+# The direct formula sin(2 pi (f t + phase/360)) multiplies the frequency by
+# the absolute time of every sample; late in a long element, f t is a large
+# number and its rounding shows up in the phase. Here every channel instead
+# has an oscillator whose phase advances by the increment f / clock turns
+# per sample from t = 0, such that sample n is at phase n f/clock (modulo
+# 1). The oscillator runs in blocks of block_samples: the phase at the
+# start of each block is computed exactly from its sample index (see
+# Oscillator.turns), and the samples of a block are that phase rotated by
+# a table of exp(2 pi i m f/clock), m = 0...block_samples-1, which is made
+# once per frequency and clock. The phase of a sample thus does not depend
+# on the pulse or chunk it is rendered in, it does not drift with time,
+# and no sin/cos is evaluated per sample. Short spans, for which the
+# per-block work does not pay off, evaluate sin/cos directly from the same
+# exact start phase.
+#
+# Time values that are not on the sample grid (channel delays or time
+# offsets that are not a multiple of the sample period) add the phase of
+# their offset from the grid.
+
+import math
+import numpy as np
+
+# generate carriers with the oscillator (False: use the direct formula)
+enabled = True
+
+# samples per block, i.e., length of the tables of the oscillators
+block_samples = 256
+
+# spans of at most this many samples are evaluated directly
+direct_samples = 512
+
+# number of oscillators (frequency and clock) that are kept
+cache_size = 256
+
+_oscillators = {}
+
+def _split(x):
+    """
+    Splits x into hi + lo, with at most 26 significant bits in hi (such
+    that the product of hi with an integer below 2**27 is exact).
+    """
+    c = 134217729. * x
+    hi = c - (c - x)
+    return hi, x - hi
+
+class Oscillator:
+    """
+    Oscillator at a frequency, advancing by frequency/clock turns per
+    sample.
+    """
+
+    def __init__(self, frequency, clock):
+        self.frequency = frequency
+        self.clock = clock
+        self.increment = float(frequency) / clock
+        self.block = block_samples
+        self._hi, self._lo = _split(self.increment)
+        self._table = None
+
+    def turns(self, n):
+        """
+        Returns the phase (in turns, from 0 to 1) at the sample index n (an
+        integer or an array of them). Exact up to rounding for indices
+        below 2**27.
+        """
+        if isinstance(n, np.ndarray):
+            turns = n * self._hi
+            turns -= np.floor(turns)
+            turns += n * self._lo
+            turns -= np.floor(turns)
+            return turns
+
+        turns = n * self._hi
+        turns = turns - math.floor(turns) + n * self._lo
+        return turns - math.floor(turns)
+
+    def table(self):
+        """
+        Returns the (cos, sin) tables of 2 pi m increment for one block.
+        """
+        if self._table is None:
+            arg = 2 * np.pi * self.increment * np.arange(self.block)
+            self._table = (np.cos(arg), np.sin(arg))
+            for t in self._table:
+                t.flags.writeable = False
+        return self._table
+
+    def quadratures(self, first, n, offset=0., cos=True, sin=True):
+        """
+        Returns cos and sin of 2 pi times the phase plus offset (in turns)
+        for the n samples from index first (None for the one that is not
+        asked for).
+        """
+        if n <= direct_samples:
+            arg = np.arange(n, dtype=float)
+            arg *= self.increment
+            arg += self.turns(first) + offset
+            arg *= 2 * np.pi
+            return (np.cos(arg) if cos else None), \
+                (np.sin(arg) if sin else None)
+
+        # phase at the start of each block, as a column
+        b = self.block
+        j0, m0 = divmod(first, b)
+        blocks = (m0 + n - 1) // b + 1
+        arg = self.turns(np.arange(j0 * b, (j0 + blocks) * b, b, 
+            dtype=float)[:,np.newaxis])
+        arg += offset
+        arg *= 2 * np.pi
+        zc, zs = np.cos(arg), np.sin(arg)
+        tc, ts = self.table()
+
+        wf_cos = wf_sin = None
+        if cos:
+            wf_cos = zc * tc
+            wf_cos -= zs * ts
+            wf_cos = wf_cos.ravel()[m0:m0+n]
+        if sin:
+            wf_sin = zs * tc
+            wf_sin += zc * ts
+            wf_sin = wf_sin.ravel()[m0:m0+n]
+        return wf_cos, wf_sin
+
+def oscillator(frequency, clock):
+    """
+    Returns the (cached) oscillator for frequency and clock.
+    """
+    key = (frequency, clock)
+    osc = _oscillators.get(key)
+    if osc == None or osc.block != block_samples:
+        if len(_oscillators) >= cache_size:
+            _oscillators.clear()
+        osc = Oscillator(frequency, clock)
+        _oscillators[key] = osc
+    return osc
+
+def direct(frequency, phase, tvals, cos=True, sin=True):
+    """
+    Returns cos and sin of 2 pi (frequency t + phase/360), evaluated for
+    every time value.
+    """
+    arg = 2 * np.pi * (frequency * tvals + phase/360.)
+    return (np.cos(arg) if cos else None), (np.sin(arg) if sin else None)
+
+def quadratures(frequency, phase, tvals, clock, cos=True, sin=True):
+    """
+    Returns cos and sin of 2 pi (frequency t + phase/360) at the time values
+    tvals (None for the one that is not asked for). tvals need to be spaced
+    by 1/clock, as the ones of a pulse in an element; if clock is None, the
+    direct formula is used.
+    """
+    n = len(tvals)
+    if not enabled or clock == None or n == 0:
+        return direct(frequency, phase, tvals, cos, sin)
+
+    # index of the first sample; if it is not on the grid, its offset
+    # from the grid adds to the phase
+    t0 = float(tvals[0])
+    first = int(round(t0 * clock))
+    offset = phase / 360.
+    if abs(t0 * clock - first) >= 1e-6:
+        offset += frequency * (t0 - first / float(clock))
+
+    return oscillator(frequency, clock).quadratures(first, n, offset,
+        cos, sin)
+
+def batch_quadratures(frequencies, phases, tvals, clocks, cos=True, sin=True):
+    """
+    Same as quadratures, for a matrix of time values with one row per
+    frequency, phase and clock. Rows that quadratures would evaluate
+    directly are evaluated together (with the same arithmetic, i.e., to
+    the same values); longer rows one by one.
+    """
+    nrows, n = tvals.shape
+    if not enabled or None in list(clocks) or n == 0 or \
+            n > direct_samples:
+        wf_cos = np.empty(tvals.shape) if cos else None
+        wf_sin = np.empty(tvals.shape) if sin else None
+        for i in range(nrows):
+            c, s = quadratures(frequencies[i], phases[i], tvals[i], 
+                clocks[i], cos=cos, sin=sin)
+            if cos:
+                wf_cos[i] = c
+            if sin:
+                wf_sin[i] = s
+        return wf_cos, wf_sin
+
+    frequencies = np.asarray(frequencies, dtype=float)
+    clocks = np.asarray(clocks, dtype=float)
+
+    # first sample index and offset of each row, see quadratures
+    t0 = tvals[:,0]
+    first = np.round(t0 * clocks)
+    offset = np.asarray(phases, dtype=float) / 360.
+    off_grid = np.abs(t0 * clocks - first) >= 1e-6
+    if off_grid.any():
+        offset = offset + np.where(off_grid, 
+            frequencies * (t0 - first / clocks), 0.)
+
+    # exact start phase of each row, see Oscillator.turns
+    increments = frequencies / clocks
+    hi, lo = _split(increments)
+    turns = first * hi
+    turns -= np.floor(turns)
+    turns += first * lo
+    turns -= np.floor(turns)
+    turns += offset
+
+    arg = np.arange(n, dtype=float) * increments[:,np.newaxis]
+    arg += turns[:,np.newaxis]
+    arg *= 2 * np.pi
+    return (np.cos(arg) if cos else None), (np.sin(arg) if sin else None)
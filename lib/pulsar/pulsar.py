@@ -5,9 +5,21 @@
 # TODO in principle that could be generalized for other
 # sequencing hardware i guess
 
+import os
 import time
+import array
+import hashlib
 import numpy as np
 import logging
+import cPickle
+import threading
+import multiprocessing
+from collections import deque, OrderedDict
+
+import scpi
+import awgfile
+import background
+import validation
 
 # some pulses use rounding when determining the correct sample at which to insert a particular
 # value. this might require correct rounding -- the pulses are typically specified on short time
@@ -16,6 +28,123 @@ import logging
 # the lifetime of this code (no 10ps AWG available yet :))
 SIGNIFICANT_DIGITS = 11
 
+# resolution of the AWG DACs, and the bits of the markers in the integer 
+# waveform format
+DAC_BITS = 14
+MARKER1_BIT = 14
+MARKER2_BIT = 15
+
+# largest loop count of a sequence element
+MAX_REPETITIONS = 65536
+
+# record of the real waveform format: float32 amplitude plus marker byte
+REAL_WAVEFORM_DTYPE = np.dtype([('amplitude', '<f4'), ('markers', 'u1')])
+
+def waveform_hash(w, m1, m2, clock):
+    """
+    Returns a hash of the content of an (analog, marker1, marker2) 
+    waveform triple sent with the given clock.
+    """
+    h = hashlib.md5(repr(clock))
+    for wf in w, m1, m2:
+        wf = np.ascontiguousarray(wf)
+        h.update(wf.dtype.str + repr(wf.shape))
+        h.update(wf.data)
+    return h.hexdigest()
+
+def pack_waveform(w, m1, m2, format='int', out=None):
+    """
+    Packs a normalized analog waveform (values within [-1,1]) and its two 
+    marker waveforms (0 or 1) into the native format of the AWG:
+    - 'int': uint16, DAC code in the lower 14 bits, markers in bits 14, 15;
+    - 'real': records of float32 amplitude and a marker byte 
+      (marker1 + 2*marker2).
+    If given, the result is written to the array out (e.g., a memory map).
+    """
+    if format == 'int':
+        fullscale = (2**DAC_BITS - 1) / 2.
+        data = np.empty(len(w), dtype=np.uint16) if out is None else out
+        np.rint(np.asarray(w, dtype=np.float64)*fullscale + fullscale, 
+            out=data, casting='unsafe')
+        data |= np.asarray(m1, dtype=np.uint16) << MARKER1_BIT
+        data |= np.asarray(m2, dtype=np.uint16) << MARKER2_BIT
+        return data
+
+    elif format == 'real':
+        data = np.empty(len(w), dtype=REAL_WAVEFORM_DTYPE) if out is None \
+            else out
+        data['amplitude'] = w
+        data['markers'] = m1
+        data['markers'] += np.asarray(m2, dtype=np.uint8) << 1
+        return data
+
+    else:
+        raise Exception('Unknown waveform format %s' % format)
+
+def locked(f):
+    """
+    Decorator for Pulsar methods that use the AWG or the registry of the 
+    waveforms on it: they hold the lock of the pulsar while they run, such
+    that background operations (see upload_async) and calls from other 
+    threads do not interleave.
+    """
+    def wrapper(self, *arg, **kw):
+        self._lock.acquire()
+        try:
+            return f(self, *arg, **kw)
+        finally:
+            self._lock.release()
+
+    wrapper.__name__ = f.__name__
+    wrapper.__doc__ = f.__doc__
+    return wrapper
+
+def batched(f):
+    """
+    Decorator for Pulsar methods that configure the AWG: the SCPI commands
+    of the method are collected and sent in a few transfers when it
+    returns (see scpi.CommandBatch). Nested calls join the batch of the
+    outer one; calls from other threads have their own (and wait for the
+    lock, see locked).
+    """
+    def wrapper(self, *arg, **kw):
+        if self._current_batch() != None or not self.batch_commands or \
+                scpi.connection(self.AWG) == None:
+            return f(self, *arg, **kw)
+
+        batch = scpi.CommandBatch(self.AWG)
+        self._local.batch = batch
+        try:
+            result = f(self, *arg, **kw)
+            batch.finish()
+        except:
+            # we do not know what the AWG is programmed with anymore
+            batch.discard()
+            self.clear_sequence_cache()
+            raise
+        finally:
+            self._local.batch = None
+        return result
+
+    wrapper.__name__ = f.__name__
+    wrapper.__doc__ = f.__doc__
+    return locked(wrapper)
+
+### element compilation (module level, such that worker processes can run it)
+def _compile_element(element, compact=False):
+    """
+    Returns (name, samples, waveforms, compile time) of the element.
+    """
+    _t0 = time.time()
+    if compact:
+        tvals, wfs = element.compact_waveforms()
+    else:
+        tvals, wfs = element.normalized_waveforms()
+    return element.name, element.samples(), wfs, time.time() - _t0
+
+def _compile_pickled(data, compact=False):
+    return _compile_element(cPickle.loads(data), compact)
+
 class Pulsar:
     """
     This is the object that communicates with the AWG.
@@ -25,6 +154,36 @@ class Pulsar:
     AWG_type = 'regular' # other option at this point is 'opt09'
     clock = 1e9
     event_jump_timing = 'SYNC' #async jumping: 'ASYN'
+
+    # upload analog waveforms as float32 and markers as uint8, instead of 
+    # float64 for everything
+    compact_waveforms = False
+
+    # number of processes that compile elements during upload (1 compiles
+    # in the calling process)
+    upload_processes = 1
+
+    # shortest waveform the AWG accepts, and the figures that are used to
+    # estimate the time for uploading and programming (see validate)
+    min_waveform_samples = 250
+    transfer_rate = 5e6 # bytes/s
+    command_time = 5e-3 # s per command or transfer
+
+    # send the configuration of channels and sequence in batches of SCPI
+    # commands, if the AWG driver gives access to its connection
+    batch_commands = True
+
+    # number of samples that the waveforms on the AWG may take in total;
+    # beyond that, the least recently used ones are deleted (None: no limit)
+    waveform_memory_budget = None
+
+    # file that keeps the registry of the waveforms on the AWG, such that
+    # it survives re-creating the pulsar (None: keep it in memory only). 
+    # Use one file per AWG; a registry that is loaded from the file is
+    # checked against the waveform list of the AWG before it is used (see
+    # verify_waveform_registry).
+    waveform_registry_path = None
+
     channel_ids = ['ch1', 'ch1_marker1', 'ch1_marker2',
         'ch2', 'ch2_marker1', 'ch2_marker2',
         'ch3', 'ch3_marker1', 'ch3_marker2',
@@ -32,6 +191,48 @@ class Pulsar:
 
     def __init__(self):
         self.channels = {}
+        self._fillers = {}
+
+        # serializes the use of the AWG and the waveform registry (see 
+        # locked), and keeps the command batch of the running configuration
+        # per thread (see batched)
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+        # registry of the waveforms on the AWG: every waveform name that
+        # was uploaded maps to the hash of its content, and every content
+        # hash to the name under which it is actually stored
+        self._wf_names = {}
+        self._wf_stored = {}
+
+        # stored name -> [samples, time of last use] of the waveforms on the 
+        # AWG, least recently used first
+        self._wf_resident = OrderedDict()
+        self._wf_resident_samples = 0
+        self._wf_unverified = False
+        self.load_waveform_registry()
+
+        # the sequence that was programmed last (see program_sequence)
+        self._sequence_table = None
+
+        # runs the background operations (see upload_async)
+        self._worker = None
+
+    def __getstate__(self):
+        # elements refer to their pulsar, and are pickled with it when they
+        # are sent to other processes; the AWG and private caches stay here
+        state = self.__dict__.copy()
+        for k in state.keys():
+            if k == 'AWG' or k[0] == '_':
+                del state[k]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fillers = {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._worker = None
 
     ### channel handling
     def define_channel(self, id, name, type, delay, offset,
@@ -104,18 +305,33 @@ class Pulsar:
 
         return chans
 
+    def _awg(self):
+        """
+        Returns the object that AWG settings go to: the running command
+        batch, or the AWG driver.
+        """
+        batch = self._current_batch()
+        if batch != None:
+            return batch
+        return self.AWG
+
+    def _current_batch(self):
+        return getattr(self._local, 'batch', None)
+
+    @batched
     def setup_channels(self, output=False, reset_unused=True):
+        awg = self._awg()
         for n in self.channel_ids:
-            getattr(self.AWG, 'set_%s_status' % n[:3])('off')
+            getattr(awg, 'set_%s_status' % n[:3])('off')
 
         if reset_unused:
             for n in self.channel_ids:
                 if 'marker' in n:
-                    getattr(self.AWG, 'set_%s_low' % n)(0)
-                    getattr(self.AWG, 'set_%s_high' % n)(1)
+                    getattr(awg, 'set_%s_low' % n)(0)
+                    getattr(awg, 'set_%s_high' % n)(1)
                 else:
-                    getattr(self.AWG, 'set_%s_amplitude' % n)(2.)
-                    getattr(self.AWG, 'set_%s_offset' % n)(0.)
+                    getattr(awg, 'set_%s_amplitude' % n)(2.)
+                    getattr(awg, 'set_%s_offset' % n)(0.)
 
         for c in self.channels:
             n = self.channels[c]['id']
@@ -124,17 +340,19 @@ class Pulsar:
             if self.channels[c]['type'] == 'analog':
                 a = self.channels[c]['high'] - self.channels[c]['low']
                 o = (self.channels[c]['high'] + self.channels[c]['low'])/2.
-                getattr(self.AWG, 'set_%s_amplitude' % n)(a)
-                getattr(self.AWG, 'set_%s_offset' % n)(o)
+                getattr(awg, 'set_%s_amplitude' % n)(a)
+                getattr(awg, 'set_%s_offset' % n)(o)
             elif self.channels[c]['type'] == 'marker':
-                getattr(self.AWG, 'set_%s_low' % n)(self.channels[c]['low'])
-                getattr(self.AWG, 'set_%s_high' % n)(self.channels[c]['high'])
+                getattr(awg, 'set_%s_low' % n)(self.channels[c]['low'])
+                getattr(awg, 'set_%s_high' % n)(self.channels[c]['high'])
 
             # turn on the used channels
             if output and self.channels[c]['active']:
-                getattr(self.AWG, 'set_%s_status' % n[:3])('on')
+                getattr(awg, 'set_%s_status' % n[:3])('on')
 
+    @batched
     def activate_channels(self, channels='all'):
+        awg = self._awg()
         ids = self.get_used_channel_ids()
 
         for id in ids:
@@ -151,54 +369,518 @@ class Pulsar:
                     output = True
 
             if output:
-                getattr(self.AWG, 'set_%s_status' % id)('on')
+                getattr(awg, 'set_%s_status' % id)('on')
 
 
     ### waveform/file handling
+    @locked
     def delete_all_waveforms(self):
         self.AWG.delete_all_waveforms_from_list()
+        self.clear_waveform_registry()
+        self.clear_sequence_cache()
+
+    ### waveform registry
+    @locked
+    def load_waveform_registry(self, path=None):
+        if path == None:
+            path = self.waveform_registry_path
+        if path == None or not os.path.exists(path):
+            return
+
+        try:
+            f = open(path, 'rb')
+            try:
+                registry = cPickle.load(f)
+            finally:
+                f.close()
+        except Exception as e:
+            logging.warning('Could not load waveform registry from %s: %s' \
+                % (path, e))
+            return
+
+        # registries of older versions do not know the waveform sizes
+        self._wf_names, self._wf_stored = registry[:2]
+        resident = registry[2] if len(registry) > 2 else []
+        self._wf_resident = OrderedDict(resident)
+        self._wf_resident_samples = sum([v[0] for k, v in resident])
+
+        # the AWG may have been reset, or used by someone else, since
+        self._wf_unverified = True
+
+    @locked
+    def save_waveform_registry(self, path=None):
+        if path == None:
+            path = self.waveform_registry_path
+        if path == None:
+            return
+
+        try:
+            f = open(path, 'wb')
+            try:
+                cPickle.dump((self._wf_names, self._wf_stored,
+                    self._wf_resident.items()), f, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+        except Exception as e:
+            logging.warning('Could not save waveform registry to %s: %s' \
+                % (path, e))
+
+    @locked
+    def clear_waveform_registry(self):
+        """
+        Forgets about all waveforms on the AWG, such that everything is sent
+        again. Needed if the waveforms were deleted or changed by other 
+        means than this pulsar.
+        """
+        self._wf_names = {}
+        self._wf_stored = {}
+        self._wf_resident = OrderedDict()
+        self._wf_resident_samples = 0
+        self.save_waveform_registry()
+
+    @locked
+    def verify_waveform_registry(self):
+        """
+        Checks the registry against the waveform list of the AWG, and
+        forgets the waveforms that are not there anymore (or have a 
+        different length), such that they are sent again. A registry that 
+        was loaded from a file is checked before it is used first; if the
+        waveform list cannot be read, it is discarded.
+        """
+        self._wf_unverified = False
+
+        conn = scpi.connection(self.AWG)
+        if conn == None:
+            if len(self._wf_stored) > 0:
+                logging.warning('Cannot read the waveform list of the ' \
+                    'AWG; the waveform registry is discarded.')
+            self.clear_waveform_registry()
+            return
+
+        on_awg = scpi.waveform_list(conn[1])
+        for h, name in self._wf_stored.items():
+            entry = self._wf_resident.get(name)
+            if name not in on_awg or \
+                    (entry != None and entry[0] != on_awg[name]):
+                del self._wf_stored[h]
+                self._forget_resident(name)
+        self.save_waveform_registry()
+
+    @locked
+    def awg_waveform_name(self, wfname):
+        """
+        Returns the name under which the content of waveform wfname is 
+        stored on the AWG (a different name, if it was identical to a 
+        waveform that was already there).
+        """
+        if self._wf_unverified:
+            self.verify_waveform_registry()
+
+        h = self._wf_names.get(wfname)
+        if h == None:
+            return wfname
+        if h not in self._wf_stored:
+            raise Exception("Waveform '%s' has been overwritten on (or " \
+                "deleted from) the AWG; upload its element again." % wfname)
+        return self._wf_stored[h]
+
+    @locked
+    def send_waveform(self, w, m1, m2, wfname, force=False, pinned=None):
+        """
+        Sends a waveform triple to the AWG under the name wfname, unless 
+        the same content is on the AWG already (under this or any other 
+        name). Returns True if the waveform was sent.
+        The names under which the content is stored are added to the set
+        pinned (if given), which protects them from being deleted to make
+        room for the waveforms that follow (see make_room).
+        """
+        if self._wf_unverified:
+            self.verify_waveform_registry()
+
+        h = waveform_hash(w, m1, m2, self.clock)
+        if not force and h in self._wf_stored:
+            self._wf_names[wfname] = h
+            self._touch_waveform(self._wf_stored[h])
+            if pinned != None:
+                pinned.add(self._wf_stored[h])
+            return False
+
+        # whatever was stored under this name before is gone; names that
+        # referred to it cannot be sequenced anymore
+        h_old = self._wf_names.get(wfname)
+        if h_old != None and self._wf_stored.get(h_old) == wfname:
+            del self._wf_stored[h_old]
+        self._forget_resident(wfname)
+
+        if pinned != None:
+            pinned.add(wfname)
+        self.make_room(len(w), pinned=pinned)
+
+        self.AWG.send_waveform(w, m1, m2, wfname, self.clock)
+        self.AWG.import_waveform_file(wfname, wfname, type='wfm')
+
+        self._wf_names[wfname] = h
+        self._wf_stored[h] = wfname
+        self._wf_resident[wfname] = [len(w), time.time()]
+        self._wf_resident_samples += len(w)
+        return True
+
+    ### memory budget
+    @locked
+    def resident_waveforms(self):
+        """
+        Returns a list of (name, samples, time of last use) of the waveforms
+        this pulsar has stored on the AWG, least recently used first.
+        """
+        return [(n, v[0], v[1]) for n, v in self._wf_resident.items()]
+
+    @locked
+    def resident_samples(self):
+        return self._wf_resident_samples
+
+    def _touch_waveform(self, name):
+        entry = self._wf_resident.pop(name, None)
+        if entry != None:
+            entry[1] = time.time()
+            self._wf_resident[name] = entry
+
+    def _forget_resident(self, name):
+        entry = self._wf_resident.pop(name, None)
+        if entry != None:
+            self._wf_resident_samples -= entry[0]
+
+    def _sequenced_waveforms(self):
+        names = set()
+        if self._sequence_table != None:
+            for row in self._sequence_table:
+                names.update(row['waveforms'].values())
+        return names
+
+    @locked
+    def make_room(self, samples, pinned=None):
+        """
+        Deletes the least recently used waveforms from the AWG until
+        another samples fit into the waveform_memory_budget. Waveforms in
+        the programmed sequence and the ones in pinned are kept.
+        """
+        budget = self.waveform_memory_budget
+        if budget == None or \
+                self._wf_resident_samples + samples <= budget:
+            return
+
+        protected = self._sequenced_waveforms()
+        if pinned != None:
+            protected |= pinned
+
+        for name in self._wf_resident.keys():
+            if self._wf_resident_samples + samples <= budget:
+                break
+            if name not in protected:
+                self.delete_waveform(name)
+
+        if self._wf_resident_samples + samples > budget:
+            logging.warning('Waveforms in use exceed the AWG memory ' \
+                'budget (%d samples).' % budget)
+
+    @locked
+    def delete_waveform(self, name):
+        """
+        Deletes a waveform that was stored by this pulsar from the AWG.
+        Names that refer to it cannot be sequenced anymore.
+        """
+        h = self._wf_names.get(name)
+        if h != None and self._wf_stored.get(h) == name:
+            del self._wf_stored[h]
+        self._forget_resident(name)
+
+        conn = scpi.connection(self.AWG)
+        if conn != None:
+            conn[0](scpi.command('delete_waveform', name))
+        else:
+            self.AWG.delete_waveform(name)
 
     # i don't know what this function does...
     # def clear_waveforms(self):
     #   self.AWG.clear_waveforms()
 
+    def _iter_elements(self, elements):
+        """
+        Element families (see element.ElementFamily) are expanded lazily,
+        such that only one of their variants exists at a time.
+        """
+        for e in elements:
+            if hasattr(e, 'elements'):
+                for elt in e.elements():
+                    yield elt
+            else:
+                yield e
+
     def upload(self, *elements, **kw):
+        """
+        Compiles and uploads the given elements (or element families).
+
+        With processes > 1, the elements are compiled in a pool of worker
+        processes, while the transfers to the AWG stay in the calling thread
+        (one at a time, in the order of the elements). At most max_in_flight
+        elements are compiled ahead of the transfers, which bounds the memory
+        taken by waveforms that wait to be sent.
+        """
         verbose = kw.pop('verbose', True)
-        channels = kw.pop('channels', 'all')
+        if kw.pop('validate', False):
+            self.validate(elements=elements).raise_errors()
 
         _t0 = time.time()
-        elt_cnt = len(elements)
+        elt_cnt = self._element_count(elements)
 
         if verbose:
-            "Generate/upload %d elements: " % elt_cnt
-
-        for i,e in enumerate(elements):
+            print "Generate/upload %d elements: " % elt_cnt
+
+        t_compile = 0.
+        t_transfer = 0.
+        wf_cnt = [0, 0]
+        for i, (name, samples, _tc, _tt, sent, total, nbytes) in \
+                enumerate(self._upload(elements, **kw)):
+            wf_cnt[0] += sent
+            wf_cnt[1] += total
+            t_compile += _tc
+            t_transfer += _tt
             if verbose:
-                print "%d / %d: %s (%d samples)... " % \
-                    (i+1,elt_cnt, e.name, e.samples())
-
-            self.upload_element(e, verbose=False, channels=channels)
+                print "%d / %d: %s (%d samples): compiled in %.2f s, " \
+                    "sent in %.2f s" % (i+1, elt_cnt, name, samples, 
+                        _tc, _tt)
 
         _t = time.time() - _t0
         if verbose:
-            print "Upload finished in %.2f seconds." % _t
+            print "Upload finished in %.2f seconds " \
+                "(compilation %.2f s, transfer %.2f s)." % \
+                (_t, t_compile, t_transfer)
+            print "%d of %d waveforms sent, the others are on the AWG " \
+                "already." % tuple(wf_cnt)
             print
 
+    def upload_async(self, *elements, **kw):
+        """
+        Like upload, but runs in the background and returns immediately
+        with a background.Task. The task counts the elements done and the
+        bytes sent, and can be cancelled between elements.
+        Background operations of a pulsar run one after the other, in the
+        order they were started; other calls that use the AWG wait while
+        one of them does (see locked). With main_loop=True, the callbacks of the
+        task are run from the gobject main loop.
+        """
+        kw.pop('verbose', None)
+        task = background.Task('upload', total=self._element_count(elements),
+            main_loop=kw.pop('main_loop', False))
+
+        def run(task):
+            steps = self._upload(elements, **kw)
+            try:
+                for name, samples, _tc, _tt, sent, total, nbytes in steps:
+                    task.advance(1, nbytes)
+                    if task.cancel_requested():
+                        break
+            finally:
+                steps.close()
+
+        self._background_worker().submit(task, run)
+        return task
+
+    def validate(self, sequence=None, elements=[], channels='all', 
+            loop=True):
+        """
+        Checks elements and sequence before uploading, from their timing
+        only (no waveforms are computed). Returns a
+        validation.ValidationReport with errors, warnings, the occupancy
+        of the channels, and the size and estimated duration of upload and
+        programming.
+        upload takes validate=True to raise on errors before starting.
+        """
+        return validation.validate(self, sequence, elements, 
+            channels=channels, loop=loop)
+
+    def _element_count(self, elements):
+        return sum([len(e) if hasattr(e, 'elements') else 1 \
+            for e in elements])
+
+    def _upload(self, elements, channels='all', processes=None, 
+            max_in_flight=None, force=False):
+        """
+        Generator that compiles and sends the elements. Yields name, number
+        of samples, compilation and transfer time, the number of waveforms
+        sent and of all waveforms, and the bytes sent for every element.
+        """
+        if processes == None:
+            processes = self.upload_processes
+        if max_in_flight == None:
+            max_in_flight = 2*processes
+
+        pool = None
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+
+        # the waveforms of this upload are not deleted to make room for
+        # each other
+        pinned = set()
+
+        try:
+            for name, samples, wfs, _tc in self._compile_elements(elements, 
+                    pool, max_in_flight):
+                _t1 = time.time()
+                sent, total, nbytes = self.send_element_waveforms(name, wfs, 
+                    samples, channels=channels, force=force, pinned=pinned)
+                yield name, samples, _tc, time.time() - _t1, sent, total, \
+                    nbytes
+
+            if pool != None:
+                pool.close()
+        finally:
+            if pool != None:
+                pool.terminate()
+                pool.join()
+            self.save_waveform_registry()
+
+    @locked
+    def _background_worker(self):
+        if self._worker == None:
+            self._worker = background.Worker('pulsar')
+        return self._worker
+
+    def _compile_elements(self, elements, pool=None, max_in_flight=1):
+        """
+        Generator that yields (name, samples, waveforms, compile time) for
+        all elements, in order. Without a pool the elements are compiled
+        one by one, when they are asked for.
+
+        With a pool, elements are pickled when they are submitted (later
+        changes to them have thus no effect), and up to max_in_flight of 
+        them are compiled ahead. Incremental elements, like the variants of
+        an element family, are compiled here: they are cheap to update, but
+        costly to send to a worker. Their waveforms belong to the element 
+        and change with the next variant, so everything up to them is 
+        handed out before the next element is generated.
+        """
+        jobs = deque()
+        for e in self._iter_elements(elements):
+            if pool == None or e.incremental:
+                jobs.append(_compile_element(e, self.compact_waveforms))
+                while len(jobs) > 0:
+                    yield self._compile_result(jobs.popleft())
+                continue
+
+            jobs.append(pool.apply_async(_compile_pickled,
+                (cPickle.dumps(e, cPickle.HIGHEST_PROTOCOL), 
+                    self.compact_waveforms)))
+            while len(jobs) >= max(max_in_flight, 1):
+                yield self._compile_result(jobs.popleft())
+
+        while len(jobs) > 0:
+            yield self._compile_result(jobs.popleft())
+
+    def _compile_result(self, job):
+        if isinstance(job, tuple):
+            return job
+        return job.get()
+
+    def element_waveforms(self, element):
+        """
+        Returns the normalized waveforms of the element, in the compact
+        representation if compact_waveforms is set.
+        """
+        if self.compact_waveforms:
+            return element.compact_waveforms()
+        return element.normalized_waveforms()
+
+    def get_awg_channel_waveforms(self, element, wfs, id):
+        """
+        Returns the (analog, marker1, marker2) waveforms of the AWG channel
+        id, taken from the element waveforms wfs; unused subchannels are 
+        filled with zeros (all fillers of a kind share the same array).
+        """
+        samples = len(wfs.values()[0]) if len(wfs) > 0 \
+            else element.samples()
+        return self._channel_waveforms(wfs, id, samples)
+
+    def _channel_waveforms(self, wfs, id, samples):
+        grp = self.get_channel_names_by_id(id)
+
+        chan_wfs = []
+        for sid in [id, id+'_marker1', id+'_marker2']:
+            if grp[sid] != None and grp[sid] in wfs:
+                chan_wfs.append(wfs[grp[sid]])
+            else:
+                chan_wfs.append(self._filler(samples,
+                    'analog' if sid == id else 'marker'))
+
+        return tuple(chan_wfs)
 
-    def upload_element(self, element, verbose=True, channels='all'):
+    def _filler(self, samples, type):
+        if self.compact_waveforms:
+            dtype = np.float32 if type == 'analog' else np.uint8
+        else:
+            dtype = np.float64
+
+        key = (samples, dtype)
+        if key not in self._fillers:
+            if len(self._fillers) > 16:
+                self._fillers.clear()
+            wf = np.zeros(samples, dtype=dtype)
+            wf.flags.writeable = False
+            self._fillers[key] = wf
+        return self._fillers[key]
+
+    def packed_waveforms(self, element, format='int', channels='all'):
+        """
+        Returns the waveforms of the element in the native representation
+        of the AWG, one array per AWG channel id (see pack_waveform).
+        """
+        tvals, wfs = element.compact_waveforms()
+        packed = {}
+        for id in self.get_used_channel_ids():
+            if channels != 'all' and id not in \
+                    [self.channels[c]['id'][:3] for c in channels]:
+                continue
+            w, m1, m2 = self.get_awg_channel_waveforms(element, wfs, id)
+            packed[id] = pack_waveform(w, m1, m2, format=format)
+
+        return packed
+
+    def upload_element(self, element, verbose=True, channels='all',
+            force=False):
         if verbose:
             print "Generate/upload '%s' (%d samples)... " \
                 % (element.name, element.samples()),
 
         _t0 = time.time()
 
-        tvals, wfs = element.normalized_waveforms()
+        tvals, wfs = self.element_waveforms(element)
+        self.send_element_waveforms(element.name, wfs, element.samples(),
+            channels=channels, force=force, pinned=set())
+        self.save_waveform_registry()
+
+        _t = time.time() - _t0
+
+        if verbose:
+            print "finished in %.2f seconds." % _t
+
+    @locked
+    def send_element_waveforms(self, name, wfs, samples, channels='all',
+            force=False, pinned=None):
+        """
+        Sends the (normalized) waveforms wfs of the element with the given
+        name to the AWG; waveforms that are on the AWG already are skipped
+        unless force is set (see send_waveform).
+        Returns the number of waveforms sent, the number of waveforms of 
+        the element, and the number of bytes sent.
+        """
         chan_ids = self.get_used_channel_ids()
+        sent = 0
+        total = 0
+        nbytes = 0
 
         # order the waveforms according to physical AWG channels and
         # make empty sequences where necessary
         for id in chan_ids:
-            wfname = element.name + '_%s' % id
+            wfname = name + '_%s' % id
 
             # determine if we actually want to upload this channel
             upload = False
@@ -211,91 +893,206 @@ class Pulsar:
                 if not upload:
                     continue
 
-            chan_wfs = {id : None, id+'_marker1' : None,
-                id+'_marker2' : None }
-            grp = self.get_channel_names_by_id(id)
-
-            for sid in grp:
-                if grp[sid] != None and grp[sid] in wfs:
-                    chan_wfs[sid] = wfs[grp[sid]]
-                else:
-                    chan_wfs[sid] = np.zeros(element.samples())
+            w, m1, m2 = self._channel_waveforms(wfs, id, samples)
 
             # upload to AWG
-            self.AWG.send_waveform(chan_wfs[id], chan_wfs[id+'_marker1'],
-                chan_wfs[id+'_marker2'], wfname, self.clock)
-            self.AWG.import_waveform_file(wfname, wfname, type='wfm')
+            if self.send_waveform(w, m1, m2, wfname, force=force,
+                    pinned=pinned):
+                sent += 1
+                nbytes += w.nbytes + m1.nbytes + m2.nbytes
+            total += 1
 
-        _t = time.time() - _t0
-
-        if verbose:
-            print "finished in %.2f seconds." % _t
+        return sent, total, nbytes
 
     ### sequence handling
-    def program_sequence(self, sequence, channels='all', loop=True,
-            start=False):
+    def sequence_table(self, sequence, chan_ids, loop=True, 
+            waveform_name=None):
+        """
+        Returns the rows that program_sequence writes to the AWG: a list 
+        of dictionaries with the waveform names (per channel index), loop
+        count, and goto/jump targets and trigger wait of every element.
+        waveform_name maps the waveform names of the elements to the ones
+        in the table (default: the names on the AWG).
+        """
+        if waveform_name == None:
+            waveform_name = self.awg_waveform_name
+
+        # the AWG waveform names of each waveform name of the sequence
+        wfnames = {}
+        def waveforms(wfname_id):
+            if wfname_id not in wfnames:
+                wfname = sequence.strings[wfname_id]
+                wfnames[wfname_id] = dict([(int(id[2]),
+                    waveform_name(wfname + '_%s' % id)) \
+                        for id in chan_ids])
+            return wfnames[wfname_id]
+
+        def target_index(id):
+            if id < 0:
+                return None
+            return sequence.element_index(sequence.strings[id])
+
+        table = []
+        for i in range(sequence.element_count()):
+            table.append({
+                'waveforms' : waveforms(sequence.wfname_ids[i]),
+                'repetitions' : sequence.repetitions[i],
+                'goto_target' : target_index(sequence.goto_ids[i]),
+                'jump_target' : target_index(sequence.jump_ids[i]),
+                'trigger_wait' : bool(sequence.trigger_wait[i]),
+                })
+
+        if loop and len(table) > 0:
+            table[-1]['goto_target'] = 1
+
+        return table
+
+    def sequence_channel_ids(self, channels='all'):
+        """
+        Returns the ids of the AWG channels that a sequence with the given
+        channels plays on.
+        """
+        if channels  == 'all':
+            return self.get_used_channel_ids()
+
+        chan_ids = []
+        for c in channels:
+            if self.channels[c]['id'][:3] not in chan_ids:
+                chan_ids.append(self.channels[c]['id'][:3])
+        return chan_ids
+
+    def _sequence_table_base(self, table, force=False):
+        """
+        Returns the table that the new sequence table needs to be compared
+        to, and whether the sequence on the AWG has to be cleared first
+        (if the number of elements or the channels changed, or if forced).
+        """
+        old_table = self._sequence_table
+        if force or old_table == None or len(old_table) != len(table) or \
+                (len(table) > 0 and sorted(old_table[0]['waveforms']) != \
+                    sorted(table[0]['waveforms'])):
+
+            # after clearing, there is no goto, jump or trigger wait; the
+            # loop counts are always written
+            cleared = {
+                'waveforms' : {},
+                'repetitions' : None,
+                'goto_target' : None,
+                'jump_target' : None,
+                'trigger_wait' : False,
+                }
+            return [cleared] * len(table), True
+
+        return old_table, False
+
+    def _program_sequence_row(self, idx, row, old, awg=None):
+        """
+        Writes the fields of row idx that differ from the row old.
+        """
+        if awg == None:
+            awg = self._awg()
+        for chanidx in sorted(row['waveforms']):
+            wf = row['waveforms'][chanidx]
+            if old['waveforms'].get(chanidx) != wf:
+                awg.set_sqel_waveform(wf, chanidx, idx)
+
+        if row['repetitions'] != old['repetitions']:
+            if row['repetitions'] == -1:
+                awg.set_sqel_loopcnt_to_inf(idx, True)
+            else:
+                # a finite loop count only needs to be switched back on
+                # after infinite repetitions (or clearing)
+                if old['repetitions'] in [None, -1]:
+                    awg.set_sqel_loopcnt_to_inf(idx, False)
+                awg.set_sqel_loopcnt(row['repetitions'], idx)
+
+        if row['goto_target'] != old['goto_target']:
+            if row['goto_target'] != None:
+                awg.set_sqel_goto_state(idx, '1')
+                awg.set_sqel_goto_target_index(idx, row['goto_target'])
+            else:
+                awg.set_sqel_goto_state(idx, '0')
 
+        if row['jump_target'] != old['jump_target']:
+            if row['jump_target'] != None:
+                awg.set_sqel_event_jump_type(idx, 'IND')
+                awg.set_sqel_event_jump_target_index(idx,
+                    row['jump_target'])
+            else:
+                awg.set_sqel_event_jump_type(idx, 'OFF')
+
+        if row['trigger_wait'] != old['trigger_wait']:
+            awg.set_sqel_trigger_wait(idx, 1 if row['trigger_wait'] \
+                else 0)
+
+    @locked
+    def clear_sequence_cache(self):
+        """
+        Forgets the sequence that was programmed last, such that the next
+        call of program_sequence programs everything again.
+        """
+        self._sequence_table = None
+
+    def program_sequence_async(self, sequence, main_loop=False, **kw):
+        """
+        Like program_sequence, but runs in the background and returns 
+        immediately with a background.Task (see upload_async).
+        """
+        kw['verbose'] = False
+        task = background.Task('program_sequence', total=1,
+            main_loop=main_loop)
+
+        def run(task):
+            self.program_sequence(sequence, **kw)
+            task.advance(1)
+
+        self._background_worker().submit(task, run)
+        return task
+
+    @batched
+    def program_sequence(self, sequence, channels='all', loop=True,
+            start=False, force=False, verbose=True):
+        """
+        Programs the sequence into the AWG. 
+
+        The table of the last programmed sequence is kept, and only the
+        rows and fields that changed are sent. If the number of elements or
+        the channels differ, or force is set, the sequence is cleared and
+        programmed completely.
+        """
         _t0 = time.time()
 
-        print "Programming '%s' (%d element(s))..." \
-            % (sequence.name, sequence.element_count()),
+        if verbose:
+            print "Programming '%s' (%d element(s))..." \
+                % (sequence.name, sequence.element_count()),
 
         # determine which channels are involved in the sequence
-        if channels  == 'all':
-            chan_ids = self.get_used_channel_ids()
-        else:
-            chan_ids = []
-            for c in channels:
-                if self.channels[c]['id'][:3] not in chan_ids:
-                    chan_ids.append(self.channels[c]['id'][:3])
-
-        # prepare the awg
-        self.AWG.stop()
-        self.AWG.set_runmode('SEQ')
-        self.AWG.set_event_jump_timing(self.event_jump_timing)
-        self.setup_channels()
-
-        # this clears all element properties so we're sure not to
-        # keep any jumping, goto, etc. properties
-        self.AWG.set_sq_length(0)
+        chan_ids = self.sequence_channel_ids(channels)
 
-        self.AWG.set_sq_length(sequence.element_count())
+        table = self.sequence_table(sequence, chan_ids, loop=loop)
+        old_table, clear = self._sequence_table_base(table, force=force)
+        self._sequence_table = None
+        awg = self._awg()
 
-        # set all the waveforms
-        for i,elt in enumerate(sequence.elements):
-            idx = i+1
-            for id in chan_ids:
-                chanidx = int(id[2])
-
-                wf = elt['wfname'] + '_%s' % id
-                self.AWG.set_sqel_waveform(wf, chanidx, idx)
-
-            if elt['repetitions'] == -1:
-                self.AWG.set_sqel_loopcnt_to_inf(idx, True)
-            else:
-                self.AWG.set_sqel_loopcnt_to_inf(idx, False)
-                self.AWG.set_sqel_loopcnt(elt['repetitions'], idx)
-
-            if elt['goto_target'] != None:
-                self.AWG.set_sqel_goto_state(idx, '1')
-                self.AWG.set_sqel_goto_target_index(idx,
-                    sequence.element_index(elt['goto_target']))
-            # else:
-            #    self.AWG.set_sqel_goto_state(idx, '0')
-
-            if elt['jump_target'] != None:
-                self.AWG.set_sqel_event_jump_type(idx, 'IND')
-                self.AWG.set_sqel_event_jump_target_index(idx,
-                    sequence.element_index(elt['jump_target']))
-            # else:
+        # the waveforms of the sequence count as used now
+        for row in table:
+            for wf in row['waveforms'].values():
+                self._touch_waveform(wf)
 
+        # prepare the awg
+        awg.stop()
+        awg.set_runmode('SEQ')
+        awg.set_event_jump_timing(self.event_jump_timing)
+        self.setup_channels()
 
-            if elt['trigger_wait']:
-                self.AWG.set_sqel_trigger_wait(idx, 1)
+        if clear:
+            # this clears all element properties so we're sure not to
+            # keep any jumping, goto, etc. properties
+            awg.set_sq_length(0)
+            awg.set_sq_length(sequence.element_count())
 
-        if loop:
-            self.AWG.set_sqel_goto_state(idx, '1')
-            self.AWG.set_sqel_goto_target_index(idx, 1)
+        for i, row in enumerate(table):
+            self._program_sequence_row(i+1, row, old_table[i])
 
         # turn on the channel output
         self.activate_channels(channels)
@@ -306,26 +1103,119 @@ class Pulsar:
 
         if self.AWG_type in ['opt09']:
             if sequence.djump_table != None:
-                self.AWG.set_event_jump_mode('DJUM')
-                print 'AWG set to dynamical jump'
+                awg.set_event_jump_mode('DJUM')
+                if verbose:
+                    print 'AWG set to dynamical jump'
 
                 for i in range(16):
-                    self.AWG.set_djump_def(i, 0)
+                    awg.set_djump_def(i, 0)
 
                 for i in sequence.djump_table.keys():
                     el_idx = sequence.element_index(sequence.djump_table[i])
-                    self.AWG.set_djump_def(i, el_idx)
+                    awg.set_djump_def(i, el_idx)
 
             else:
-                self.AWG.set_event_jump_mode('EJUM')
-                print 'AWG set to event jump'
+                awg.set_event_jump_mode('EJUM')
+                if verbose:
+                    print 'AWG set to event jump'
 
         if start:
-            self.AWG.start()
+            awg.start()
+
+        self._sequence_table = table
+        if self._current_batch() != None:
+            self._current_batch().flush()
 
         _t = time.time() - _t0
-        print " finished in %.2f seconds." % _t
-        print
+        if verbose:
+            print " finished in %.2f seconds." % _t
+            print
+
+    ### export to files
+    def export_sequence(self, sequence, elements, path, channels='all',
+            loop=True, chunk_samples=2**20):
+        """
+        Writes the waveforms of the elements (one file per element and AWG 
+        channel, named like the waveforms on the AWG) and the sequence 
+        (<sequence name>.seq) to the directory path, from where the AWG can
+        load them at once (see load_sequence_file). 
+        Waveforms are computed and written in blocks of chunk_samples.
+        Returns the name of the sequence file.
+        """
+        chan_ids = self.sequence_channel_ids(channels)
+
+        names = set()
+        for e in elements:
+            if hasattr(e, 'elements'):
+                names.update(e.element_names())
+            else:
+                names.add(e.name)
+        missing = set([sequence.wfname(i) \
+            for i in range(sequence.element_count())]) - names
+        if len(missing) > 0:
+            raise Exception('Waveforms of sequence %s not given: %s' % \
+                (sequence.name, ', '.join(sorted(missing))))
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        for e in self._iter_elements(elements):
+            samples = e.samples()
+            writers = {}
+            try:
+                for id in chan_ids:
+                    writers[id] = awgfile.WFMWriter(os.path.join(path,
+                        e.name + '_%s.wfm' % id), samples, self.clock)
+
+                i0 = 0
+                for tvals, wfs in e.iter_waveform_chunks(chunk_samples):
+                    for id in chan_ids:
+                        w, m1, m2 = self._channel_waveforms(wfs, id, 
+                            len(tvals))
+                        writers[id].write(i0, w, m1, m2)
+                    i0 += len(tvals)
+            finally:
+                for id in writers:
+                    writers[id].close()
+
+        djump_table = None
+        if sequence.djump_table != None:
+            djump_table = {}
+            for i in sequence.djump_table:
+                djump_table[i] = sequence.element_index(
+                    sequence.djump_table[i])
+
+        seqfile = os.path.join(path, sequence.name + '.seq')
+        awgfile.write_seq(seqfile, 
+            self.sequence_table(sequence, chan_ids, loop=loop,
+                waveform_name=lambda wfname: wfname + '.wfm'),
+            channels=4 if self.AWG_type == 'opt09' or \
+                max([int(id[2]) for id in chan_ids] + [0]) > 2 else 2,
+            jump_timing='SYNC' if self.event_jump_timing == 'SYNC' \
+                else 'ASYNC',
+            djump_table=djump_table)
+
+        return seqfile
+
+    @locked
+    def load_sequence_file(self, filename):
+        """
+        Lets the AWG load a sequence file written by export_sequence,
+        together with its waveforms. filename is the path of the file as
+        seen by the AWG.
+        """
+        conn = scpi.connection(self.AWG)
+        if conn == None:
+            raise Exception('The AWG driver gives no access to its ' \
+                'connection; cannot load sequence files.')
+        write, ask = conn
+
+        self.AWG.stop()
+        write('SOUR1:FUNC:USER "%s"' % filename)
+
+        # the waveforms and the sequence on the AWG are not known anymore
+        self.clear_waveform_registry()
+        self.clear_sequence_cache()
 
 class Sequence:
     """
@@ -336,15 +1226,81 @@ class Sequence:
     We keep this independent of element generation here.
     Elements are simply referred to by name, the task to ensure
     they are available lies with the Pulsar.
+
+    The properties are stored column-wise, in parallel arrays: waveform
+    names and goto/jump targets as ids into a table of strings (-1 for
+    no target), plus a dictionary from element names to positions.
+    Targets are names, and are resolved only when the sequence is
+    programmed (they may refer to elements that are added later).
     """
 
     def __init__(self, name):
         self.name = name
 
-        self.elements = []
+        self.names = []
+        self.wfname_ids = array.array('l')
+        self.repetitions = array.array('l')
+        self.goto_ids = array.array('l')
+        self.jump_ids = array.array('l')
+        self.trigger_wait = array.array('b')
+
+        # table of waveform and target names
+        self.strings = []
+        self._string_ids = {}
+
+        # element name -> position; rebuilt after inserts that are not
+        # at the end
+        self._index = {}
+        self._index_valid = True
 
         self.djump_table = None
 
+    @classmethod
+    def from_arrays(cls, name, names, wfnames, repetitions=None,
+            goto_targets=None, jump_targets=None, trigger_wait=None):
+        """
+        Creates a sequence from one list (or array) per property; 
+        repetitions default to 1, targets to None and trigger_wait to
+        False.
+        """
+        seq = cls(name)
+        n = len(names)
+        if len(set(names)) != n:
+            raise ValueError('Sequence names must be unique.')
+
+        seq.names = list(names)
+        seq.wfname_ids = array.array('l', [seq._string_id(wf) \
+            for wf in wfnames])
+        seq.repetitions = array.array('l', [1]*n if repetitions is None \
+            else [int(r) for r in repetitions])
+        seq.goto_ids = array.array('l', [-1]*n if goto_targets is None \
+            else [seq._string_id(t) for t in goto_targets])
+        seq.jump_ids = array.array('l', [-1]*n if jump_targets is None \
+            else [seq._string_id(t) for t in jump_targets])
+        seq.trigger_wait = array.array('b', [0]*n if trigger_wait is None \
+            else [bool(t) for t in trigger_wait])
+
+        for column in [seq.wfname_ids, seq.repetitions, seq.goto_ids,
+                seq.jump_ids, seq.trigger_wait]:
+            if len(column) != n:
+                raise ValueError('All arrays must have the same length.')
+
+        seq._index_valid = False
+        return seq
+
+    def _string_id(self, s):
+        if s == None:
+            return -1
+        if s not in self._string_ids:
+            self._string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return self._string_ids[s]
+
+    def _string(self, id):
+        if id < 0:
+            return None
+        return self.strings[id]
+
     def _make_element_spec(self, name, wfname, repetitions, goto_target,
             jump_target, trigger_wait):
 
@@ -361,28 +1317,131 @@ class Sequence:
     def insert_element(self, name, wfname, pos=None, repetitions=1,
             goto_target=None, jump_target=None, trigger_wait=False):
 
-        for elt in self.elements:
-            if elt['name'] == name:
-                print 'Sequence names must be unique. Not added.'
-                return False
-
-        elt = self._make_element_spec(name, wfname, repetitions, goto_target,
-            jump_target, trigger_wait)
+        if self._has_element(name):
+            print 'Sequence names must be unique. Not added.'
+            return False
 
         if pos == None:
-            pos = len(self.elements)
-        self.elements.insert(pos, elt)
+            pos = len(self.names)
+        if pos < len(self.names):
+            self._index_valid = False
+        elif self._index_valid:
+            self._index[name] = len(self.names)
+
+        self.names.insert(pos, name)
+        self.wfname_ids.insert(pos, self._string_id(wfname))
+        self.repetitions.insert(pos, repetitions)
+        self.goto_ids.insert(pos, self._string_id(goto_target))
+        self.jump_ids.insert(pos, self._string_id(jump_target))
+        self.trigger_wait.insert(pos, bool(trigger_wait))
         return True
 
     def append(self, name, wfname, **kw):
-        self.insert_element(name, wfname, pos=len(self.elements), **kw)
+        return self.insert_element(name, wfname, pos=len(self.names), **kw)
 
     def element_count(self):
-        return len(self.elements)
+        return len(self.names)
+
+    def element(self, i):
+        """
+        Returns the properties of the i-th element (counting from 0) as a
+        dictionary.
+        """
+        return self._make_element_spec(self.names[i],
+            self.strings[self.wfname_ids[i]], self.repetitions[i],
+            self._string(self.goto_ids[i]), self._string(self.jump_ids[i]),
+            bool(self.trigger_wait[i]))
+
+    @property
+    def elements(self):
+        """
+        The elements as a list of dictionaries (a copy; changes have no
+        effect on the sequence).
+        """
+        return [self.element(i) for i in range(len(self.names))]
+
+    def wfname(self, i):
+        return self.strings[self.wfname_ids[i]]
+
+    def goto_target(self, i):
+        return self._string(self.goto_ids[i])
+
+    def jump_target(self, i):
+        return self._string(self.jump_ids[i])
+
+    def _element_indices(self):
+        if not self._index_valid:
+            self._index = dict(zip(self.names, range(len(self.names))))
+            self._index_valid = True
+        return self._index
+
+    def _has_element(self, name):
+        return name in self._element_indices()
 
     def element_index(self, name, start_idx=1):
-        names = [self.elements[i]['name'] for i in range(len(self.elements))]
-        return names.index(name)+start_idx
+        indices = self._element_indices()
+        if name not in indices:
+            raise ValueError("No element '%s' in sequence '%s'." % \
+                (name, self.name))
+        return indices[name]+start_idx
+
+    def compact(self, max_repetitions=MAX_REPETITIONS):
+        """
+        Merges runs of consecutive elements that play the same waveform into
+        one element with the summed repetitions. Returns the number of
+        sequencer rows saved.
+
+        Elements are only merged if that does not change what the AWG
+        plays: all but the first element of a run must not be the target of
+        a goto, jump or dynamic jump (targets are names, and the names of
+        the remaining elements do not change), only the first may wait for
+        a trigger, only the last may have a goto target, all must have the
+        same jump target, and none may repeat infinitely.
+        """
+        targets = set([self._string(id) for id in self.goto_ids]) | \
+            set([self._string(id) for id in self.jump_ids])
+        if self.djump_table != None:
+            targets |= set(self.djump_table.values())
+
+        keep = []
+        repetitions = []
+        goto_ids = []
+
+        n = len(self.names)
+        i = 0
+        while i < n:
+            reps = self.repetitions[i]
+            j = i + 1
+            while j < n and reps != -1 and \
+                    self.wfname_ids[j] == self.wfname_ids[i] and \
+                    self.repetitions[j] != -1 and \
+                    reps + self.repetitions[j] <= max_repetitions and \
+                    self.names[j] not in targets and \
+                    not self.trigger_wait[j] and \
+                    self.jump_ids[j] == self.jump_ids[i] and \
+                    self.goto_ids[j-1] < 0:
+                reps += self.repetitions[j]
+                j += 1
+
+            keep.append(i)
+            repetitions.append(reps)
+            goto_ids.append(self.goto_ids[j-1])
+            i = j
+
+        saved = n - len(keep)
+        if saved == 0:
+            return 0
+
+        self.names = [self.names[i] for i in keep]
+        self.wfname_ids = array.array('l', [self.wfname_ids[i] for i in keep])
+        self.repetitions = array.array('l', repetitions)
+        self.goto_ids = array.array('l', goto_ids)
+        self.jump_ids = array.array('l', [self.jump_ids[i] for i in keep])
+        self.trigger_wait = array.array('b', 
+            [self.trigger_wait[i] for i in keep])
+        self._index_valid = False
+
+        return saved
 
     def set_djump(self, state):
         if state==True:
@@ -3,17 +3,78 @@
 #
 # author: Wolfgang Pfaff
 
+import types
+import inspect
 import numpy as np
 from copy import deepcopy
+import nco
 
 def cp(pulse, *arg, **kw):
     """
     create a copy of the pulse, configure it by given arguments (using the
         call method of the pulse class), and return the copy
     """
-    pulse_copy = deepcopy(pulse)
+    pulse_copy = clone(pulse)
     return pulse_copy(*arg, **kw)
 
+def clone(pulse):
+    """
+    returns a copy of the pulse; uses the clone method of the pulse if
+        there is one, and a deep copy otherwise.
+    """
+    if hasattr(pulse, 'clone'):
+        return pulse.clone()
+    return deepcopy(pulse)
+
+# types that can be shared between a pulse and its clones
+_IMMUTABLE_TYPES = (int, long, float, complex, bool, str, unicode, 
+    type(None), np.number, np.bool_)
+_IMMUTABLE_EXACT = set([int, long, float, complex, bool, str, unicode, 
+    type(None), np.float64, np.int64])
+
+def _clone_value(v):
+    """
+    Copies a pulse attribute for a clone. Immutable values are shared,
+    lists, dicts and tuples of them copied shallowly. numpy arrays are
+    copied, unless they are read-only: those are shared (make large arrays
+    that pulses keep read-only to avoid the copies). Everything else is
+    deep copied.
+    """
+    if isinstance(v, _IMMUTABLE_TYPES):
+        return v
+
+    if isinstance(v, np.ndarray):
+        if v.flags.writeable:
+            return v.copy()
+        return v
+
+    if isinstance(v, (list, tuple)):
+        for x in v:
+            if not isinstance(x, _IMMUTABLE_TYPES):
+                return deepcopy(v)
+        return list(v) if isinstance(v, list) else v
+
+    if isinstance(v, dict):
+        for x in v.itervalues():
+            if not isinstance(x, _IMMUTABLE_TYPES):
+                return deepcopy(v)
+        return dict(v)
+
+    return deepcopy(v)
+
+_slots = {}
+
+def _slot_names(cls):
+    if cls not in _slots:
+        names = []
+        for c in inspect.getmro(cls):
+            slots = c.__dict__.get('__slots__', [])
+            if isinstance(slots, str):
+                slots = [slots]
+            names += [n for n in slots if n not in ['__dict__', '__weakref__']]
+        _slots[cls] = names
+    return _slots[cls]
+
 
 class Pulse:
     """
@@ -34,6 +95,10 @@ class Pulse:
     See the examples for more information.
     """
 
+    # set to True if the value of chan_wf at a time value does not depend
+    # on the other time values; such pulses can be rendered piecewise
+    pointwise = False
+
     def __init__(self, name):
         self.length = None
         self.name = name
@@ -50,6 +115,33 @@ class Pulse:
     def __call__(self):
         return self
 
+    def clone(self):
+        """
+        Returns a copy of the pulse that is much cheaper than a deep copy:
+        parameters are shared as long as they are immutable, containers of
+        immutable values are copied shallowly, and numpy arrays are shared
+        read-only. Works for pulses with __slots__ as well.
+        """
+        cls = self.__class__
+        if isinstance(cls, types.ClassType):
+            new = types.InstanceType(cls)
+        else:
+            new = cls.__new__(cls)
+
+        d = getattr(self, '__dict__', None)
+        if d != None:
+            new_d = {}
+            for k, v in d.iteritems():
+                new_d[k] = v if type(v) in _IMMUTABLE_EXACT else \
+                    _clone_value(v)
+            new.__dict__ = new_d
+
+        for k in _slot_names(cls):
+            if hasattr(self, k):
+                setattr(new, k, _clone_value(getattr(self, k)))
+
+        return new
+
     def get_wfs(self, tvals):
         """
         The time values in tvals can always be given as one array of time
@@ -69,6 +161,26 @@ class Pulse:
 
         return wfs
 
+    def render(self, tvals):
+        """
+        Returns the waveforms of all channels, like get_wfs. Pulses whose
+        channels share work (e.g., the carrier phase of I and Q) override
+        this; the element then renders them with one call instead of one
+        chan_wf per channel (see synthesis.joint_class).
+        """
+        return self.get_wfs(tvals)
+
+    def batch_key(self):
+        """
+        Pulses of a class that implements the classmethod
+        batch_chan_wf(pulses, chan, tvals) can be rendered together by the
+        element, if they have the same channels, the same number of samples,
+        and the same batch key. tvals is then a 2d array that contains one 
+        row of time values for each pulse.
+        Returning None means the pulse is always rendered on its own.
+        """
+        return ()
+
     def t0(self):
         """
         returns start time of the pulse. This is typically
@@ -94,6 +206,8 @@ class Pulse:
 
 ### Some simple pulse definitions.
 class SquarePulse(Pulse):
+    pointwise = True
+
     def __init__(self, channel, name='square pulse', **kw):
         Pulse.__init__(self, name)
         
@@ -116,8 +230,15 @@ class SquarePulse(Pulse):
     def chan_wf(self, chan, tvals):
         return np.ones(len(tvals)) * self.amplitude
 
+    @classmethod
+    def batch_chan_wf(cls, pulses, chan, tvals):
+        amplitudes = np.array([p.amplitude for p in pulses])[:,np.newaxis]
+        return np.ones(tvals.shape) * amplitudes
+
 
 class SinePulse(Pulse):
+    pointwise = True
+
     def __init__(self, channel, name='sine pulse', **kw):
         Pulse.__init__(self, name)
         
@@ -138,6 +259,19 @@ class SinePulse(Pulse):
         return self
 
     def chan_wf(self, chan, tvals):
-        return self.amplitude * np.sin(2*np.pi * \
-                (self.frequency * tvals + self.phase/360.))
+        return self.amplitude * nco.quadratures(self.frequency, self.phase,
+            tvals, self._clock, cos=False)[1]
+
+    @classmethod
+    def batch_chan_wf(cls, pulses, chan, tvals):
+        amplitudes = np.array([p.amplitude for p in pulses])[:,np.newaxis]
+        frequencies = np.array([p.frequency for p in pulses])[:,np.newaxis]
+        phases = np.array([p.phase for p in pulses])[:,np.newaxis]
+
+        if nco.enabled:
+            return amplitudes * nco.batch_quadratures(frequencies[:,0],
+                phases[:,0], tvals, [p._clock for p in pulses], cos=False)[1]
+
+        return amplitudes * np.sin(2*np.pi * \
+                (frequencies * tvals + phases/360.))
 
@@ -2,6 +2,91 @@ import numpy as np
 import scipy.special as ssp
 import pulse
 import pulsar
+import shapes
+import nco
+
+### piecewise segments
+def sample_count(tvals, t, inclusive=True):
+    """
+    Returns the number of time values that are <= t (< t if not inclusive),
+    i.e., np.searchsorted(tvals, t, 'right' or 'left'). tvals are assumed
+    to be sorted; for equally spaced ones (as in an element), the index is
+    computed from the spacing, and only corrected for rounding.
+    """
+    n = len(tvals)
+    if n == 0:
+        return 0
+
+    if n > 1:
+        i = int(np.floor((t - tvals[0]) / (tvals[1] - tvals[0]))) + 1
+        i = min(max(i, 0), n)
+    else:
+        i = 0
+
+    if inclusive:
+        while i < n and tvals[i] <= t:
+            i += 1
+        while i > 0 and tvals[i-1] > t:
+            i -= 1
+    else:
+        while i < n and tvals[i] < t:
+            i += 1
+        while i > 0 and tvals[i-1] >= t:
+            i -= 1
+    return i
+
+def corpse_segments(tvals, start, lengths, delay):
+    """
+    Returns the segments (first sample, end sample, sign) of a composite
+    pulse whose parts with the given lengths follow each other from time
+    start on (relative to tvals[0]), separated by delay; the signs
+    alternate, starting with +1.
+    Every segment runs from the last sample before its start to the last
+    sample before its end.
+    """
+    t = tvals[0] + start
+    segments = []
+    sign = 1
+    for i, l in enumerate(lengths):
+        if i > 0:
+            t += delay
+        first = sample_count(tvals, t) - 1
+        t += l
+        segments.append((first, sample_count(tvals, t) - 1, sign))
+        sign = -sign
+    return segments
+
+### Reburp shape
+# Fourier series coefficients for Np = 256, taken from Geen and Freeman paper;
+# /6.114 to get normalise max amplitude to 1
+REBURP_COEFFICIENTS = np.array([0.49,-1.02,1.11,-1.57,0.83,-0.42,0.26,-0.16,
+    +0.10,-0.07,+0.04,-0.03,+0.01,-0.02,0,0.01]) / 6.114
+
+def reburp_envelope(tvals, length):
+    """
+    Returns the Reburp envelope (maximum 1) of a pulse with the given 
+    length at the time values tvals. The cosine series is summed with the
+    Clenshaw recurrence, which needs only one cosine per sample.
+    """
+    x = np.cos(2*np.pi/length * np.asarray(tvals))
+    b1 = np.zeros(x.shape)
+    b2 = np.zeros(x.shape)
+    for c in REBURP_COEFFICIENTS[:0:-1]:
+        b1, b2 = c + 2*x*b1 - b2, b1
+    return REBURP_COEFFICIENTS[0] + x*b1 - b2
+
+### tabulated envelope shapes (see shapes.py); each is a function of a
+# dimensionless variable that the pulses compute from their time values
+def _erf_edge(u):
+    # rising edge of RF_erf_envelope, u in units of the rise time
+    return ssp.erf(2.*(u - 1.))/2. + 0.5
+
+shapes.register('gaussian', lambda u: np.exp(-u**2/2.), -8.5, 8.5)
+shapes.register('hermite', lambda u: (1-0.956*u**2)*np.exp(-u**2), 
+    -6.5, 6.5)
+shapes.register('erf_edge', _erf_edge, -3., 4., constant=True)
+shapes.register('reburp', lambda u: reburp_envelope(u, 1.), 0., 1.,
+    periodic=True)
 
 ### Basic multichannel pulses
 class MW_IQmod_pulse(pulse.Pulse):
@@ -35,32 +120,139 @@ class MW_IQmod_pulse(pulse.Pulse):
 
         return self
 
+    def iq_segments(self, tvals):
+        """
+        Returns the segments (first sample, end sample, sign) in which the
+        I and Q channels play the modulated carrier.
+        """
+        idx0 = sample_count(tvals, tvals[0] + self.PM_risetime,
+            inclusive=False)
+        idx1 = sample_count(tvals, tvals[0] + self.length - \
+            self.PM_risetime) - 1
+        return [(idx0, idx1, 1)]
+
+    def iq_waveforms(self, tvals, I=True, Q=True):
+        """
+        Returns the I and Q waveforms (None for the one that is not asked
+        for). Both are computed from the same phase array, which spans the
+        segments only.
+        """
+        wf_I = np.zeros(len(tvals)) if I else None
+        wf_Q = np.zeros(len(tvals)) if Q else None
+
+        segments = [seg for seg in self.iq_segments(tvals) if seg[1] > seg[0]]
+        if len(segments) == 0:
+            return wf_I, wf_Q
+
+        lo = min([seg[0] for seg in segments])
+        hi = max([seg[1] for seg in segments])
+        t = tvals[lo:hi]
+
+        # in this case we start the wave with zero phase at the effective 
+        # start time (up to the specified phase)
+        if not self.phaselock:
+            t = t - tvals[sample_count(tvals, tvals[0] + self.PM_risetime,
+                inclusive=False)]
+
+        carrier_I, carrier_Q = nco.quadratures(self.frequency, self.phase, t,
+            self._clock, cos=I, sin=Q)
+        for first, end, sign in segments:
+            amplitude = sign * self.amplitude
+            if I:
+                wf_I[first:end] += amplitude * carrier_I[first-lo:end-lo]
+            if Q:
+                wf_Q[first:end] += amplitude * carrier_Q[first-lo:end-lo]
+
+        return wf_I, wf_Q
+
+    def envelope(self, tvals):
+        """
+        Returns the envelope that multiplies I and Q, or None for a 
+        constant one. Subclasses with shaped pulses override this.
+        """
+        return None
+
     def chan_wf(self, chan, tvals):
         if chan == self.PM_channel:
             return np.ones(len(tvals))
 
-        else:  
-            idx0 = np.where(tvals >= tvals[0] + self.PM_risetime)[0][0]
-            idx1 = np.where(tvals <= tvals[0] + self.length - self.PM_risetime)[0][-1]
+        if chan not in [self.I_channel, self.Q_channel]:
+            return np.zeros(len(tvals))
 
-            wf = np.zeros(len(tvals))
-            
-            # in this case we start the wave with zero phase at the effective start time
-            # (up to the specified phase)
-            if not self.phaselock:
-                tvals = tvals.copy() - tvals[idx0]
+        wf_I, wf_Q = self.iq_waveforms(tvals, I=(chan == self.I_channel),
+            Q=(chan == self.Q_channel))
+        wf = wf_I if chan == self.I_channel else wf_Q
+
+        env = self.envelope(tvals)
+        if env is not None:
+            wf = env * wf
+        return wf
 
-                print self.name, tvals[0]
+    def render(self, tvals):
+        # the phase of the carrier and the envelope are computed once for I
+        # and Q, unless they have different time values
+        if type(tvals) == dict:
+            if not np.array_equal(tvals[self.I_channel], 
+                    tvals[self.Q_channel]):
+                return pulse.Pulse.render(self, tvals)
+            iq_tvals = tvals[self.I_channel]
+            pm_tvals = tvals[self.PM_channel]
+        else:
+            iq_tvals = pm_tvals = tvals
+
+        wf_I, wf_Q = self.iq_waveforms(iq_tvals)
+        env = self.envelope(iq_tvals)
+        if env is not None:
+            wf_I = env * wf_I
+            wf_Q = env * wf_Q
+
+        return {
+            self.I_channel : wf_I,
+            self.Q_channel : wf_Q,
+            self.PM_channel : np.ones(len(pm_tvals)),
+            }
+
+    def batch_key(self):
+        # pulses that are not phase locked are rendered one by one
+        if not self.phaselock:
+            return None
+        return (self.length, self.PM_risetime)
+
+    @classmethod
+    def batch_chan_wf(cls, pulses, chan, tvals):
+        p0 = pulses[0]
+        if chan == p0.PM_channel:
+            return np.ones(tvals.shape)
+
+        # first and last sample of the IQ part in each row, same as in 
+        # chan_wf
+        nsamples = tvals.shape[1]
+        idx0 = np.argmax(tvals >= tvals[:,:1] + p0.PM_risetime, axis=1)
+        idx1 = nsamples - 1 - np.argmax((tvals <= tvals[:,:1] + \
+            p0.length - p0.PM_risetime)[:,::-1], axis=1)
+        sidx = np.arange(nsamples)
+        window = (sidx >= idx0[:,np.newaxis]) & (sidx < idx1[:,np.newaxis])
+
+        amplitudes = np.array([p.amplitude for p in pulses])[:,np.newaxis]
+        frequencies = np.array([p.frequency for p in pulses])[:,np.newaxis]
+        phases = np.array([p.phase for p in pulses])[:,np.newaxis]
+
+        if nco.enabled:
+            carrier_I, carrier_Q = nco.batch_quadratures(frequencies[:,0],
+                phases[:,0], tvals, [p._clock for p in pulses],
+                cos=(chan == p0.I_channel), sin=(chan == p0.Q_channel))
+        else:
+            carrier_I, carrier_Q = nco.direct(frequencies, phases, tvals,
+                chan == p0.I_channel, chan == p0.Q_channel)
 
-            if chan == self.I_channel:
-                wf[idx0:idx1] += self.amplitude * np.cos(2 * np.pi * \
-                    (self.frequency * tvals[idx0:idx1] + self.phase/360.))
+        wf = np.zeros(tvals.shape)
+        if chan == p0.I_channel:
+            wf += np.where(window, amplitudes * carrier_I, 0.)
 
-            if chan == self.Q_channel:
-                wf[idx0:idx1] += self.amplitude * np.sin(2 * np.pi * \
-                    (self.frequency * tvals[idx0:idx1] + self.phase/360.))
+        if chan == p0.Q_channel:
+            wf += np.where(window, amplitudes * carrier_Q, 0.)
 
-            return wf
+        return wf
 
 # class MW_IQmod_pulse
 
@@ -114,51 +306,14 @@ class IQ_CORPSE_pulse(MW_IQmod_pulse):
 
         return self
 
-    def chan_wf(self, chan, tvals):
-        if chan == self.PM_channel:
-            return np.ones(len(tvals))
-
-        else:
-            idx0 = np.where(tvals >= tvals[0] + self.PM_risetime)[0][0]
-            idx1 = np.where(tvals <= tvals[0] + self.length - self.PM_risetime)[0][-1] + 1
-
-            start_1 = np.where(tvals <= (tvals[0] + self.PM_risetime))[0][-1]
-            end_1 = np.where(tvals <= (tvals[0] + self.length_1 + self.PM_risetime))[0][-1]
-            start_2 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_1 + \
-                self.pulse_delay))[0][-1]
-            end_2 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_1 + \
-                self.pulse_delay + self.length_2))[0][-1]
-            start_3 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_1 + \
-                self.pulse_delay + self.length_2 + self.pulse_delay))[0][-1]
-            end_3 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_1 + \
-                self.pulse_delay + self.length_2 + self.pulse_delay + \
-                self.length_3))[0][-1]
-
-            wf = np.zeros(len(tvals))
-            
-            # in this case we start the wave with zero phase at the effective start time
-            # (up to the specified phase)
-            if not self.phaselock:
-                tvals = tvals.copy() - tvals[idx0]
-
-            if chan == self.I_channel:
-                wf[start_1:end_1] += self.amplitude * np.cos(2 * np.pi * \
-                    (self.frequency * tvals[start_1:end_1] + self.phase/360.))
-                wf[start_2:end_2] -= self.amplitude * np.cos(2 * np.pi * \
-                    (self.frequency * tvals[start_2:end_2] + self.phase/360.))
-                wf[start_3:end_3] += self.amplitude * np.cos(2 * np.pi * \
-                    (self.frequency * tvals[start_3:end_3] + self.phase/360.))
-
-            if chan == self.Q_channel:
-                wf[start_1:end_1] += self.amplitude * np.sin(2 * np.pi * \
-                    (self.frequency * tvals[start_1:end_1] + self.phase/360.))
-                wf[start_2:end_2] -= self.amplitude * np.sin(2 * np.pi * \
-                    (self.frequency * tvals[start_2:end_2] + self.phase/360.))
-                wf[start_3:end_3] += self.amplitude * np.sin(2 * np.pi * \
-                    (self.frequency * tvals[start_3:end_3] + self.phase/360.))
-
-            return wf
+    def iq_segments(self, tvals):
+        return corpse_segments(tvals, self.PM_risetime,
+            [self.length_1, self.length_2, self.length_3],
+            self.pulse_delay)
 
+    def batch_key(self):
+        # the batched rendering knows only a single segment
+        return None
 
 
 class IQ_CORPSE_pi_pulse(MW_IQmod_pulse):
@@ -192,50 +347,15 @@ class IQ_CORPSE_pi_pulse(MW_IQmod_pulse):
 
         return self
 
-    def chan_wf(self, chan, tvals):
-        if chan == self.PM_channel:
-            return np.ones(len(tvals))
+    def iq_segments(self, tvals):
+        return corpse_segments(tvals, self.PM_risetime,
+            [self.length_420, self.length_m300, self.length_60],
+            self.pulse_delay)
 
-        else:
-            idx0 = np.where(tvals >= tvals[0] + self.PM_risetime)[0][0]
-            idx1 = np.where(tvals <= tvals[0] + self.length - self.PM_risetime)[0][-1] + 1
-
-            start_420 = np.where(tvals <= (tvals[0] + self.PM_risetime))[0][-1]
-            end_420 = np.where(tvals <= (tvals[0] + self.length_420 + self.PM_risetime))[0][-1]
-            start_m300 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_420 + \
-                self.pulse_delay))[0][-1]
-            end_m300 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_420 + \
-                self.pulse_delay + self.length_m300))[0][-1]
-            start_60 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_420 + \
-                self.pulse_delay + self.length_m300 + self.pulse_delay))[0][-1]
-            end_60 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_420 + \
-                self.pulse_delay + self.length_m300 + self.pulse_delay + \
-                self.length_60))[0][-1]
+    def batch_key(self):
+        # the batched rendering knows only a single segment
+        return None
 
-            wf = np.zeros(len(tvals))
-            
-            # in this case we start the wave with zero phase at the effective start time
-            # (up to the specified phase)
-            if not self.phaselock:
-                tvals = tvals.copy() - tvals[idx0]
-
-            if chan == self.I_channel:
-                wf[start_420:end_420] += self.amplitude * np.cos(2 * np.pi * \
-                    (self.frequency * tvals[start_420:end_420] + self.phase/360.))
-                wf[start_m300:end_m300] -= self.amplitude * np.cos(2 * np.pi * \
-                    (self.frequency * tvals[start_m300:end_m300] + self.phase/360.))
-                wf[start_60:end_60] += self.amplitude * np.cos(2 * np.pi * \
-                    (self.frequency * tvals[start_60:end_60] + self.phase/360.))
-
-            if chan == self.Q_channel:
-                wf[start_420:end_420] += self.amplitude * np.sin(2 * np.pi * \
-                    (self.frequency * tvals[start_420:end_420] + self.phase/360.))
-                wf[start_m300:end_m300] -= self.amplitude * np.sin(2 * np.pi * \
-                    (self.frequency * tvals[start_m300:end_m300] + self.phase/360.))
-                wf[start_60:end_60] += self.amplitude * np.sin(2 * np.pi * \
-                    (self.frequency * tvals[start_60:end_60] + self.phase/360.))
-
-            return wf
 
 class IQ_CORPSE_pi2_pulse(MW_IQmod_pulse):
     # this is between the driving pulses (not PM)
@@ -267,56 +387,19 @@ class IQ_CORPSE_pi2_pulse(MW_IQmod_pulse):
 
         return self
 
-    def chan_wf(self, chan, tvals):
-        
-        if chan == self.PM_channel:
-            return np.ones(len(tvals))
-
-        else:
-            idx0 = np.where(tvals >= tvals[0] + self.PM_risetime)[0][0]
-            idx1 = np.where(tvals <= tvals[0] + self.length - self.PM_risetime)[0][-1] + 1
-
-            start_384p3 = np.where(tvals <= (tvals[0] + self.PM_risetime))[0][-1]
-            end_384p3 = np.where(tvals <= (tvals[0] + self.length_384p3 + self.PM_risetime))[0][-1]
-            start_m318p6 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_384p3 + \
-                self.pulse_delay))[0][-1]
-            end_m318p6 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_384p3 + \
-                self.pulse_delay + self.length_m318p6))[0][-1]
-            start_24p3 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_384p3 + \
-                self.pulse_delay + self.length_m318p6 + self.pulse_delay))[0][-1]
-            end_24p3 = np.where(tvals <= (tvals[0] + self.PM_risetime + self.length_384p3 + \
-                self.pulse_delay + self.length_m318p6 + self.pulse_delay + \
-                self.length_24p3))[0][-1]
-
-            wf = np.zeros(len(tvals))
-            
-            # in this case we start the wave with zero phase at the effective start time
-            # (up to the specified phase)
-            if not self.phaselock:
-                tvals = tvals.copy() - tvals[idx0]
-
-                print self.name, tvals[0]
-
-            if chan == self.I_channel:
-                wf[start_384p3:end_384p3] += self.amplitude * np.cos(2 * np.pi * \
-                    (self.frequency * tvals[start_384p3:end_384p3] + self.phase/360.))
-                wf[start_m318p6:end_m318p6] -= self.amplitude * np.cos(2 * np.pi * \
-                    (self.frequency * tvals[start_m318p6:end_m318p6] + self.phase/360.))
-                wf[start_24p3:end_24p3] += self.amplitude * np.cos(2 * np.pi * \
-                    (self.frequency * tvals[start_24p3:end_24p3] + self.phase/360.))
-
-            if chan == self.Q_channel:
-                wf[start_384p3:end_384p3] += self.amplitude * np.sin(2 * np.pi * \
-                    (self.frequency * tvals[start_384p3:end_384p3] + self.phase/360.))
-                wf[start_m318p6:end_m318p6] -= self.amplitude * np.sin(2 * np.pi * \
-                    (self.frequency * tvals[start_m318p6:end_m318p6] + self.phase/360.))
-                wf[start_24p3:end_24p3] += self.amplitude * np.sin(2 * np.pi * \
-                    (self.frequency * tvals[start_24p3:end_24p3] + self.phase/360.))
+    def iq_segments(self, tvals):
+        return corpse_segments(tvals, self.PM_risetime,
+            [self.length_384p3, self.length_m318p6, self.length_24p3],
+            self.pulse_delay)
 
-            return wf
+    def batch_key(self):
+        # the batched rendering knows only a single segment
+        return None
 
 
 class RF_erf_envelope(pulse.SinePulse):
+    envelope_shape = 'erf_edge'
+
     def __init__(self, *arg, **kw):
         pulse.SinePulse.__init__(self, *arg, **kw)
 
@@ -324,11 +407,11 @@ class RF_erf_envelope(pulse.SinePulse):
 
     def chan_wf(self, chan, tvals):
         wf = pulse.SinePulse.chan_wf(self, chan, tvals)
-        
-        # TODO make this nicer
+
+        # rising and falling edge
         rt = self.envelope_risetime
-        env = (ssp.erf(2./rt*(tvals-tvals[0]-rt))/2.+0.5) * \
-                (ssp.erf(-2./rt*(tvals-tvals[-1]+rt))/2. + 0.5)
+        edge = shapes.get(self.envelope_shape)
+        env = edge((tvals-tvals[0])/rt) * edge((tvals[-1]-tvals)/rt)
 
         return wf * env
 
@@ -430,6 +513,8 @@ class EOMAOMPulse(pulse.Pulse):
         return wf
                 
 class GaussianPulse_Envelope_IQ(MW_IQmod_pulse):
+    envelope_shape = 'gaussian'
+
     def __init__(self, *arg, **kw):
         self.env_amplitude = kw.pop('amplitude', 0.1)
         MW_IQmod_pulse.__init__(self, *arg, amplitude=1., **kw)
@@ -443,17 +528,17 @@ class GaussianPulse_Envelope_IQ(MW_IQmod_pulse):
         self.std = kw.pop('std',0.1667*self.length)
         return self
 
-    def chan_wf(self, chan, tvals):
-        if chan == self.PM_channel:
-            return MW_IQmod_pulse.chan_wf(self,chan,tvals)
-
-        else:  
-            env = self.env_amplitude*np.exp(-(((tvals-self.mu)**2)/(2*self.std**2)))
-            wf = MW_IQmod_pulse.chan_wf(self, chan, tvals)
+    def envelope(self, tvals):
+        return self.env_amplitude * \
+            shapes.get(self.envelope_shape)((tvals-self.mu)/self.std)
 
-            return env*wf
+    def batch_key(self):
+        # the batched rendering has no envelope
+        return None
 
 class HermitePulse_Envelope_IQ(MW_IQmod_pulse):
+    envelope_shape = 'hermite' # literature values
+
     def __init__(self, *arg, **kw):
         self.env_amplitude = kw.pop('amplitude', 0.1)
         MW_IQmod_pulse.__init__(self, *arg,amplitude=1., **kw)
@@ -467,18 +552,18 @@ class HermitePulse_Envelope_IQ(MW_IQmod_pulse):
         self.T_herm = kw.pop('T_herm',0.1667*self.length)
         return self
 
-    def chan_wf(self, chan, tvals):
-        if chan == self.PM_channel:
-            return MW_IQmod_pulse.chan_wf(self,chan,tvals)
+    def envelope(self, tvals):
+        return self.env_amplitude * \
+            shapes.get(self.envelope_shape)((tvals-self.mu)/self.T_herm)
 
-        else:  
-            env = self.env_amplitude*(1-0.956*((tvals-self.mu)/self.T_herm)**2)*np.exp(-((tvals-self.mu)/self.T_herm)**2) #literature values
-            wf = MW_IQmod_pulse.chan_wf(self, chan, tvals)
-
-            return env*wf
+    def batch_key(self):
+        # the batched rendering has no envelope
+        return None
 
 
 class ReburpPulse_Envelope_IQ(MW_IQmod_pulse):
+    envelope_shape = 'reburp'
+
     def __init__(self, *arg, **kw):
         self.env_amplitude = kw.pop('amplitude', 0.1)
         MW_IQmod_pulse.__init__(self, *arg,amplitude=1., **kw)
@@ -488,32 +573,19 @@ class ReburpPulse_Envelope_IQ(MW_IQmod_pulse):
         MW_IQmod_pulse.__call__(self, *arg,amplitude=1., **kw)
         return self
 
-    def chan_wf(self, chan, tvals):
-        if chan == self.PM_channel:
-            return MW_IQmod_pulse.chan_wf(self,chan,tvals)
-
-        else:  
-            F_coeff = [0.49,-1.02,1.11,-1.57,0.83,-0.42,0.26,-0.16,+0.10,-0.07,+0.04,-0.03,+0.01,-0.02,0,0.01] \
-        # Fourier series coefficients for Np = 256, taken from Geen and Freeman paper
-            F_coeff[:] = [x*self.env_amplitude/6.114 for x in F_coeff] # /6.114 to get normalise max amplitude to 1
-
-            Amp_Reburp_list=np.zeros((len(tvals),len(F_coeff)))
-            Amp_Reburp = np.zeros((len(tvals)))
-        
-            for j in range(len(tvals)):
-                for i,c in enumerate(F_coeff):  
-                    Amp_Reburp_list[j,i] = c*np.cos(i*((2*np.pi)/self.length)*tvals[j])
-
-                Amp_Reburp[j]= (sum(Amp_Reburp_list[j]))
-            
+    def envelope(self, tvals):
+        return self.env_amplitude * \
+            shapes.get(self.envelope_shape)(tvals/self.length)
 
-            wf = MW_IQmod_pulse.chan_wf(self, chan, tvals)
-
-            return Amp_Reburp*wf
+    def batch_key(self):
+        # the batched rendering has no envelope
+        return None
 
 class GaussianPulse(pulse.Pulse):
+    envelope_shape = 'gaussian'
+
     def __init__(self, channel, name='gaussian pulse', **kw):
-        Pulse.__init__(self, name)
+        pulse.Pulse.__init__(self, name)
         
         self.channel = channel # this is just for convenience, internally
         self.channels.append(channel) # this is the part the sequencer element wants to communicate with
@@ -538,11 +610,14 @@ class GaussianPulse(pulse.Pulse):
         return self
 
     def chan_wf(self, chan, tvals):
-        return self.amplitude*exp(-(((tvals-self.mu)**2)/(2*self.std**2)))
+        return self.amplitude * \
+            shapes.get(self.envelope_shape)((tvals-self.mu)/self.std)
 
 class HermitePulse(pulse.Pulse):
+    envelope_shape = 'hermite'
+
     def __init__(self, channel, name='hermite pulse', **kw):
-        Pulse.__init__(self, name)
+        pulse.Pulse.__init__(self, name)
         
         self.channel = channel # this is just for convenience, internally
         self.channels.append(channel) # this is the part the sequencer element wants to communicate with
@@ -567,11 +642,14 @@ class HermitePulse(pulse.Pulse):
         return self
 
     def chan_wf(self, chan, tvals):
-        return self.amplitude*(1-0.956*((tvals-self.mu)/self.T_herm)**2)*exp(-((tvals-self.mu)/self.T_herm)**2)
+        return self.amplitude * \
+            shapes.get(self.envelope_shape)((tvals-self.mu)/self.T_herm)
 
 class ReburpPulse(pulse.Pulse):
+    envelope_shape = 'reburp'
+
     def __init__(self, channel, name='reburp pulse', **kw):
-        Pulse.__init__(self, name)
+        pulse.Pulse.__init__(self, name)
         
         self.channel = channel # this is just for convenience, internally
         self.channels.append(channel) # this is the part the sequencer element wants to communicate with
@@ -581,28 +659,16 @@ class ReburpPulse(pulse.Pulse):
         self.phase = kw.pop('phase', 0.)
         
     def __call__(self, **kw):
-        self.frequency = kw.pop('frequency', 1e6)
-        self.amplitude = kw.pop('amplitude', 0.1) #max amplitude
-        self.length = kw.pop('length', 0.)
-        self.phase = kw.pop('phase', 0.)
+        self.frequency = kw.pop('frequency', self.frequency)
+        self.amplitude = kw.pop('amplitude', self.amplitude) #max amplitude
+        self.length = kw.pop('length', self.length)
+        self.phase = kw.pop('phase', self.phase)
 
         self.channels = []
         self.channels.append(self.channel)
     
         return self
 
-    def chan_wf(self, chan, tvals, pts = 256):
-        F_coeff = [0.49,-1.02,1.11,-1.57,0.83,-0.42,0.26,-0.16,+0.10,-0.07,+0.04,-0.03,+0.01,-0.02,0,0.01] \
-        # Fourier series coefficients for Np = 256, taken from Geen and Freeman paper
-        F_coeff[:] = [x*self.amplitude/6.114 for x in F_coeff] # /6.114 to get normalise max amplitude to 1
-
-        Amp_Reburp_list=np.zeros((pts,len(F_coeff)))
-        Amp_Reburp = np.zeros((pts))
-    
-        for j in range(tvals):
-            for i,c in enumerate(F_coeff):  
-                Amp_Reburp_list[j,i] = c*np.cos(i*((2*np.pi)/self.length)*tvals[j])
-
-            Amp_Reburp[j]= (sum(Amp_Reburp_list[j]))
-        
-        return Amp_Reburp
\ No newline at end of file
+    def chan_wf(self, chan, tvals):
+        return self.amplitude * \
+            shapes.get(self.envelope_shape)(tvals/self.length)
@@ -0,0 +1,277 @@
+# Batching of the SCPI commands that the pulsar sends to configure the AWG.
+#
+# The AWG driver has one method per setting, and every call is a separate
+# VISA transfer (some drivers also read the value back). CommandBatch stands
+# in for the driver: calls of the setters that are known here are turned
+# into SCPI commands and collected; they are sent as a few semicolon-joined
+# messages when the batch is flushed, and the error queue of the AWG is
+# read once at the end. Everything else (uploads, queries, ...) is passed
+# on to the driver, after the pending commands have been sent, such that
+# the order of all operations is kept.
+#
+# Since the driver does not see the batched settings, the values it keeps
+# for its parameters are updated once the commands have been sent (see
+# update_driver).
+#
+# The command strings follow the Tektronix AWG5014 programmer manual.
+
+import re
+import logging
+
+def _onoff(v):
+    if v in [True, 1, '1'] or str(v).upper() == 'ON':
+        return '1'
+    return '0'
+
+# driver method -> function of the call arguments that returns the command
+SEQUENCE_COMMANDS = {
+    'stop' : lambda: 'AWGC:STOP',
+    'start' : lambda: 'AWGC:RUN',
+    'set_runmode' : lambda mode: 'AWGC:RMOD %s' % mode,
+    'set_event_jump_timing' : lambda t: 'EVEN:JTIM %s' % t,
+    'set_event_jump_mode' : lambda mode: 'AWGC:EVEN:JMOD %s' % mode,
+    'set_djump_def' : lambda pattern, idx: \
+        'AWGC:EVEN:DJUM:DEF %d,%d' % (pattern, idx),
+    'set_sq_length' : lambda n: 'SEQ:LENG %d' % n,
+    'set_sqel_waveform' : lambda wf, ch, idx: \
+        'SEQ:ELEM%d:WAV%d "%s"' % (idx, ch, wf),
+    'set_sqel_loopcnt_to_inf' : lambda idx, state: \
+        'SEQ:ELEM%d:LOOP:INF %s' % (idx, _onoff(state)),
+    'set_sqel_loopcnt' : lambda n, idx: 'SEQ:ELEM%d:LOOP:COUN %d' % (idx, n),
+    'set_sqel_goto_state' : lambda idx, state: \
+        'SEQ:ELEM%d:GOTO:STAT %s' % (idx, _onoff(state)),
+    'set_sqel_goto_target_index' : lambda idx, target: \
+        'SEQ:ELEM%d:GOTO:IND %d' % (idx, target),
+    'set_sqel_event_jump_type' : lambda idx, type: \
+        'SEQ:ELEM%d:JTAR:TYPE %s' % (idx, type),
+    'set_sqel_event_jump_target_index' : lambda idx, target: \
+        'SEQ:ELEM%d:JTAR:IND %d' % (idx, target),
+    'set_sqel_trigger_wait' : lambda idx, state: \
+        'SEQ:ELEM%d:TWA %s' % (idx, _onoff(state)),
+    'delete_waveform' : lambda name: 'WLIS:WAV:DEL "%s"' % name,
+    }
+
+_CHANNEL_SETTER = re.compile(r'set_ch(\d)_(status|amplitude|offset)$')
+_MARKER_SETTER = re.compile(r'set_ch(\d)_marker(\d)_(low|high)$')
+
+def command(name, *args):
+    """
+    Returns the SCPI command that corresponds to the call of the driver
+    method name with the given arguments, or None if it is not known.
+    """
+    if name in SEQUENCE_COMMANDS:
+        return SEQUENCE_COMMANDS[name](*args)
+
+    m = _CHANNEL_SETTER.match(name)
+    if m != None:
+        ch, setting = m.groups()
+        if setting == 'status':
+            return 'OUTP%s:STAT %s' % (ch, _onoff(args[0]))
+        elif setting == 'amplitude':
+            return 'SOUR%s:VOLT:AMPL %.6f' % (ch, args[0])
+        else:
+            return 'SOUR%s:VOLT:OFFS %.6f' % (ch, args[0])
+
+    m = _MARKER_SETTER.match(name)
+    if m != None:
+        ch, marker, level = m.groups()
+        return 'SOUR%s:MARK%s:VOLT:%s %.3f' % (ch, marker, level.upper(),
+            args[0])
+
+    return None
+
+def connection(awg):
+    """
+    Returns the (write, ask) functions to talk to the AWG directly, or None
+    if the driver does not give access to them.
+    """
+    for obj in [getattr(awg, '_visainstrument', None), awg]:
+        if obj == None:
+            continue
+        write = getattr(obj, 'write', None)
+        ask = getattr(obj, 'ask', None)
+        if callable(write) and callable(ask):
+            return write, ask
+
+    return None
+
+def waveform_list(ask, batch=64):
+    """
+    Returns a dictionary of the waveforms in the waveform list of the AWG
+    (name -> length in samples), read through the query function ask of
+    the connection. The queries are sent in batches.
+    """
+    n = int(ask('WLIS:SIZE?'))
+
+    names = []
+    for i0 in range(0, n, batch):
+        query = ';:'.join(['WLIS:NAME? %d' % i \
+            for i in range(i0, min(n, i0 + batch))])
+        names += [r.strip().strip('"') for r in ask(query).split(';')]
+
+    lengths = []
+    for i0 in range(0, n, batch):
+        query = ';:'.join(['WLIS:WAV:LENG? "%s"' % name \
+            for name in names[i0:i0 + batch]])
+        lengths += [int(r) for r in ask(query).split(';')]
+
+    return dict(zip(names, lengths))
+
+def update_driver(awg, name, *args):
+    """
+    Tells a QTlab driver the value that the setter name has set by other
+    means than the driver (update_value), such that its cached value of
+    the parameter is right. Setters that do not belong to a parameter of
+    the driver are ignored.
+    """
+    update = getattr(awg, 'update_value', None)
+    if not name.startswith('set_') or len(args) != 1 or not callable(update):
+        return
+
+    param = name[4:]
+    names = getattr(awg, 'get_parameter_names', None)
+    names = names() if callable(names) else None
+    if names != None and param not in names:
+        return
+    update(param, args[0])
+
+class CommandBatch:
+    """
+    Stands in for the AWG driver and collects the SCPI commands of the known
+    setters (see command). Commands are sent in messages of at most
+    max_length characters when flush() is called, before any other driver
+    method is used, or when the pending commands exceed max_length.
+    finish() sends the rest and checks the error queue of the AWG.
+    """
+
+    def __init__(self, awg, max_length=4096):
+        self._awg = awg
+        self._write, self._ask = connection(awg)
+        self.max_length = max_length
+
+        self._pending = []
+        self._pending_length = 0
+
+        # setter calls of the pending commands, for the driver (see flush)
+        self._pending_calls = []
+
+        self.commands = 0
+        self.transfers = 0
+
+    def __getattr__(self, name):
+        if name[0] == '_':
+            raise AttributeError(name)
+
+        def call(*args):
+            cmd = command(name, *args)
+            if cmd == None:
+                self.flush()
+                return getattr(self._awg, name)(*args)
+            self.add(cmd, (name, args))
+
+        return call
+
+    def add(self, cmd, call=None):
+        """
+        Queues a SCPI command. call is the (setter name, arguments) of the
+        driver call it replaces, if any.
+        """
+        if self._pending_length + len(cmd) + 2 > self.max_length:
+            self.flush()
+        self._pending.append(cmd)
+        self._pending_length += len(cmd) + 2
+        if call != None:
+            self._pending_calls.append(call)
+        self.commands += 1
+
+    def flush(self):
+        """
+        Sends the pending commands. Every command starts at the root of the
+        command tree (';:' separates them).
+        """
+        if len(self._pending) == 0:
+            return
+
+        self._write(':' + ';:'.join(self._pending))
+        self.transfers += 1
+        for name, args in self._pending_calls:
+            update_driver(self._awg, name, *args)
+        self.discard()
+
+    def discard(self):
+        self._pending = []
+        self._pending_length = 0
+        self._pending_calls = []
+
+    def errors(self, max_errors=32):
+        """
+        Reads the error queue of the AWG. Returns a list of the error
+        messages.
+        """
+        errs = []
+        for i in range(max_errors):
+            err = self._ask('SYST:ERR?').strip()
+            if err == '' or err.split(',')[0].strip() in ['0', '+0']:
+                break
+            errs.append(err)
+        return errs
+
+    def finish(self):
+        """
+        Sends the pending commands, and raises an Exception if the AWG
+        reports errors.
+        """
+        self.flush()
+        errs = self.errors()
+        if len(errs) > 0:
+            raise Exception('AWG reported error(s) after %d commands: %s' % \
+                (self.commands, '; '.join(errs)))
+
+class RecordingAWG:
+    """
+    Stand-in for an AWG, for testing without hardware. Records the messages
+    written to it (see transfers), the calls of all other driver methods
+    (see calls), and the parameter values it was told about (updates). The
+    error queue is always empty.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.calls = []
+        self.updates = []
+
+    def __getattr__(self, name):
+        if name[0] == '_':
+            raise AttributeError(name)
+
+        def call(*args, **kw):
+            self.calls.append((name, args, kw))
+        return call
+
+    def get_parameter_names(self):
+        # any parameter
+        return None
+
+    def update_value(self, name, value):
+        self.updates.append((name, value))
+
+    def write(self, message):
+        self.messages.append(message)
+
+    def ask(self, query):
+        self.messages.append(query)
+        if query == 'SYST:ERR?':
+            return '0,"No error"'
+        return ''
+
+    def transfers(self):
+        return len(self.messages)
+
+    def commands(self):
+        """
+        Returns all commands that were written, in order.
+        """
+        cmds = []
+        for msg in self.messages:
+            cmds += [c.lstrip(':') for c in msg.split(';')]
+        return cmds
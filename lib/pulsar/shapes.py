@@ -0,0 +1,130 @@
+# Registry of pulse envelope shapes that are tabulated once and then looked
+# up by interpolation.
+#
+# A shape is a function of a dimensionless variable u (for instance,
+# (t - mu) / std for a Gaussian), such that a single table serves all pulses
+# of a kind, whatever their length or width. Pulse classes refer to their
+# shape by name (see the envelope_shape attribute of the pulses in pulselib)
+# and scale the time values to u themselves.
+#
+# Tables are computed on first use on a fine, equally spaced grid; values
+# in between are interpolated linearly, values outside the grid are
+# evaluated exactly (periodic shapes wrap around instead; shapes that are
+# constant beyond the grid, to double precision, take the values at its
+# ends, which is the same thing, only faster). The largest
+# interpolation error, measured halfway between the grid points, is kept
+# with each table; for the default grid it is of the order of 1e-8, far
+# below the resolution of the AWG (2**-14 of the amplitude range). Setting
+# tabulate to False evaluates all shapes exactly.
+
+import numpy as np
+
+# look shapes up in tables (False: evaluate the shape functions directly)
+tabulate = True
+
+class Shape:
+    """
+    Envelope shape f(u), tabulated on a number of equally spaced points
+    from lo to hi. If periodic, u is taken modulo hi - lo. If constant, f
+    is f(lo) below lo and f(hi) above hi (exactly, in floating point).
+    """
+
+    def __init__(self, name, f, lo, hi, points=2**16+1, periodic=False,
+            constant=False):
+        self.name = name
+        self.f = f
+        self.lo = float(lo)
+        self.hi = float(hi)
+        self.points = points
+        self.periodic = periodic
+        self.constant = constant
+
+        self.step = (self.hi - self.lo) / (points - 1)
+        self.max_error = None
+        self._values = None
+        self._slopes = None
+
+    def table(self):
+        """
+        Returns the tabulated values (computed on the first call).
+        """
+        if self._values is None:
+            grid = np.linspace(self.lo, self.hi, self.points)
+            values = np.asarray(self.f(grid), dtype=float)
+
+            mid = grid[:-1] + self.step/2.
+            self.max_error = np.abs(self.f(mid) - \
+                (values[:-1] + values[1:])/2.).max()
+
+            values.flags.writeable = False
+            self._values = values
+
+            # slope of the interval that starts at each point (the last
+            # point has none)
+            self._slopes = np.append(np.diff(values), 0.)
+        return self._values
+
+    def _wrap(self, u):
+        if self.periodic:
+            u = np.mod(u - self.lo, self.hi - self.lo) + self.lo
+        return u
+
+    def exact(self, u):
+        return np.asarray(self.f(self._wrap(np.asarray(u, dtype=float))),
+            dtype=float)
+
+    def __call__(self, u):
+        """
+        Returns the shape at u, from the table (if tabulate is set).
+        Values of u that fall on the grid points, as when the samples of a
+        pulse match the table, are taken from the table without
+        interpolation; values outside the table are evaluated exactly.
+        """
+        if not tabulate:
+            return self.exact(u)
+
+        u = self._wrap(np.asarray(u, dtype=float))
+        values = self.table()
+        if len(u) == 0:
+            return np.zeros(0)
+
+        outside = None
+        if not self.constant and (u.min() < self.lo or u.max() > self.hi):
+            outside = (u < self.lo) | (u > self.hi)
+
+        k = (u - self.lo) / self.step
+        np.clip(k, 0, self.points-1, out=k)
+        if abs(k[0] - round(k[0])) < 1e-6 and \
+                abs(k[-1] - round(k[-1])) < 1e-6 and \
+                np.abs(k - np.round(k)).max() < 1e-6:
+            wf = values[np.round(k).astype(int)]
+        else:
+            # the grid is equally spaced: the interval follows from k 
+            # directly
+            i = k.astype(np.intp)
+            k -= i
+            wf = self._slopes.take(i)
+            wf *= k
+            wf += values.take(i)
+
+        if outside is not None:
+            wf[outside] = self.f(u[outside])
+        return wf
+
+_shapes = {}
+
+def register(name, f, lo, hi, **kw):
+    """
+    Registers the shape f(u) under name, tabulated on [lo, hi] (see Shape
+    for the options). Returns the shape.
+    """
+    _shapes[name] = Shape(name, f, lo, hi, **kw)
+    return _shapes[name]
+
+def get(name):
+    if name not in _shapes:
+        raise Exception("Unknown pulse shape '%s'." % name)
+    return _shapes[name]
+
+def names():
+    return sorted(_shapes.keys())
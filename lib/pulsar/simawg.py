@@ -0,0 +1,487 @@
+# Simulated AWG, such that uploads and sequencing can be run, timed and
+# checked without the instrument (and without qtlab).
+#
+# SimulatedAWG has the methods of the AWG driver that the pulsar uses, and
+# (optionally) the write/ask connection that command batches go through; the
+# SCPI commands are parsed back into the same driver calls. It keeps the
+# waveform list, the channel settings and the sequence the way the AWG
+# would, and can play the sequence back into sample arrays.
+#
+# Every call costs time according to a simple model: a fixed latency per
+# call or transfer, plus the bytes transferred divided by the bandwidth.
+# The time is added up in elapsed, and only spent for real (slept) if
+# realtime is set.
+
+import re
+import time
+import numpy as np
+
+import pulsar
+
+_CHANNEL_SETTER = re.compile(r'set_(ch\d)_(status|amplitude|offset)$')
+_MARKER_SETTER = re.compile(r'set_(ch\d_marker\d)_(low|high)$')
+
+def _state(v):
+    return v in [True, 1, '1'] or str(v).upper() == 'ON'
+
+# SCPI command -> function(awg, *groups) that makes the driver call
+_SCPI_COMMANDS = [
+    (r'AWGC:STOP$', lambda awg: awg._apply('stop')),
+    (r'AWGC:RUN$', lambda awg: awg._apply('start')),
+    (r'AWGC:RMOD (\w+)$', lambda awg, m: awg._apply('set_runmode', m)),
+    (r'EVEN:JTIM (\w+)$', lambda awg, t: \
+        awg._apply('set_event_jump_timing', t)),
+    (r'AWGC:EVEN:JMOD (\w+)$', lambda awg, m: \
+        awg._apply('set_event_jump_mode', m)),
+    (r'AWGC:EVEN:DJUM:DEF (\d+),(\d+)$', lambda awg, p, i: \
+        awg._apply('set_djump_def', int(p), int(i))),
+    (r'SEQ:LENG (\d+)$', lambda awg, n: awg._apply('set_sq_length', int(n))),
+    (r'SEQ:ELEM(\d+):WAV(\d) "(.*)"$', lambda awg, i, ch, wf: \
+        awg._apply('set_sqel_waveform', wf, int(ch), int(i))),
+    (r'SEQ:ELEM(\d+):LOOP:INF (\d)$', lambda awg, i, s: \
+        awg._apply('set_sqel_loopcnt_to_inf', int(i), s)),
+    (r'SEQ:ELEM(\d+):LOOP:COUN (\d+)$', lambda awg, i, n: \
+        awg._apply('set_sqel_loopcnt', int(n), int(i))),
+    (r'SEQ:ELEM(\d+):GOTO:STAT (\d)$', lambda awg, i, s: \
+        awg._apply('set_sqel_goto_state', int(i), s)),
+    (r'SEQ:ELEM(\d+):GOTO:IND (\d+)$', lambda awg, i, t: \
+        awg._apply('set_sqel_goto_target_index', int(i), int(t))),
+    (r'SEQ:ELEM(\d+):JTAR:TYPE (\w+)$', lambda awg, i, t: \
+        awg._apply('set_sqel_event_jump_type', int(i), t)),
+    (r'SEQ:ELEM(\d+):JTAR:IND (\d+)$', lambda awg, i, t: \
+        awg._apply('set_sqel_event_jump_target_index', int(i), int(t))),
+    (r'SEQ:ELEM(\d+):TWA (\d)$', lambda awg, i, s: \
+        awg._apply('set_sqel_trigger_wait', int(i), s)),
+    (r'WLIS:WAV:DEL "(.*)"$', lambda awg, name: \
+        awg._apply('delete_waveform', name)),
+    (r'OUTP(\d):STAT (\d)$', lambda awg, ch, s: \
+        awg._apply('set_ch%s_status' % ch, s)),
+    (r'SOUR(\d):VOLT:AMPL (\S+)$', lambda awg, ch, v: \
+        awg._apply('set_ch%s_amplitude' % ch, float(v))),
+    (r'SOUR(\d):VOLT:OFFS (\S+)$', lambda awg, ch, v: \
+        awg._apply('set_ch%s_offset' % ch, float(v))),
+    (r'SOUR(\d):MARK(\d):VOLT:(LOW|HIGH) (\S+)$', lambda awg, ch, m, l, v: \
+        awg._apply('set_ch%s_marker%s_%s' % (ch, m, l.lower()), float(v))),
+    ]
+_SCPI_COMMANDS = [(re.compile(p), f) for p, f in _SCPI_COMMANDS]
+
+class SimulatedAWG:
+    """
+    Stand-in for the AWG driver that behaves (and takes time) like the
+    instrument. latency is the time of every call or transfer, bandwidth
+    the transfer rate in bytes/s. With scpi=False, the connection is not
+    available, such that the pulsar calls the driver methods one by one.
+
+    calls is the list of (method, args) of all driver calls, messages the
+    list of SCPI messages and queries; elapsed is the modelled time.
+    Invalid settings (unknown waveforms, elements out of range, unknown
+    commands) put an error into the error queue, like the AWG does.
+
+    Like a QTlab driver, it remembers the value of every channel and marker
+    parameter that was set through it (parameters, read by the get_...
+    methods); settings sent as SCPI commands only reach it through
+    update_value.
+    """
+
+    def __init__(self, latency=5e-3, bandwidth=5e6, realtime=False,
+            scpi=True, channels=4):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.realtime = realtime
+        self.channels = channels
+
+        if scpi:
+            self.write = self._write
+            self.ask = self._ask
+
+        self.files = {}
+        self.waveforms = {}
+        self.settings = {}
+        self.parameters = {}
+        self.sequence = []
+        self.djump_table = {}
+        self.runmode = 'CONT'
+        self.event_jump_mode = 'EJUM'
+        self.event_jump_timing = 'SYNC'
+        self.running = False
+        self.error_queue = []
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.calls = []
+        self.messages = []
+        self.elapsed = 0.
+        self.transfers = 0
+        self.bytes_sent = 0
+
+    def _spend(self, nbytes=0):
+        t = self.latency + float(nbytes) / self.bandwidth
+        self.transfers += 1
+        self.bytes_sent += nbytes
+        self.elapsed += t
+        if self.realtime:
+            time.sleep(t)
+
+    def _error(self, msg):
+        self.error_queue.append(msg)
+
+    def _apply(self, name, *args):
+        """
+        Makes a driver call without recording it or spending time (for
+        the commands that came in through SCPI).
+        """
+        getattr(self, '_' + name)(*args)
+
+    def _call(self, name, *args):
+        self.calls.append((name, args))
+        self._spend()
+        self._apply(name, *args)
+
+    def __getattr__(self, name):
+        if name[0] == '_':
+            m = _CHANNEL_SETTER.match(name[1:]) or \
+                _MARKER_SETTER.match(name[1:])
+            if m == None:
+                raise AttributeError(name)
+
+            def setting(value):
+                if m.group(2) == 'status':
+                    value = _state(value)
+                self.settings['%s_%s' % m.groups()] = value
+            return setting
+
+        if _CHANNEL_SETTER.match(name) or _MARKER_SETTER.match(name):
+            def setter(value):
+                self._call(name, value)
+                self.parameters[name[4:]] = value
+            return setter
+
+        if name.startswith('get_') and \
+                name[4:] in self.get_parameter_names():
+            return lambda: self.parameters.get(name[4:])
+        raise AttributeError(name)
+
+    def get_parameter_names(self):
+        names = []
+        for ch in range(1, self.channels + 1):
+            names += ['ch%d_%s' % (ch, p) \
+                for p in ['status', 'amplitude', 'offset']]
+            names += ['ch%d_marker%d_%s' % (ch, m, l) \
+                for m in [1, 2] for l in ['low', 'high']]
+        return names
+
+    def update_value(self, name, value):
+        """
+        Sets the remembered value of a parameter that was changed by other
+        means than the driver.
+        """
+        self.parameters[name] = value
+
+    ### connection
+    def _write(self, message):
+        self.messages.append(message)
+        self._spend(len(message))
+        for cmd in message.split(';'):
+            cmd = cmd.strip().lstrip(':')
+            for pattern, f in _SCPI_COMMANDS:
+                m = pattern.match(cmd)
+                if m != None:
+                    f(self, *m.groups())
+                    break
+            else:
+                self._error('-113,"Undefined header; %s"' % cmd)
+
+    def _ask(self, query):
+        self.messages.append(query)
+        self._spend(len(query))
+        return ';'.join([self._answer(q.strip().lstrip(':')) \
+            for q in query.split(';')])
+
+    def _answer(self, query):
+        if query == 'SYST:ERR?':
+            if len(self.error_queue) > 0:
+                return self.error_queue.pop(0)
+            return '0,"No error"'
+
+        # the waveform list, in alphabetical order
+        names = sorted(self.waveforms.keys())
+        if query == 'WLIS:SIZE?':
+            return str(len(names))
+        m = re.match(r'WLIS:NAME\? (\d+)$', query)
+        if m != None:
+            if int(m.group(1)) >= len(names):
+                self._error('-222,"Data out of range; %s"' % query)
+                return ''
+            return '"%s"' % names[int(m.group(1))]
+        m = re.match(r'WLIS:WAV:LENG\? "(.*)"$', query)
+        if m != None:
+            if m.group(1) not in self.waveforms:
+                self._error('-224,"Illegal parameter value; %s"' % query)
+                return ''
+            return str(len(self.waveforms[m.group(1)][0]))
+
+        self._error('-113,"Undefined header; %s"' % query)
+        return ''
+
+    def errors(self):
+        """
+        Returns and clears the error queue.
+        """
+        errs = self.error_queue
+        self.error_queue = []
+        return errs
+
+    ### waveforms
+    def send_waveform(self, w, m1, m2, filename, clock):
+        self.calls.append(('send_waveform', (filename, len(w), clock)))
+        self._spend(len(w) * pulsar.REAL_WAVEFORM_DTYPE.itemsize)
+        self.files[filename] = (np.array(w, dtype=float),
+            np.array(m1, dtype=np.uint8), np.array(m2, dtype=np.uint8))
+
+    def import_waveform_file(self, waveform_listname, waveform_filename,
+            type='wfm'):
+        self.calls.append(('import_waveform_file', (waveform_listname,
+            waveform_filename, type)))
+        self._spend()
+        if waveform_filename not in self.files:
+            self._error('-256,"File name not found; %s"' % \
+                waveform_filename)
+            return
+        self.waveforms[waveform_listname] = self.files[waveform_filename]
+
+    def delete_waveform(self, name):
+        self._call('delete_waveform', name)
+
+    def _delete_waveform(self, name):
+        if name not in self.waveforms:
+            self._error('-224,"Illegal parameter value; %s"' % name)
+            return
+        del self.waveforms[name]
+
+    def delete_all_waveforms_from_list(self):
+        self._call('delete_all_waveforms_from_list')
+
+    def _delete_all_waveforms_from_list(self):
+        self.waveforms = {}
+
+    def waveform_samples(self):
+        """
+        Returns the number of samples of all waveforms in the list.
+        """
+        return sum([len(v[0]) for v in self.waveforms.values()])
+
+    ### run state
+    def stop(self):
+        self._call('stop')
+
+    def _stop(self):
+        self.running = False
+
+    def start(self):
+        self._call('start')
+
+    def _start(self):
+        self.running = True
+
+    def set_runmode(self, mode):
+        self._call('set_runmode', mode)
+
+    def _set_runmode(self, mode):
+        self.runmode = mode
+
+    def set_event_jump_timing(self, timing):
+        self._call('set_event_jump_timing', timing)
+
+    def _set_event_jump_timing(self, timing):
+        self.event_jump_timing = timing
+
+    def set_event_jump_mode(self, mode):
+        self._call('set_event_jump_mode', mode)
+
+    def _set_event_jump_mode(self, mode):
+        self.event_jump_mode = mode
+
+    def set_djump_def(self, pattern, idx):
+        self._call('set_djump_def', pattern, idx)
+
+    def _set_djump_def(self, pattern, idx):
+        self.djump_table[pattern] = idx
+
+    ### sequence
+    def _new_element(self):
+        return {
+            'waveforms' : {},
+            'loop_count' : 1,
+            'infinite' : False,
+            'goto_state' : False,
+            'goto_index' : 1,
+            'jump_type' : 'OFF',
+            'jump_index' : 1,
+            'trigger_wait' : False,
+            }
+
+    def _element(self, idx):
+        if idx < 1 or idx > len(self.sequence):
+            self._error('-222,"Data out of range; element %d"' % idx)
+            return self._new_element()
+        return self.sequence[idx-1]
+
+    def set_sq_length(self, n):
+        self._call('set_sq_length', n)
+
+    def _set_sq_length(self, n):
+        if n == 0:
+            self.sequence = []
+        else:
+            self.sequence = self.sequence[:n] + [self._new_element() \
+                for i in range(n - len(self.sequence))]
+
+    def set_sqel_waveform(self, wf, ch, idx):
+        self._call('set_sqel_waveform', wf, ch, idx)
+
+    def _set_sqel_waveform(self, wf, ch, idx):
+        if wf not in self.waveforms or ch < 1 or ch > self.channels:
+            self._error('-222,"Data out of range; %s"' % wf)
+            return
+        self._element(idx)['waveforms'][ch] = wf
+
+    def set_sqel_loopcnt_to_inf(self, idx, state):
+        self._call('set_sqel_loopcnt_to_inf', idx, state)
+
+    def _set_sqel_loopcnt_to_inf(self, idx, state):
+        self._element(idx)['infinite'] = _state(state)
+
+    def set_sqel_loopcnt(self, n, idx):
+        self._call('set_sqel_loopcnt', n, idx)
+
+    def _set_sqel_loopcnt(self, n, idx):
+        if n < 1 or n > pulsar.MAX_REPETITIONS:
+            self._error('-222,"Data out of range; loop count %d"' % n)
+            return
+        self._element(idx)['loop_count'] = n
+
+    def set_sqel_goto_state(self, idx, state):
+        self._call('set_sqel_goto_state', idx, state)
+
+    def _set_sqel_goto_state(self, idx, state):
+        self._element(idx)['goto_state'] = _state(state)
+
+    def set_sqel_goto_target_index(self, idx, target):
+        self._call('set_sqel_goto_target_index', idx, target)
+
+    def _set_sqel_goto_target_index(self, idx, target):
+        self._element(idx)['goto_index'] = target
+
+    def set_sqel_event_jump_type(self, idx, type):
+        self._call('set_sqel_event_jump_type', idx, type)
+
+    def _set_sqel_event_jump_type(self, idx, type):
+        self._element(idx)['jump_type'] = type
+
+    def set_sqel_event_jump_target_index(self, idx, target):
+        self._call('set_sqel_event_jump_target_index', idx, target)
+
+    def _set_sqel_event_jump_target_index(self, idx, target):
+        self._element(idx)['jump_index'] = target
+
+    def set_sqel_trigger_wait(self, idx, state):
+        self._call('set_sqel_trigger_wait', idx, state)
+
+    def _set_sqel_trigger_wait(self, idx, state):
+        self._element(idx)['trigger_wait'] = _state(state)
+
+    def sequence_table(self):
+        """
+        Returns the programmed sequence in the form of the rows of
+        Pulsar.sequence_table.
+        """
+        table = []
+        for el in self.sequence:
+            table.append({
+                'waveforms' : dict(el['waveforms']),
+                'repetitions' : -1 if el['infinite'] else el['loop_count'],
+                'goto_target' : el['goto_index'] if el['goto_state'] \
+                    else None,
+                'jump_target' : el['jump_index'] \
+                    if el['jump_type'] == 'IND' else None,
+                'trigger_wait' : el['trigger_wait'],
+                })
+        return table
+
+    ### playback
+    def sequence_path(self, max_elements=1000, events=[]):
+        """
+        Returns the list of (element index, repetitions) that the sequence
+        plays, starting at the first element. events are the positions in
+        this list at which an event arrives (the element jumps, if it has a
+        jump target). Trigger waits are ignored. The path ends after the
+        last element (unless it has a goto), at an infinitely repeated
+        element without event, or after max_elements.
+        """
+        if self.runmode != 'SEQ':
+            raise Exception('The AWG is not in sequence mode.')
+
+        path = []
+        idx = 1
+        while 1 <= idx <= len(self.sequence) and len(path) < max_elements:
+            el = self.sequence[idx-1]
+            event = len(path) in events
+            path.append((idx, 1 if el['infinite'] else el['loop_count']))
+
+            if event and el['jump_type'] == 'IND':
+                idx = el['jump_index']
+            elif el['infinite'] and not event:
+                break
+            elif el['goto_state']:
+                idx = el['goto_index']
+            else:
+                idx += 1
+
+        return path
+
+    def play(self, max_elements=1000, events=[]):
+        """
+        Returns {channel index: (w, m1, m2)}, the samples that the
+        sequence plays on the channels that it uses (see sequence_path).
+        Channels without waveform in an element play zeros.
+        """
+        parts = {}
+        played = 0
+        for idx, reps in self.sequence_path(max_elements, events):
+            wfs = self.sequence[idx-1]['waveforms']
+            if len(wfs) == 0:
+                raise Exception('Element %d has no waveforms.' % idx)
+
+            lengths = set()
+            for ch in wfs:
+                if wfs[ch] not in self.waveforms:
+                    raise Exception("Element %d: waveform '%s' is not in " \
+                        "the waveform list." % (idx, wfs[ch]))
+                lengths.add(len(self.waveforms[wfs[ch]][0]))
+            if len(lengths) > 1:
+                raise Exception('Element %d: the waveforms have different ' \
+                    'lengths.' % idx)
+            samples = lengths.pop()
+
+            # channels that start playing later played zeros so far
+            for ch in wfs:
+                if ch not in parts:
+                    parts[ch] = [(np.zeros(played),
+                        np.zeros(played, dtype=np.uint8),
+                        np.zeros(played, dtype=np.uint8))]
+            for ch in parts:
+                if ch in wfs:
+                    w, m1, m2 = self.waveforms[wfs[ch]]
+                else:
+                    w = np.zeros(samples)
+                    m1 = m2 = np.zeros(samples, dtype=np.uint8)
+                parts[ch].append((np.tile(w, reps), np.tile(m1, reps),
+                    np.tile(m2, reps)))
+            played += samples * reps
+
+        samples = {}
+        for ch in parts:
+            samples[ch] = tuple([np.concatenate([p[i] for p in parts[ch]]) \
+                for i in range(3)])
+        return samples
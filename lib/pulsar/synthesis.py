@@ -0,0 +1,368 @@
+# This module implements the synthesis of the numeric waveforms of an
+# element. Instead of rendering pulse by pulse, pulses are grouped:
+# - pulses of a class that implements batch_chan_wf are evaluated together
+#   on a matrix of time values (one row per pulse), if they agree in class,
+#   channels, number of samples and batch key;
+# - other pulses with identical parameters and sample count are rendered
+#   only once (in element time this does not apply, since the time values
+#   differ from pulse to pulse);
+# - everything else is rendered on its own, like before; pulses that
+#   implement render (all channels at once) are rendered through it.
+# The results are accumulated into the channel arrays by indexed adds.
+
+import inspect
+import numpy as np
+import pulsar
+
+# attributes that do not influence the waveform of a pulse
+SIGNATURE_EXCLUDE = ['name', '_t0']
+
+_batch_classes = {}
+_pointwise_classes = {}
+_joint_classes = {}
+
+def _defining_class(cls, attr):
+    for c in inspect.getmro(cls):
+        if attr in c.__dict__:
+            return c
+    return None
+
+def batchable_class(cls):
+    """
+    Returns True if the pulse class provides a batch_chan_wf that renders
+    the same waveform as its chan_wf, i.e., the batch implementation is not
+    shadowed by a chan_wf that was overridden in a subclass.
+    """
+    if cls not in _batch_classes:
+        batch_cls = _defining_class(cls, 'batch_chan_wf')
+        wf_cls = _defining_class(cls, 'chan_wf')
+        _batch_classes[cls] = batch_cls != None and wf_cls != None and \
+            issubclass(batch_cls, wf_cls)
+
+    return _batch_classes[cls]
+
+def joint_class(cls):
+    """
+    Returns True if the pulse class renders all its channels at once (see
+    Pulse.render), and that implementation is not shadowed by a chan_wf
+    that was overridden in a subclass.
+    """
+    if cls not in _joint_classes:
+        render_cls = _defining_class(cls, 'render')
+        wf_cls = _defining_class(cls, 'chan_wf')
+        _joint_classes[cls] = render_cls != None and wf_cls != None and \
+            issubclass(render_cls, wf_cls)
+
+    return _joint_classes[cls]
+
+def pointwise_class(cls):
+    """
+    Returns True if the waveform of the pulse class at a given time does
+    not depend on the other time values passed to chan_wf, such that the
+    pulse can be rendered in pieces. The pointwise flag is only trusted if
+    chan_wf has not been overridden below the class that set it.
+    """
+    if cls not in _pointwise_classes:
+        flag_cls = _defining_class(cls, 'pointwise')
+        wf_cls = _defining_class(cls, 'chan_wf')
+        _pointwise_classes[cls] = flag_cls != None and wf_cls != None and \
+            issubclass(flag_cls, wf_cls) and cls.pointwise
+
+    return _pointwise_classes[cls]
+
+def pulse_signature(pulse, exclude=SIGNATURE_EXCLUDE, public_only=False):
+    """
+    Returns a hashable representation of the class and the parameters of
+    a pulse, or None if one of the parameters cannot be hashed.
+    """
+    items = []
+    for k, v in sorted(vars(pulse).items()):
+        if k in exclude or (public_only and k[0] == '_'):
+            continue
+        if isinstance(v, list):
+            v = tuple(v)
+        items.append((k, v))
+
+    sig = (pulse.__class__, tuple(items))
+    try:
+        hash(sig)
+    except TypeError:
+        return None
+
+    return sig
+
+def group_pulses(element):
+    """
+    Sorts the pulses of an element into groups that can be rendered
+    together. Returns a list of (kind, names) tuples, where kind is one of
+    'batch', 'same' or 'single'.
+    """
+    groups = {}
+    order = []
+    samples = element._timing_table()['samples']
+
+    for p in element.pulses:
+        pulse = element.pulses[p]
+        psamples = samples[p]
+
+        key = None
+        if batchable_class(pulse.__class__):
+            bkey = pulse.batch_key()
+            if bkey != None:
+                key = ('batch', pulse.__class__, bkey,
+                    tuple(pulse.channels), psamples)
+
+        if key == None and not element.global_time:
+            sig = pulse_signature(pulse)
+            if sig != None:
+                key = ('same', sig, psamples)
+
+        if key == None:
+            key = ('single', p)
+
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append(p)
+
+    return [(k[0], groups[k]) for k in order]
+
+def accumulate(wf, starts, block):
+    """
+    Adds the rows of block (or a single waveform, if block is 1d) to wf,
+    starting at the given sample indices.
+    """
+    n = len(starts)
+    nsamples = block.shape[-1]
+
+    if n == 1:
+        s = starts[0]
+        wf[s:s+nsamples] += block[0] if block.ndim == 2 else block
+        return
+
+    starts = np.asarray(starts)
+    idx = starts[:,np.newaxis] + np.arange(nsamples)
+
+    # without overlaps every sample is hit at most once and the buffered
+    # fancy-index add is safe (and a lot faster than add.at)
+    if np.all(np.diff(np.sort(starts)) >= nsamples):
+        wf[idx] += block
+    else:
+        np.add.at(wf, idx, block)
+
+def _global_tvals(element, tvals, p, c, psamples):
+    idx0 = element.pulse_start_sample(p, c)
+    if tvals is None:
+        ptvals = np.arange(idx0, idx0+psamples) / element.clock
+    else:
+        ptvals = tvals[idx0:idx0+psamples]
+    return np.round(ptvals + element.channel_delay(c) + \
+        element.time_offset, pulsar.SIGNIFICANT_DIGITS)
+
+def _cache_key(cache, element, p, psamples):
+    if cache == None:
+        return None
+
+    tstart = None
+    if element.global_time:
+        pulse = element.pulses[p]
+        tstart = (element.time_offset, tuple([(c, 
+            element.pulse_start_sample(p, c), element.channel_delay(c)) \
+                for c in pulse.channels]))
+
+    return cache.key(element.pulses[p], psamples, element.clock, tstart)
+
+def render(element, tvals, wfs, cache=None):
+    """
+    Computes the ideal waveforms of all pulses of the element and adds them
+    to the channel arrays in wfs (in place).
+    If a waveform cache is given, pulses that are rendered through their
+    chan_wf are looked up there first, and stored after rendering. Batched
+    pulses are cheaper to render than to look up, and bypass the cache.
+    """
+    table = element._timing_table()
+    starts = table['start_samples']
+
+    for kind, names in group_pulses(element):
+        pulse = element.pulses[names[0]]
+        psamples = table['samples'][names[0]]
+
+        if kind == 'batch':
+            pulses = [element.pulses[p] for p in names]
+            if not element.global_time:
+                ptvals = np.tile(tvals[:psamples], (len(names), 1))
+
+            for c in pulse.channels:
+                cstarts = [starts[p][c] for p in names]
+                if element.global_time:
+                    idx = np.asarray(cstarts)[:,np.newaxis] + \
+                        np.arange(psamples)
+                    ptvals = np.round(tvals[idx] + element.channel_delay(c) + \
+                        element.time_offset, pulsar.SIGNIFICANT_DIGITS)
+
+                block = pulse.batch_chan_wf(pulses, c, ptvals)
+                accumulate(wfs[c], cstarts, block)
+
+        elif kind == 'same':
+            pulsewfs = render_pulse(element, tvals, names[0], cache=cache)
+            for c in pulse.channels:
+                accumulate(wfs[c], [starts[p][c] for p in names],
+                    pulsewfs[c])
+
+        else:
+            p = names[0]
+            pulsewfs = render_pulse(element, tvals, p, cache=cache)
+            for c in pulse.channels:
+                accumulate(wfs[c], [starts[p][c]], pulsewfs[c])
+
+def render_pulse(element, tvals, p, cache=None):
+    """
+    Renders the single pulse p of the element. Returns a dictionary with
+    the waveform of each channel of the pulse. tvals are the time values of
+    the element; if None, only the ones needed are computed.
+    """
+    pulse = element.pulses[p]
+    psamples = element._timing_table()['samples'][p]
+
+    key = _cache_key(cache, element, p, psamples)
+    pulsewfs = cache.get(key) if cache != None else None
+    if pulsewfs != None:
+        return pulsewfs
+
+    get_wfs = pulse.render if joint_class(pulse.__class__) \
+        else pulse.get_wfs
+
+    if not element.global_time:
+        if tvals is None:
+            pulsewfs = get_wfs(np.arange(psamples) / element.clock)
+        else:
+            pulsewfs = get_wfs(tvals[:psamples].copy())
+    else:
+        chan_tvals = {}
+        for c in pulse.channels:
+            chan_tvals[c] = _global_tvals(element, tvals, p, c, psamples)
+        pulsewfs = get_wfs(chan_tvals)
+
+    if cache != None:
+        cache.put(key, pulsewfs)
+
+    return pulsewfs
+
+def merge_spans(spans):
+    """
+    Merges a list of (start, stop) sample spans into a sorted list of 
+    disjoint spans.
+    """
+    merged = []
+    for i0, i1 in sorted(spans):
+        if i1 <= i0:
+            continue
+        if len(merged) > 0 and i0 <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], i1))
+        else:
+            merged.append((i0, i1))
+
+    return merged
+
+def render_spans(element, tvals, spans, cache=None):
+    """
+    Computes the ideal waveform of the element in the given sample spans
+    only. spans is a dictionary that contains a list of (start, stop) 
+    tuples for each channel. Every pulse that overlaps with a span is
+    rendered (at most once).
+    Returns a dictionary with a list of (start, stop, waveform) tuples per
+    channel.
+    """
+    table = element._timing_table()
+    starts = table['start_samples']
+    rendered = {}
+    result = {}
+
+    for c in spans:
+        result[c] = []
+        for i0, i1 in merge_spans(spans[c]):
+            wf = np.zeros(i1 - i0) + element._channels[c]['offset']
+
+            for p in element.pulses:
+                if c not in starts[p]:
+                    continue
+                s0 = starts[p][c]
+                s1 = s0 + table['samples'][p]
+                lo, hi = max(s0, i0), min(s1, i1)
+                if lo >= hi:
+                    continue
+
+                if p not in rendered:
+                    rendered[p] = render_pulse(element, tvals, p, cache=cache)
+                wf[lo-i0:hi-i0] += rendered[p][c][lo-s0:hi-s0]
+
+            result[c].append((i0, i1, wf))
+
+    return result
+
+def iter_chunks(element, chunk_samples, cache=None):
+    """
+    Generator that computes the ideal waveforms of the element in blocks of
+    chunk_samples, in time order. Yields (start, stop, wfs) per block.
+
+    Only pulses that overlap a block are evaluated. Pointwise pulses (see
+    pointwise_class) are rendered only for the samples inside the block;
+    all others are rendered once and kept until the blocks have passed 
+    them. Memory is thus bounded by the block size plus the non-pointwise
+    pulses that are active at a time.
+    """
+    table = element._timing_table()
+    samples = element.samples()
+    clock = element.clock
+
+    # all (start, stop, pulse, channel) sorted by start sample
+    entries = []
+    for p in table['start_samples']:
+        for c in table['start_samples'][p]:
+            s0 = table['start_samples'][p][c]
+            entries.append((s0, s0 + table['samples'][p], p, c))
+    entries.sort()
+
+    next_entry = 0
+    active = []
+    rendered = {}
+
+    for i0 in range(0, samples, chunk_samples):
+        i1 = min(i0 + chunk_samples, samples)
+
+        while next_entry < len(entries) and entries[next_entry][0] < i1:
+            active.append(entries[next_entry])
+            next_entry += 1
+        active = [e for e in active if e[1] > i0]
+
+        # forget rendered pulses that will not be needed anymore
+        live = set([e[2] for e in active])
+        for p in rendered.keys():
+            if p not in live:
+                del rendered[p]
+
+        wfs = {}
+        for c in element._channels:
+            wfs[c] = np.zeros(i1 - i0) + element._channels[c]['offset']
+
+        for s0, s1, p, c in active:
+            lo, hi = max(s0, i0), min(s1, i1)
+            if lo >= hi:
+                continue
+            pulse = element.pulses[p]
+
+            if pointwise_class(pulse.__class__):
+                if not element.global_time:
+                    ptvals = np.arange(lo - s0, hi - s0) / clock
+                else:
+                    ptvals = np.round(np.arange(lo, hi) / clock + \
+                        element.channel_delay(c) + element.time_offset,
+                        pulsar.SIGNIFICANT_DIGITS)
+                wfs[c][lo-i0:hi-i0] += pulse.chan_wf(c, ptvals)
+            else:
+                if p not in rendered:
+                    rendered[p] = render_pulse(element, None, p, 
+                        cache=cache)
+                wfs[c][lo-i0:hi-i0] += rendered[p][c][lo-s0:hi-s0]
+
+        yield i0, i1, wfs
@@ -0,0 +1,4 @@
+# Tests of the pulsar package. They need neither QTlab nor an AWG; run them
+# from lib/pulsar with
+#
+#     python -m unittest discover
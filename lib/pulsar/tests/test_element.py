@@ -0,0 +1,280 @@
+import logging
+import unittest
+from itertools import izip
+import numpy as np
+
+import pulse
+import element
+
+logging.disable(logging.WARNING)
+
+def square(amplitude, length=100e-9):
+    return pulse.SquarePulse('ch1', amplitude=amplitude, length=length)
+
+class IncrementalCompileTest(unittest.TestCase):
+
+    def build(self, amplitudes, incremental=True):
+        e = element.Element('e', min_samples=0, incremental=incremental,
+            use_cache=False)
+        e.define_channel('ch1', high=1., low=-1.)
+        for i, a in enumerate(amplitudes):
+            e.add(square(a), name='p%d' % i, start=i * 200e-9)
+        return e
+
+    def assertSameAsFresh(self, e, amplitudes):
+        fresh = self.build(amplitudes, incremental=False)
+        wfs = fresh.normalized_waveforms()[1]
+        self.assertTrue(np.array_equal(e.normalized_waveforms()[1]['ch1'],
+            wfs['ch1']))
+        self.assertEqual(e.clipped_samples, fresh.clipped_samples)
+
+    def test_clipped_samples_outside_recompiled_span(self):
+        amplitudes = [1.5, 0.5, 0.5]
+        e = self.build(amplitudes)
+        e.normalized_waveforms()
+        self.assertEqual(e.clipped_samples['ch1'], 100)
+
+        amplitudes[2] = -2.
+        e.replace('p2', square(-2.))
+        self.assertSameAsFresh(e, amplitudes)
+        self.assertEqual(e.clipped_samples['ch1'], 200)
+
+    def test_clipping_removed(self):
+        amplitudes = [1.5, 0.5, 1.5]
+        e = self.build(amplitudes)
+        e.normalized_waveforms()
+
+        amplitudes[0] = 0.2
+        e.replace('p0', square(0.2))
+        self.assertSameAsFresh(e, amplitudes)
+        self.assertEqual(e.clipped_samples['ch1'], 100)
+
+        amplitudes[2] = 0.2
+        e.pulses['p2'].amplitude = 0.2
+        e.pulse_changed('p2')
+        self.assertSameAsFresh(e, amplitudes)
+        self.assertEqual(e.clipped_samples['ch1'], 0)
+
+    def test_chunks(self):
+        e = self.build([1.5, 0.5, -1.5])
+        chunks = [wfs['ch1'] for tvals, wfs in e.iter_waveform_chunks(128)]
+        self.assertTrue(np.array_equal(np.concatenate(chunks),
+            e.normalized_waveforms()[1]['ch1']))
+        self.assertEqual(e.clipped_samples['ch1'], 200)
+
+class FakePulsar:
+    clock = 1e9
+    channels = {
+        'ch1' : {'type' : 'analog', 'high' : 1., 'low' : -1.,
+            'offset' : 0., 'delay' : 0.},
+        'ch2' : {'type' : 'analog', 'high' : 1., 'low' : -1.,
+            'offset' : 0., 'delay' : 10e-9},
+        }
+
+class ElementFamilyTest(unittest.TestCase):
+
+    def build(self, length):
+        e = element.Element('rabi', pulsar=FakePulsar(), min_samples=0,
+            use_cache=False)
+        e.add(pulse.SquarePulse('ch2', amplitude=0.3, length=50e-9),
+            name='wait')
+        e.add(pulse.SquarePulse('ch1', amplitude=0.5, length=length),
+            name='mw', refpulse='wait', refpoint='end')
+        e.add(pulse.SquarePulse('ch2', amplitude=0.8, length=100e-9),
+            name='ro', refpulse='mw', refpoint='end')
+        e.add(pulse.SquarePulse('ch1', amplitude=-0.4, length=20e-9),
+            name='tail', refpulse='ro', refpoint='start',
+            refpoint_new='end')
+        e.add(pulse.SquarePulse('ch1', amplitude=0.2, length=30e-9),
+            name='fixed', start=500e-9)
+        return e
+
+    def test_dependent_pulses(self):
+        e = self.build(100e-9)
+        self.assertEqual(e.dependent_pulses('mw'), ['ro', 'tail'])
+        self.assertEqual(e.dependent_pulses('fixed'), [])
+
+    def test_length_sweep_matches_scratch(self):
+        lengths = [100e-9, 40e-9, 250e-9, 100e-9]
+        family = element.ElementFamily(self.build(100e-9), 'mw', 'length',
+            lengths)
+
+        # the arrays are only valid until the next variant is generated
+        for length, (name, tvals, wfs) in izip(lengths, family.waveforms()):
+            ref_tvals, ref_wfs = self.build(length).normalized_waveforms()
+            self.assertTrue(np.array_equal(tvals, ref_tvals))
+            for c in ref_wfs:
+                self.assertTrue(np.array_equal(wfs[c], ref_wfs[c]))
+
+    def test_template_unchanged(self):
+        template = self.build(100e-9)
+        start = template.pulse_start_time('ro', 'ch2')
+        family = element.ElementFamily(template, 'mw', 'length',
+            [40e-9, 250e-9])
+        for elt in family:
+            self.assertTrue(elt.pulsar is template.pulsar)
+            self.assertFalse(elt.pulses['ro'] is template.pulses['ro'])
+        self.assertEqual(template.pulse_start_time('ro', 'ch2'), start)
+        self.assertEqual(template.pulses['mw'].length, 100e-9)
+
+    def test_replace_keeps_start(self):
+        e = self.build(100e-9)
+        start = e.pulse_start_time('ro', 'ch2')
+        e.replace('mw', pulse.SquarePulse('ch1', amplitude=0.5,
+            length=200e-9))
+        self.assertEqual(e.pulse_start_time('ro', 'ch2'), start)
+
+class TimingTableTest(unittest.TestCase):
+
+    def build(self):
+        e = element.Element('e', min_samples=0, use_cache=False)
+        e.define_channel('ch1', high=1., low=-1.)
+        e.define_channel('ch2', high=1., low=-1., delay=23e-9)
+        e.define_channel('m1', type='marker', high=1., low=0., delay=-7e-9)
+        return e
+
+    def assertTimingFresh(self, e):
+        table = dict(e._timing_table())
+        e._invalidate_timing()
+        fresh = e._timing_table()
+        for k in ['offset', 'samples', 'start_samples', 'end_samples',
+                'last_sample']:
+            self.assertEqual(table[k], fresh[k], k)
+        self.assertAlmostEqual(table['ideal_end'], fresh['ideal_end'], 15)
+
+    def test_add_order(self):
+        # pulses added later start earlier, on channels with and without
+        # delays; the table exists after every step
+        e = self.build()
+        for name, c, start in [('a', 'ch1', 100e-9), ('b', 'ch2', 50e-9),
+                ('c', 'm1', 300e-9), ('d', 'ch1', -20e-9),
+                ('e', 'ch2', 10e-9), ('f', 'm1', 1e-6)]:
+            e.add(pulse.SquarePulse(c, amplitude=0.5, length=40e-9),
+                name=name, start=start)
+            e._timing_table()
+            self.assertTimingFresh(e)
+
+    def test_references(self):
+        e = self.build()
+        e.add(square(0.5), name='a', start=200e-9)
+        e._timing_table()
+        e.add(pulse.SquarePulse('ch2', amplitude=0.5, length=30e-9),
+            name='b', refpulse='a', refpoint='start', refpoint_new='end')
+        self.assertTimingFresh(e)
+        e.add(pulse.SquarePulse('m1', amplitude=1., length=10e-9),
+            name='c', refpulse='b', refpoint='center', 
+            refpoint_new='center')
+        self.assertTimingFresh(e)
+        e.append(square(0.2), pulse.SquarePulse('ch2', amplitude=0.1,
+            length=70e-9))
+        self.assertTimingFresh(e)
+
+    def test_replace(self):
+        e = self.build()
+        e.add(square(0.5), name='a')
+        e.add(pulse.SquarePulse('ch2', amplitude=0.5, length=30e-9),
+            name='b', refpulse='a')
+        e.add(square(0.5), name='c', refpulse='b')
+        e._timing_table()
+
+        # longer and shorter last pulse, a pulse in the middle, and the
+        # pulse that defines the offset
+        for name, length in [('c', 300e-9), ('c', 10e-9), ('b', 100e-9),
+                ('a', 20e-9)]:
+            e.replace(name, pulse.SquarePulse(e.pulses[name].channels[0],
+                amplitude=0.3, length=length))
+            self.assertTimingFresh(e)
+
+        e.replace('a', square(0.5, 500e-9), reposition=True)
+        self.assertTimingFresh(e)
+        self.assertEqual(e.pulse_start_sample('c', 'ch1'), 
+            e.pulse_end_sample('b', 'ch2') + 1 + 23)
+
+    def test_pulse_changed(self):
+        e = self.build()
+        e.add(square(0.5), name='a')
+        e.add(square(0.5), name='b', refpulse='a')
+        e._timing_table()
+        e.pulses['b'].length = 250e-9
+        e.pulse_changed('b')
+        self.assertEqual(e._timing_table()['samples']['b'], 250)
+        self.assertTimingFresh(e)
+
+    def test_unannounced_change(self):
+        for incremental in [False, True]:
+            e = self.build()
+            e.incremental = incremental
+            e.add(square(0.5), name='a')
+            e.add(square(0.7), name='b', refpulse='a')
+            e.normalized_waveforms()
+
+            e.pulses['b'].length = 250e-9
+            logging.disable(logging.NOTSET)
+            try:
+                with LogCapture() as log:
+                    wfs = e.normalized_waveforms()[1]
+            finally:
+                logging.disable(logging.WARNING)
+            self.assertEqual(len(log.records), 1)
+            self.assertEqual(e._timing_table()['samples']['b'], 250)
+            self.assertTimingFresh(e)
+            self.assertEqual(len(wfs['ch1']), e.samples())
+            self.assertTrue(e.samples() >= 350)
+            self.assertTrue((wfs['ch1'][100:350] == 0.7).all())
+
+class CompactWaveformsTest(unittest.TestCase):
+
+    def build(self, incremental=False):
+        e = element.Element('e', min_samples=0, incremental=incremental,
+            use_cache=False)
+        e.define_channel('ch1', high=0.5, low=-1.)
+        e.define_channel('m1', type='marker', high=1., low=0.)
+        # a marker channel without range is always off
+        e.define_channel('m2', type='marker', high=0., low=0.)
+        for i, a in enumerate([0.3, -0.2, 0.8, -1.5, 0.123456789]):
+            e.add(square(a), name='p%d' % i, start=i * 150e-9)
+        e.add(pulse.SinePulse('ch1', frequency=12.3e6, amplitude=0.4,
+            length=500e-9), start=60e-9)
+        for c in ['m1', 'm2']:
+            e.add(pulse.SquarePulse(c, amplitude=1., length=100e-9),
+                start=200e-9)
+            e.add(pulse.SquarePulse(c, amplitude=0.5, length=50e-9),
+                start=400e-9)
+        return e
+
+    def test_compact(self):
+        ref = self.build()
+        tvals, wfs = ref.normalized_waveforms()
+        self.assertTrue(ref.clipped_samples['ch1'] > 0)
+        self.assertTrue(wfs['m1'].any())
+        self.assertFalse(wfs['m2'].any())
+        for incremental in [False, True]:
+            e = self.build(incremental)
+            ctvals, compact = e.compact_waveforms()
+            self.assertTrue(np.array_equal(ctvals, tvals))
+            self.assertEqual(compact['ch1'].dtype, np.float32)
+            self.assertTrue(np.array_equal(compact['ch1'],
+                wfs['ch1'].astype(np.float32)))
+            for c in ['m1', 'm2']:
+                self.assertEqual(compact[c].dtype, np.uint8)
+                self.assertTrue(np.array_equal(compact[c], wfs[c]))
+            self.assertEqual(e.clipped_samples, ref.clipped_samples)
+
+class LogCapture(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def __enter__(self):
+        logging.getLogger().addHandler(self)
+        return self
+
+    def __exit__(self, *args):
+        logging.getLogger().removeHandler(self)
+
+if __name__ == '__main__':
+    unittest.main()
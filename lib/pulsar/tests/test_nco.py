@@ -0,0 +1,140 @@
+import unittest
+from fractions import Fraction
+import numpy as np
+
+import nco
+import pulse
+import element
+
+def exact_sin(frequency, phase, n, clock):
+    """
+    sin(2 pi (frequency n/clock + phase/360)), with the phase reduced
+    exactly before the sine is taken.
+    """
+    turns = (Fraction(frequency) * n / Fraction(clock) + \
+        Fraction(phase) / 360) % 1
+    return np.sin(2 * np.pi * float(turns))
+
+class OscillatorTest(unittest.TestCase):
+
+    clock = 1.2e9
+
+    def setUp(self):
+        nco.enabled = True
+        self.direct_samples = nco.direct_samples
+
+    def tearDown(self):
+        nco.direct_samples = self.direct_samples
+
+    def tvals(self, first, n, clock=None):
+        clock = self.clock if clock == None else clock
+        return np.arange(first, first + n) / clock
+
+    def assertClose(self, a, b, tol=1e-9):
+        self.assertEqual(a.shape, b.shape)
+        self.assertTrue(np.abs(a - b).max() < tol, np.abs(a - b).max())
+
+    def test_direct(self):
+        for f, clock in [(50e6, 1e9), (123.456789e6, 1.2e9),
+                (-7.3e6, 1.2e9), (1.2e9/7, 1.2e9)]:
+            for first, n in [(0, 10), (1234, 300), (0, 5000),
+                    (98765, 100000), (-500, 2000)]:
+                tvals = self.tvals(first, n, clock)
+                c, s = nco.quadratures(f, 33.3, tvals, clock)
+                dc, ds = nco.direct(f, 33.3, tvals)
+                self.assertClose(c, dc)
+                self.assertClose(s, ds)
+
+    def test_cos_or_sin(self):
+        tvals = self.tvals(17, 3000)
+        c, s = nco.quadratures(10e6, 0., tvals, self.clock, cos=False)
+        self.assertEqual(c, None)
+        self.assertClose(s, np.sin(2*np.pi * 10e6 * tvals))
+        c, s = nco.quadratures(10e6, 0., tvals, self.clock, sin=False)
+        self.assertEqual(s, None)
+        self.assertClose(c, np.cos(2*np.pi * 10e6 * tvals))
+
+    def test_long_time(self):
+        # late in a long element; the phase is exact from the sample index
+        f = 123.456789e6
+        first = 20000000
+        s = nco.quadratures(f, 45., self.tvals(first, 4000), self.clock,
+            cos=False)[1]
+        for k in [0, 1, 255, 256, 1000, 3999]:
+            self.assertTrue(abs(s[k] - exact_sin(f, 45., first + k,
+                self.clock)) < 1e-9)
+
+    def test_paths(self):
+        # direct evaluation of short spans and blocks agree
+        tvals = self.tvals(4321, 2000)
+        nco.direct_samples = 0
+        blocks = nco.quadratures(123.456789e6, 10., tvals, self.clock)
+        nco.direct_samples = 10000
+        direct = nco.quadratures(123.456789e6, 10., tvals, self.clock)
+        for a, b in zip(blocks, direct):
+            self.assertClose(a, b, 1e-12)
+
+    def test_chunks(self):
+        f = 123.456789e6
+        tvals = self.tvals(1000, 10000)
+        whole = nco.quadratures(f, 0., tvals, self.clock, cos=False)[1]
+        for size in [100, 700, 3000]:
+            chunks = [nco.quadratures(f, 0., tvals[i:i+size], self.clock,
+                cos=False)[1] for i in range(0, len(tvals), size)]
+            self.assertClose(np.concatenate(chunks), whole, 1e-12)
+
+    def test_off_grid(self):
+        # a channel delay that is not a multiple of the sample period
+        tvals = self.tvals(100, 3000) + 0.3 / self.clock
+        c, s = nco.quadratures(50e6, 0., tvals, self.clock)
+        dc, ds = nco.direct(50e6, 0., tvals)
+        self.assertClose(c, dc)
+        self.assertClose(s, ds)
+
+    def test_batch(self):
+        frequencies = [10e6, 123.456789e6, 50e6]
+        phases = [0., 90., 12.5]
+        tvals = np.array([self.tvals(first, 1000) \
+            for first in [0, 5000, 123456]])
+        c, s = nco.batch_quadratures(frequencies, phases, tvals,
+            [self.clock] * 3)
+        for i in range(3):
+            dc, ds = nco.direct(frequencies[i], phases[i], tvals[i])
+            self.assertClose(c[i], dc)
+            self.assertClose(s[i], ds)
+
+    def test_batch_short_rows(self):
+        # rows that are evaluated together give the values of single rows
+        frequencies = [10e6, 123.456789e6, -50e6, 50e6]
+        phases = [0., 90., 12.5, 400.]
+        tvals = np.array([self.tvals(first, 200) \
+            for first in [0, 5000, 123456, 20000000]])
+        tvals[3] += 0.3 / self.clock
+        c, s = nco.batch_quadratures(frequencies, phases, tvals,
+            [self.clock] * 4)
+        for i in range(4):
+            sc, ss = nco.quadratures(frequencies[i], phases[i], tvals[i],
+                self.clock)
+            self.assertTrue(np.array_equal(c[i], sc))
+            self.assertTrue(np.array_equal(s[i], ss))
+
+    def test_sine_pulse(self):
+        def build():
+            e = element.Element('e', clock=self.clock, min_samples=0,
+                use_cache=False)
+            e.define_channel('ch1', high=1., low=-1.)
+            for i in range(3):
+                e.append(pulse.SinePulse('ch1', frequency=123.456789e6,
+                    amplitude=0.5, length=(i+1) * 1e-6, phase=i*30.))
+            return e.normalized_waveforms()[1]['ch1']
+
+        wf = build()
+        nco.enabled = False
+        try:
+            ref = build()
+        finally:
+            nco.enabled = True
+        self.assertClose(wf, ref)
+
+if __name__ == '__main__':
+    unittest.main()
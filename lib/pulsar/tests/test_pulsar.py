@@ -0,0 +1,605 @@
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+import threading
+
+import numpy as np
+
+import pulse
+import element
+import pulsar
+import simawg
+import awgfile
+
+logging.disable(logging.WARNING)
+
+def simulated_pulsar(awg=None, registry_path=None):
+    p = pulsar.Pulsar()
+    p.AWG = simawg.SimulatedAWG(latency=0.) if awg == None else awg
+    p.waveform_registry_path = registry_path
+    p.load_waveform_registry()
+
+    p.define_channel(id='ch1', name='RF', type='analog', delay=0.,
+        offset=0., high=1., low=-1., active=True)
+    p.define_channel(id='ch1_marker1', name='trigger', type='marker',
+        delay=0., offset=0., high=1., low=0., active=True)
+    return p
+
+def elements(p, n=3, prefix='e', amplitude=0.1):
+    elts = []
+    for i in range(n):
+        elt = element.Element('%s%d' % (prefix, i), pulsar=p, 
+            use_cache=False)
+        elt.append(pulse.SquarePulse('RF', amplitude=amplitude * (i+1),
+            length=1e-6))
+        elt.append(pulse.SquarePulse('trigger', amplitude=1.,
+            length=100e-9))
+        elts.append(elt)
+    return elts
+
+def sent(awg):
+    return [args[0] for name, args in awg.calls if name == 'send_waveform']
+
+class WaveformRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'registry.pkl')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def upload(self, p):
+        p.AWG.reset_stats()
+        p.upload(*elements(p), verbose=False)
+        return sent(p.AWG)
+
+    def test_not_persistent_by_default(self):
+        self.assertEqual(pulsar.Pulsar.waveform_registry_path, None)
+        p = simulated_pulsar()
+        n = len(self.upload(p))
+        self.assertEqual(len(self.upload(simulated_pulsar(p.AWG))), n)
+
+    def test_persistent_registry(self):
+        p = simulated_pulsar(registry_path=self.path)
+        self.assertTrue(len(self.upload(p)) > 0)
+
+        q = simulated_pulsar(p.AWG, registry_path=self.path)
+        self.assertEqual(self.upload(q), [])
+        self.assertEqual(p.AWG.errors(), [])
+
+    def test_awg_restarted(self):
+        p = simulated_pulsar(registry_path=self.path)
+        n = len(self.upload(p))
+
+        q = simulated_pulsar(registry_path=self.path)
+        self.assertEqual(len(self.upload(q)), n)
+        self.assertEqual(q.AWG.errors(), [])
+
+    def test_waveform_deleted_on_awg(self):
+        p = simulated_pulsar(registry_path=self.path)
+        self.upload(p)
+        name = p.awg_waveform_name('e1_ch1')
+        del p.AWG.waveforms[name]
+
+        q = simulated_pulsar(p.AWG, registry_path=self.path)
+        self.assertEqual(self.upload(q), [name])
+
+    def test_waveform_changed_on_awg(self):
+        p = simulated_pulsar(registry_path=self.path)
+        self.upload(p)
+        w, m1, m2 = p.AWG.waveforms['e0_ch1']
+        p.AWG.waveforms['e0_ch1'] = (w[:-4], m1[:-4], m2[:-4])
+
+        q = simulated_pulsar(p.AWG, registry_path=self.path)
+        self.assertEqual(self.upload(q), ['e0_ch1'])
+
+    def test_no_connection(self):
+        p = simulated_pulsar(registry_path=self.path)
+        n = len(self.upload(p))
+
+        awg = simawg.SimulatedAWG(latency=0., scpi=False)
+        awg.waveforms = p.AWG.waveforms
+        q = simulated_pulsar(awg, registry_path=self.path)
+        self.assertEqual(len(self.upload(q)), n)
+
+    def test_waveform_list(self):
+        p = simulated_pulsar()
+        self.upload(p)
+        wlist = pulsar.scpi.waveform_list(p.AWG.ask, batch=3)
+        self.assertEqual(sorted(wlist.keys()), sorted(p.AWG.waveforms.keys()))
+        self.assertEqual(wlist['e0_ch1'], len(p.AWG.waveforms['e0_ch1'][0]))
+        self.assertEqual(p.AWG.errors(), [])
+
+class BlockingAWG(simawg.SimulatedAWG):
+    """
+    Holds the first SCPI message that is sent until released.
+    """
+    def __init__(self):
+        simawg.SimulatedAWG.__init__(self, latency=0.)
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def _write(self, message):
+        if not self.writing.is_set():
+            self.writing.set()
+            self.release.wait(5.)
+        simawg.SimulatedAWG._write(self, message)
+
+class ThreadingTest(unittest.TestCase):
+
+    def test_batch_per_thread(self):
+        p = simulated_pulsar(BlockingAWG())
+        t = threading.Thread(target=p.setup_channels)
+        t.start()
+        self.assertTrue(p.AWG.writing.wait(5.))
+
+        # the setup of the other thread is still being sent: this call
+        # neither joins its batch nor interleaves with it
+        threading.Timer(0.05, p.AWG.release.set).start()
+        p.activate_channels()
+        self.assertEqual(p.AWG.settings['ch1_status'], 1)
+        t.join()
+        self.assertEqual(p.AWG.settings['ch1_status'], 1)
+        self.assertEqual(p.AWG.errors(), [])
+
+    def test_concurrent_uploads(self):
+        p = simulated_pulsar(simawg.SimulatedAWG(latency=1e-4, 
+            realtime=True))
+        p.waveform_memory_budget = 20000
+        task = p.upload_async(*elements(p, n=20, prefix='a', 
+            amplitude=0.04))
+        for i in range(5):
+            p.upload(*elements(p, n=4, prefix='b%d_' % i, 
+                amplitude=0.01 * (i+1) + 0.003), verbose=False)
+        task.result(10.)
+
+        resident = p.resident_waveforms()
+        for name, samples, t in resident:
+            self.assertEqual(len(p.AWG.waveforms[name][0]), samples)
+        self.assertEqual(p.resident_samples(), 
+            sum([samples for name, samples, t in resident]))
+        self.assertEqual(p.AWG.errors(), [])
+
+class SequenceTest(unittest.TestCase):
+
+    rows = [
+        dict(name='a', wfname='w0', trigger_wait=True),
+        dict(name='b', wfname='w1', repetitions=5, jump_target='d'),
+        dict(name='c', wfname='w0', goto_target='a'),
+        dict(name='d', wfname='w2', repetitions=-1, goto_target='a',
+            jump_target='b'),
+        ]
+
+    def appended(self):
+        seq = pulsar.Sequence('s')
+        for row in self.rows:
+            self.assertTrue(seq.append(**row))
+        return seq
+
+    def test_from_arrays(self):
+        column = lambda key, default: [row.get(key, default) \
+            for row in self.rows]
+        seq = pulsar.Sequence.from_arrays('s', column('name', None),
+            column('wfname', None), repetitions=column('repetitions', 1),
+            goto_targets=column('goto_target', None),
+            jump_targets=column('jump_target', None),
+            trigger_wait=column('trigger_wait', False))
+        self.assertEqual(seq.elements, self.appended().elements)
+
+        seq = pulsar.Sequence.from_arrays('s', ['a', 'b'], ['w0', 'w0'])
+        self.assertEqual(seq.elements, [
+            dict(name='a', wfname='w0', repetitions=1, goto_target=None,
+                jump_target=None, trigger_wait=False),
+            dict(name='b', wfname='w0', repetitions=1, goto_target=None,
+                jump_target=None, trigger_wait=False)])
+
+    def test_from_arrays_errors(self):
+        self.assertRaises(ValueError, pulsar.Sequence.from_arrays, 's',
+            ['a', 'b', 'a'], ['w0', 'w1', 'w2'])
+        self.assertRaises(ValueError, pulsar.Sequence.from_arrays, 's',
+            ['a', 'b'], ['w0', 'w1'], repetitions=[1])
+
+    def test_element_index(self):
+        seq = self.appended()
+        for i, row in enumerate(self.rows):
+            self.assertEqual(seq.element_index(row['name']), i + 1)
+            self.assertEqual(seq.element_index(row['name'], start_idx=0), i)
+        self.assertEqual(seq.element_index(seq.jump_target(1)), 4)
+        self.assertEqual(seq.element_index(seq.goto_target(3)), 1)
+        self.assertRaises(ValueError, seq.element_index, 'x')
+
+        # inserting before the end moves the following elements
+        seq.insert_element('x', 'w3', pos=1)
+        self.assertEqual([seq.element_index(n) for n in 'axbcd'],
+            [1, 2, 3, 4, 5])
+        seq.append('y', 'w3')
+        self.assertEqual(seq.element_index('y'), 6)
+
+    def test_duplicate_name(self):
+        seq = self.appended()
+        elements = seq.elements
+        self.assertFalse(seq.append('b', 'w3'))
+        self.assertFalse(seq.insert_element('a', 'w3', pos=0))
+        self.assertEqual(seq.elements, elements)
+        self.assertEqual(seq.element_index('b'), 2)
+
+class CompactTest(unittest.TestCase):
+
+    def sequence(self, rows):
+        seq = pulsar.Sequence('s')
+        for i, row in enumerate(rows):
+            if isinstance(row, str):
+                row = dict(wfname=row)
+            seq.append('r%d' % i, **row)
+        return seq
+
+    def summary(self, seq):
+        return [(e['name'], e['wfname'], e['repetitions']) \
+            for e in seq.elements]
+
+    def test_merge(self):
+        seq = self.sequence(['w0', 'w0', dict(wfname='w0', repetitions=3),
+            'w1', 'w0', 'w0'])
+        self.assertEqual(seq.compact(), 3)
+        self.assertEqual(self.summary(seq), [('r0', 'w0', 5), 
+            ('r3', 'w1', 1), ('r4', 'w0', 2)])
+        self.assertEqual(seq.compact(), 0)
+
+    def test_targets(self):
+        # r2 and r4 are the targets of a jump and a goto; no run continues
+        # into them
+        rows = ['w0', 'w0', 'w0', 'w0', 'w0', 
+            dict(wfname='w1', jump_target='r2'),
+            dict(wfname='w2', goto_target='r4')]
+        seq = self.sequence(rows)
+        self.assertEqual(seq.compact(), 2)
+        self.assertEqual(self.summary(seq), [('r0', 'w0', 2),
+            ('r2', 'w0', 2), ('r4', 'w0', 1), ('r5', 'w1', 1), 
+            ('r6', 'w2', 1)])
+
+        # nor into the target of a dynamic jump
+        seq = self.sequence(rows)
+        seq.set_djump(True)
+        seq.add_djump_address(3, 'r1')
+        self.assertEqual(seq.compact(), 1)
+        self.assertEqual(self.summary(seq), [('r0', 'w0', 1),
+            ('r1', 'w0', 1), ('r2', 'w0', 2), ('r4', 'w0', 1), 
+            ('r5', 'w1', 1), ('r6', 'w2', 1)])
+
+    def test_goto_and_jump(self):
+        # only the last row of a run may have a goto target, and all need
+        # the same jump target
+        seq = self.sequence([dict(wfname='w0', goto_target='r3'), 'w0',
+            'w0', dict(wfname='w0', goto_target='r3'),
+            dict(wfname='w1', jump_target='r0'), 
+            dict(wfname='w1', jump_target='r0'), 'w1'])
+        self.assertEqual(seq.compact(), 2)
+        self.assertEqual(self.summary(seq), [('r0', 'w0', 1), 
+            ('r1', 'w0', 2), ('r3', 'w0', 1), ('r4', 'w1', 2), 
+            ('r6', 'w1', 1)])
+        self.assertEqual(seq.goto_target(1), None)
+        self.assertEqual(seq.jump_target(3), 'r0')
+
+        seq = self.sequence(['w0', dict(wfname='w0', goto_target='r0')])
+        self.assertEqual(seq.compact(), 1)
+        self.assertEqual(seq.elements[0]['goto_target'], 'r0')
+
+    def test_trigger_wait(self):
+        seq = self.sequence([dict(wfname='w0', trigger_wait=True), 'w0',
+            dict(wfname='w0', trigger_wait=True), 'w0'])
+        self.assertEqual(seq.compact(), 2)
+        self.assertEqual(self.summary(seq), [('r0', 'w0', 2), 
+            ('r2', 'w0', 2)])
+        self.assertEqual([e['trigger_wait'] for e in seq.elements],
+            [True, True])
+
+    def test_repetition_cap(self):
+        seq = self.sequence([dict(wfname='w0', repetitions=40000),
+            dict(wfname='w0', repetitions=30000), 
+            dict(wfname='w0', repetitions=30000), 'w0', 
+            dict(wfname='w0', repetitions=-1), 'w0'])
+        self.assertEqual(seq.compact(), 2)
+        self.assertEqual(self.summary(seq), [('r0', 'w0', 40000),
+            ('r1', 'w0', 60001), ('r4', 'w0', -1), ('r5', 'w0', 1)])
+
+        seq = self.sequence(['w0'] * 10)
+        self.assertEqual(seq.compact(max_repetitions=4), 7)
+        self.assertEqual([e['repetitions'] for e in seq.elements], 
+            [4, 4, 2])
+
+    def test_remapped_targets(self):
+        seq = self.sequence(['w0', 'w0', dict(wfname='w1', jump_target='r4'),
+            dict(wfname='w1', jump_target='r4'), 'w2', 'w2',
+            dict(wfname='w3', goto_target='r2')])
+        self.assertEqual(seq.compact(), 3)
+        self.assertEqual(seq.element_index(seq.jump_target(1)), 3)
+        self.assertEqual(seq.element_index(seq.goto_target(3)), 2)
+        self.assertEqual([seq.element_index(n) for n in 
+            ['r0', 'r2', 'r4', 'r6']], [1, 2, 3, 4])
+        self.assertRaises(ValueError, seq.element_index, 'r1')
+
+def effective_sequence(awg):
+    """
+    The rows of the sequence on awg, without the fields that have no effect
+    (the loop count of infinite repetitions, and the targets of gotos and
+    jumps that are off).
+    """
+    rows = []
+    for row in awg.sequence:
+        row = dict(row)
+        if row['infinite']:
+            del row['loop_count']
+        if not row['goto_state']:
+            del row['goto_index']
+        if row['jump_type'] == 'OFF':
+            del row['jump_index']
+        rows.append(row)
+    return rows
+
+class ProgramSequenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.p = simulated_pulsar()
+        self.elts = elements(self.p)
+        self.p.upload(*self.elts, verbose=False)
+
+    def sequence(self, repetitions=[1, 2, 3], jump_targets=['e2', None, 
+            'e0'], names=None):
+        names = [e.name for e in self.elts] if names == None else names
+        return pulsar.Sequence.from_arrays('s', names, names, 
+            repetitions=repetitions, jump_targets=jump_targets)
+
+    def program(self, seq):
+        """
+        Programs seq and returns the sequence commands that were sent.
+        """
+        self.p.AWG.reset_stats()
+        self.p.program_sequence(seq, verbose=False)
+        self.assertEqual(self.p.AWG.errors(), [])
+
+        # the same sequence, programmed completely on another AWG
+        p = simulated_pulsar()
+        p.upload(*elements(p), verbose=False)
+        p.program_sequence(seq, verbose=False)
+        self.assertEqual(effective_sequence(self.p.AWG), 
+            effective_sequence(p.AWG))
+
+        commands = []
+        for msg in self.p.AWG.messages:
+            commands += [c for c in msg.split(';') if c.startswith(':SEQ:')]
+        return commands
+
+    def test_repetitions(self):
+        self.program(self.sequence())
+        self.assertEqual(self.program(self.sequence(repetitions=[1, 5, 3])),
+            [':SEQ:ELEM2:LOOP:COUN 5'])
+        self.assertEqual(self.program(self.sequence(repetitions=[1, -1, 3])),
+            [':SEQ:ELEM2:LOOP:INF 1'])
+        self.assertEqual(self.program(self.sequence(repetitions=[1, 4, 7])),
+            [':SEQ:ELEM2:LOOP:INF 0', ':SEQ:ELEM2:LOOP:COUN 4', 
+                ':SEQ:ELEM3:LOOP:COUN 7'])
+        self.assertEqual(self.program(self.sequence(repetitions=[1, 4, 7])),
+            [])
+
+    def test_jump_target(self):
+        self.program(self.sequence())
+        self.assertEqual(self.program(self.sequence(jump_targets=[None,
+            None, 'e0'])), [':SEQ:ELEM1:JTAR:TYPE OFF'])
+        self.assertEqual(self.program(self.sequence(jump_targets=[None,
+            'e2', 'e0'])), [':SEQ:ELEM2:JTAR:TYPE IND', 
+                ':SEQ:ELEM2:JTAR:IND 3'])
+
+    def test_length_changed(self):
+        self.program(self.sequence())
+        commands = self.program(self.sequence(repetitions=[1, 2],
+            jump_targets=['e1', None], names=['e0', 'e1']))
+        self.assertEqual(commands[:2], [':SEQ:LENG 0', ':SEQ:LENG 2'])
+        for i in [1, 2]:
+            self.assertTrue(':SEQ:ELEM%d:WAV1 "e%d_ch1"' % (i, i-1) \
+                in commands)
+            self.assertTrue(':SEQ:ELEM%d:LOOP:COUN %d' % (i, i) in commands)
+        self.assertTrue(':SEQ:ELEM1:JTAR:IND 2' in commands)
+        self.assertTrue(':SEQ:ELEM2:GOTO:IND 1' in commands)
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        p = simulated_pulsar()
+        elts = elements(p)
+        seq = pulsar.Sequence('s')
+        seq.append('a', 'e0', repetitions=2, trigger_wait=True)
+        seq.append('b', 'e1', jump_target='a')
+        seq.append('c', 'e2', repetitions=-1, goto_target='b')
+        seq.append('d', 'e0', jump_target='c')
+
+        seqfile = p.export_sequence(seq, elts, self.dir, loop=False,
+            chunk_samples=500)
+        self.assertEqual(seqfile, os.path.join(self.dir, 's.seq'))
+
+        for e in elts:
+            data, clock = awgfile.read_wfm(os.path.join(self.dir,
+                e.name + '_ch1.wfm'))
+            self.assertEqual(clock, p.clock)
+            tvals, wfs = e.normalized_waveforms()
+            self.assertEqual(len(data), len(tvals))
+            self.assertTrue(np.array_equal(data['amplitude'],
+                wfs['RF'].astype(np.float32)))
+            self.assertTrue(np.array_equal(data['markers'], wfs['trigger']))
+            self.assertTrue(wfs['trigger'].any())
+
+        lines = open(seqfile, 'rb').read().split('\r\n')
+        self.assertEqual(lines[:2], ['MAGIC 3002', 'LINES 4'])
+        rows = [line.split(',') for line in lines[2:6]]
+        self.assertEqual([row[:2] for row in rows], [['"e0_ch1.wfm"', '""'],
+            ['"e1_ch1.wfm"', '""'], ['"e2_ch1.wfm"', '""'], 
+            ['"e0_ch1.wfm"', '""']])
+        # loop count, trigger wait, goto and jump target
+        self.assertEqual([[int(x) for x in row[2:]] for row in rows],
+            [[2, 1, 0, 0], [1, 0, 0, 1], [0, 0, 2, 0], [1, 0, 0, 3]])
+        self.assertEqual(lines[6:], ['JUMP_MODE LOGIC', 
+            'JUMP_TIMING %s' % p.event_jump_timing, ''])
+
+        # with loop, the last element goes back to the first
+        p.export_sequence(seq, elts, self.dir)
+        lines = open(seqfile, 'rb').read().split('\r\n')
+        self.assertEqual(lines[5].split(',')[-2:], ['1', '3'])
+
+    def test_missing_waveforms(self):
+        p = simulated_pulsar()
+        seq = pulsar.Sequence('s')
+        seq.append('a', 'e0')
+        seq.append('b', 'x')
+        self.assertRaises(Exception, p.export_sequence, seq, elements(p),
+            self.dir)
+
+class PackWaveformTest(unittest.TestCase):
+
+    def test_compact_like_float64(self):
+        p = simulated_pulsar()
+        p.define_channel(id='ch1_marker2', name='gate', type='marker',
+            delay=0., offset=0., high=1., low=0., active=True)
+        e = element.Element('e', pulsar=p, use_cache=False)
+        e.append(pulse.SinePulse('RF', frequency=7.7e6, amplitude=1.2,
+            length=400e-9))
+        e.add(pulse.SquarePulse('trigger', amplitude=1., length=100e-9),
+            start=50e-9)
+        e.add(pulse.SquarePulse('gate', amplitude=1., length=100e-9),
+            start=120e-9)
+        tvals, wfs = e.normalized_waveforms()
+        w, m1, m2 = wfs['RF'], wfs['trigger'], wfs['gate']
+
+        for format in ['int', 'real']:
+            packed = p.packed_waveforms(e, format=format)['ch1']
+            self.assertTrue(np.array_equal(packed, 
+                pulsar.pack_waveform(w, m1, m2, format=format)))
+
+        # the DAC codes and marker bits give back the waveforms
+        packed = p.packed_waveforms(e)['ch1']
+        self.assertEqual(packed.dtype, np.uint16)
+        fullscale = (2**pulsar.DAC_BITS - 1) / 2.
+        codes = packed & (2**pulsar.DAC_BITS - 1)
+        self.assertTrue(np.abs(codes / fullscale - 1. - w).max() <= \
+            0.5 / fullscale + 1e-7)
+        self.assertTrue(codes.max() == 2**pulsar.DAC_BITS - 1)
+        self.assertTrue(np.array_equal(
+            (packed >> pulsar.MARKER1_BIT) & 1, m1))
+        self.assertTrue(np.array_equal(
+            (packed >> pulsar.MARKER2_BIT) & 1, m2))
+        self.assertTrue(m1.any() and m2.any() and (m1 != m2).any())
+
+class PlayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.p = simulated_pulsar()
+        self.elts = elements(self.p)
+        self.p.upload(*self.elts, verbose=False)
+        self.wfs = dict([(e.name, e.normalized_waveforms()[1]) \
+            for e in self.elts])
+
+    def expected(self, path):
+        """
+        The concatenated waveforms of the (element name, repetitions) in
+        path.
+        """
+        w = np.concatenate([np.tile(self.wfs[name]['RF'], reps) \
+            for name, reps in path])
+        m1 = np.concatenate([np.tile(self.wfs[name]['trigger'], reps) \
+            for name, reps in path])
+        return w, m1, np.zeros(len(w))
+
+    def assertPlays(self, path, **kw):
+        played = self.p.AWG.play(**kw)
+        self.assertEqual(played.keys(), [1])
+        for a, b in zip(played[1], self.expected(path)):
+            self.assertTrue(np.array_equal(a, b))
+
+    def test_repetitions(self):
+        seq = pulsar.Sequence('s')
+        seq.append('a', 'e0', repetitions=2)
+        seq.append('b', 'e1', repetitions=3, jump_target='a')
+        seq.append('c', 'e2')
+        seq.append('d', 'e0', repetitions=4)
+        self.p.program_sequence(seq, loop=False, verbose=False)
+        self.assertPlays([('e0', 2), ('e1', 3), ('e2', 1), ('e0', 4)])
+
+        # with loop, the sequence starts over
+        self.p.program_sequence(seq, verbose=False)
+        self.assertPlays([('e0', 2), ('e1', 3), ('e2', 1), ('e0', 4),
+            ('e0', 2), ('e1', 3)], max_elements=6)
+
+        # an event while b plays jumps back to a
+        self.assertPlays([('e0', 2), ('e1', 3), ('e0', 2), ('e1', 3), 
+            ('e2', 1)], max_elements=5, events=[1])
+
+    def test_infinite(self):
+        seq = pulsar.Sequence('s')
+        seq.append('a', 'e2')
+        seq.append('b', 'e1', repetitions=-1)
+        seq.append('c', 'e0')
+        self.p.program_sequence(seq, verbose=False)
+        self.assertPlays([('e2', 1), ('e1', 1)])
+
+class MemoryBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.p = simulated_pulsar()
+        self.elts = elements(self.p, n=6)
+        self.samples = self.elts[0].samples()
+        self.p.waveform_memory_budget = 3 * self.samples
+
+    def upload(self, *idx):
+        self.p.upload(*[self.elts[i] for i in idx], verbose=False)
+
+    def resident(self):
+        names = [name for name, samples, t in self.p.resident_waveforms()]
+        self.assertEqual(sorted(names), sorted(self.p.AWG.waveforms))
+        self.assertEqual(self.p.resident_samples(), 
+            len(names) * self.samples)
+        return names
+
+    def test_least_recently_used(self):
+        self.upload(0, 1, 2)
+        self.assertEqual(self.resident(), ['e0_ch1', 'e1_ch1', 'e2_ch1'])
+
+        # e0 is used again (it is not sent twice), e1 is deleted for e3
+        self.upload(0)
+        self.assertEqual(self.resident(), ['e1_ch1', 'e2_ch1', 'e0_ch1'])
+        self.upload(3)
+        self.assertEqual(self.resident(), ['e2_ch1', 'e0_ch1', 'e3_ch1'])
+        self.assertEqual(sent(self.p.AWG), ['e0_ch1', 'e1_ch1', 'e2_ch1',
+            'e3_ch1'])
+        self.assertEqual(self.p.AWG.errors(), [])
+
+    def test_sequenced_kept(self):
+        self.upload(0, 1, 2)
+        seq = pulsar.Sequence('s')
+        seq.append('a', 'e1')
+        seq.append('b', 'e2')
+        self.p.program_sequence(seq, verbose=False)
+
+        # e1 and e2 stay, although they are used less recently than e0
+        self.upload(0)
+        for i in [3, 4, 5]:
+            self.upload(i)
+            self.assertEqual(self.resident(), ['e1_ch1', 'e2_ch1', 
+                'e%d_ch1' % i])
+
+        # the waveforms of one upload are not deleted for each other, and
+        # neither are the sequenced ones: the budget is exceeded
+        self.upload(3, 4)
+        self.assertEqual(self.resident(), ['e1_ch1', 'e2_ch1', 'e3_ch1',
+            'e4_ch1'])
+        self.p.AWG.play()
+        self.assertEqual(self.p.AWG.errors(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import numpy as np
+
+import pulse
+
+class ArrayPulse(pulse.Pulse):
+
+    def __init__(self, channel, name='array pulse', **kw):
+        pulse.Pulse.__init__(self, name)
+        self.channel = channel
+        self.channels.append(channel)
+        self.samples = kw.pop('samples', np.zeros(10))
+        self.length = kw.pop('length', 10e-9)
+
+    def chan_wf(self, chan, tvals):
+        return np.interp(tvals, np.linspace(0, self.length,
+            len(self.samples)), self.samples)
+
+class SlotsPulse(object):
+    __slots__ = ['name', 'channels', 'samples']
+
+    def __init__(self):
+        self.name = 'slots'
+        self.channels = ['ch1']
+        self.samples = np.arange(4.)
+
+    clone = pulse.Pulse.clone.im_func
+
+class CloneTest(unittest.TestCase):
+
+    def test_source_array_changed(self):
+        p = ArrayPulse('ch1', samples=np.arange(10.))
+        c = pulse.cp(p)
+        p.samples[0] = 5.
+        self.assertEqual(c.samples[0], 0.)
+        c.samples[1] = 7.
+        self.assertEqual(p.samples[1], 1.)
+        self.assertTrue(p.samples.flags.writeable)
+
+    def test_read_only_arrays_shared(self):
+        samples = np.arange(10.)
+        samples.flags.writeable = False
+        p = ArrayPulse('ch1', samples=samples)
+        c = pulse.clone(pulse.clone(p))
+        self.assertTrue(c.samples is samples)
+
+    def test_assign_new_array(self):
+        p = ArrayPulse('ch1', samples=np.arange(10.))
+        c = pulse.clone(p)
+        c.samples = np.ones(10)
+        self.assertTrue(np.array_equal(p.samples, np.arange(10.)))
+
+    def test_containers(self):
+        p = pulse.SquarePulse('ch1', amplitude=0.5, length=1e-6)
+        p.tags = ['a', 'b']
+        p.options = {'x' : 1}
+        p.nested = [[1, 2]]
+        c = pulse.clone(p)
+
+        c.channels.append('ch2')
+        c.tags.append('c')
+        c.options['x'] = 2
+        c.nested[0].append(3)
+        self.assertEqual(p.channels, ['ch1'])
+        self.assertEqual(p.tags, ['a', 'b'])
+        self.assertEqual(p.options, {'x' : 1})
+        self.assertEqual(p.nested, [[1, 2]])
+
+    def test_parameters(self):
+        p = pulse.SinePulse('ch1', frequency=10e6, amplitude=0.5,
+            length=1e-6, phase=30.)
+        c = pulse.cp(p, amplitude=0.2)
+        self.assertEqual(p.amplitude, 0.5)
+        self.assertEqual(c.amplitude, 0.2)
+        self.assertEqual(c.frequency, 10e6)
+        self.assertTrue(c.__class__ is p.__class__)
+
+        tvals = np.arange(100) / 1e9
+        self.assertTrue(np.array_equal(pulse.clone(p).chan_wf('ch1', tvals),
+            p.chan_wf('ch1', tvals)))
+
+    def test_slots(self):
+        p = SlotsPulse()
+        c = p.clone()
+        self.assertEqual(c.name, 'slots')
+        c.channels.append('ch2')
+        self.assertEqual(p.channels, ['ch1'])
+        c.samples[0] = 1.
+        self.assertEqual(p.samples[0], 0.)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import numpy as np
+
+import shapes
+import pulselib
+
+def reburp_series(tvals, length):
+    """
+    The Reburp envelope as the cosine series of Geen and Freeman, summed
+    term by term.
+    """
+    coefficients = [0.49,-1.02,1.11,-1.57,0.83,-0.42,0.26,-0.16,+0.10,
+        -0.07,+0.04,-0.03,+0.01,-0.02,0,0.01]
+    env = np.zeros(len(tvals))
+    for i, c in enumerate(coefficients):
+        env += c/6.114 * np.cos(i*(2*np.pi/length)*tvals)
+    return env
+
+class ReburpTest(unittest.TestCase):
+
+    def setUp(self):
+        shapes.tabulate = True
+
+    def test_envelope(self):
+        rnd = np.random.RandomState(0)
+        for length in [1., 1e-6, 3.7e-6]:
+            for tvals in [np.linspace(0, length, 1001),
+                    np.linspace(-2*length, 3*length, 1234),
+                    rnd.uniform(-length, 2*length, 500)]:
+                self.assertTrue(np.abs(pulselib.reburp_envelope(tvals,
+                    length) - reburp_series(tvals, length)).max() < 1e-14)
+
+    def test_shape(self):
+        s = shapes.get('reburp')
+        u = np.linspace(-1.5, 2.5, 10001)
+        self.assertTrue(np.abs(s(u) - reburp_series(u, 1.)).max() < 1e-7)
+
+    def test_pulse(self):
+        length = 2e-6
+        p = pulselib.ReburpPulse('ch1', amplitude=0.3, length=length)
+        tvals = np.arange(2400) / 1.2e9
+        self.assertTrue(np.abs(p.chan_wf('ch1', tvals) - \
+            0.3 * reburp_series(tvals, length)).max() < 1e-7)
+
+    def test_call_keeps_values(self):
+        p = pulselib.ReburpPulse('ch1', frequency=2e6, amplitude=0.3,
+            length=2e-6, phase=45.)
+        p(amplitude=0.2)
+        self.assertEqual((p.frequency, p.amplitude, p.length, p.phase),
+            (2e6, 0.2, 2e-6, 45.))
+        p(length=1e-6)
+        self.assertEqual((p.frequency, p.amplitude, p.length, p.phase),
+            (2e6, 0.2, 1e-6, 45.))
+
+class RenderTest(unittest.TestCase):
+
+    clock = 1.2e9
+
+    def pulses(self):
+        kw = dict(frequency=23.4e6, amplitude=0.3, PM_risetime=10e-9)
+        return [
+            pulselib.MW_IQmod_pulse('mw', 'I', 'Q', 'PM', length=100e-9,
+                phase=30., **kw),
+            pulselib.MW_IQmod_pulse('mw', 'I', 'Q', 'PM', length=100e-9,
+                phaselock=False, **kw),
+            pulselib.IQ_CORPSE_pulse('c', 'I', 'Q', 'PM', 
+                eff_rotation_angle=90, rabi_frequency=10e6, **kw),
+            pulselib.IQ_CORPSE_pi_pulse('c', 'I', 'Q', 'PM', length_60=10e-9,
+                length_m300=50e-9, length_420=70e-9, **kw),
+            pulselib.IQ_CORPSE_pi2_pulse('c', 'I', 'Q', 'PM', 
+                length_24p3=4e-9, length_m318p6=53e-9, length_384p3=64e-9,
+                pulse_delay=2.3e-9, **kw),
+            pulselib.GaussianPulse_Envelope_IQ('g', 'I', 'Q', 'PM', 
+                length=80e-9, **kw),
+            pulselib.HermitePulse_Envelope_IQ('h', 'I', 'Q', 'PM', 
+                length=80e-9, **kw),
+            pulselib.ReburpPulse_Envelope_IQ('r', 'I', 'Q', 'PM', 
+                length=80e-9, **kw),
+            ]
+
+    def tvals(self, p, first, delays):
+        n = int(np.ceil(p.length * self.clock))
+        return dict([(c, (first + np.arange(n)) / self.clock + delays[c]) \
+            for c in ['I', 'Q', 'PM']])
+
+    def assertRenderLikeGetWfs(self, p, tvals):
+        rendered = p.render(tvals)
+        wfs = p.get_wfs(tvals)
+        self.assertEqual(sorted(rendered), sorted(wfs))
+        for c in wfs:
+            self.assertTrue(np.array_equal(rendered[c], wfs[c]), 
+                (p.__class__.__name__, c))
+        self.assertTrue(np.abs(wfs['I']).max() > 0.1, p.__class__.__name__)
+
+    def test_render(self):
+        for p in self.pulses():
+            for clock in [self.clock, None]:
+                p._clock = clock
+                for first in [0, 37]:
+                    tvals = self.tvals(p, first, dict(I=0., Q=0., PM=0.))
+                    self.assertRenderLikeGetWfs(p, tvals['I'])
+                    self.assertRenderLikeGetWfs(p, tvals)
+                    # I and Q with different delays
+                    self.assertRenderLikeGetWfs(p, self.tvals(p, first,
+                        dict(I=0., Q=3e-9, PM=-5e-9)))
+
+if __name__ == '__main__':
+    unittest.main()
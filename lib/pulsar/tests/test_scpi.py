@@ -0,0 +1,110 @@
+import logging
+import unittest
+
+import scpi
+import simawg
+from test_pulsar import simulated_pulsar
+
+logging.disable(logging.WARNING)
+
+class CommandTest(unittest.TestCase):
+
+    def test_commands(self):
+        self.assertEqual(scpi.command('set_ch2_amplitude', 0.5),
+            'SOUR2:VOLT:AMPL 0.500000')
+        self.assertEqual(scpi.command('set_ch3_status', 'on'), 'OUTP3:STAT 1')
+        self.assertEqual(scpi.command('set_ch1_marker2_high', 2.),
+            'SOUR1:MARK2:VOLT:HIGH 2.000')
+        self.assertEqual(scpi.command('set_sqel_waveform', 'wf', 4, 12),
+            'SEQ:ELEM12:WAV4 "wf"')
+        self.assertEqual(scpi.command('set_sqel_loopcnt_to_inf', 3, True),
+            'SEQ:ELEM3:LOOP:INF 1')
+        self.assertEqual(scpi.command('send_waveform', 1, 2, 3), None)
+
+class CommandBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.awg = scpi.RecordingAWG()
+        self.batch = scpi.CommandBatch(self.awg, max_length=60)
+
+    def test_batching(self):
+        for ch in range(1, 5):
+            self.batch.set_sqel_waveform('wf', ch, 1)
+        self.assertEqual(self.awg.transfers(), 1)
+        self.batch.finish()
+
+        self.assertEqual(self.awg.transfers(), 3)
+        self.assertEqual(self.awg.commands()[:4],
+            ['SEQ:ELEM1:WAV%d "wf"' % ch for ch in range(1, 5)])
+        self.assertEqual(self.awg.commands()[-1], 'SYST:ERR?')
+        self.assertEqual(self.batch.commands, 4)
+        for msg in self.awg.messages:
+            self.assertTrue(len(msg) <= 60)
+
+    def test_order(self):
+        self.batch.set_sq_length(2)
+        self.batch.send_waveform('w', 'm1', 'm2', 'wf', 1e9)
+        self.batch.set_sqel_waveform('wf', 1, 1)
+        self.batch.flush()
+
+        self.assertEqual(self.awg.messages[0], ':SEQ:LENG 2')
+        self.assertEqual([c[0] for c in self.awg.calls],
+            ['send_waveform'])
+        self.assertEqual(self.awg.messages[1], ':SEQ:ELEM1:WAV1 "wf"')
+
+    def test_driver_values_updated(self):
+        self.batch.max_length = 4096
+        self.batch.set_ch1_amplitude(0.5)
+        self.batch.set_ch1_marker1_low(0.1)
+        self.batch.set_sqel_goto_state(1, True)
+        self.assertEqual(self.awg.updates, [])
+
+        self.batch.flush()
+        self.assertEqual(self.awg.updates, [('ch1_amplitude', 0.5),
+            ('ch1_marker1_low', 0.1)])
+
+    def test_discard(self):
+        self.batch.set_ch1_amplitude(0.5)
+        self.batch.discard()
+        self.batch.flush()
+        self.assertEqual(self.awg.messages, [])
+        self.assertEqual(self.awg.updates, [])
+
+    def test_errors(self):
+        awg = simawg.SimulatedAWG(latency=0.)
+        batch = scpi.CommandBatch(awg)
+        batch.set_sq_length(1)
+        batch.set_sqel_waveform('nope', 1, 1)
+        self.assertRaises(Exception, batch.finish)
+
+class SetupChannelsTest(unittest.TestCase):
+
+    def setup(self, use_scpi):
+        p = simulated_pulsar(simawg.SimulatedAWG(latency=0.,
+            scpi=use_scpi))
+        p.setup_channels(output=True)
+        self.assertEqual(p.AWG.errors(), [])
+        return p.AWG
+
+    def test_batched_like_direct(self):
+        batched = self.setup(True)
+        direct = self.setup(False)
+
+        self.assertEqual(batched.settings, direct.settings)
+        self.assertEqual(batched.calls, [])
+        self.assertTrue(batched.transfers < len(direct.calls))
+
+    def test_driver_values(self):
+        awg = self.setup(True)
+        self.assertEqual(sorted(awg.parameters.keys()),
+            sorted(awg.settings.keys()))
+        for name in awg.settings:
+            value = awg.parameters[name]
+            if name.endswith('status'):
+                value = simawg._state(value)
+            self.assertEqual(value, awg.settings[name])
+        self.assertEqual(awg.get_ch1_amplitude(), 2.)
+        self.assertEqual(awg.get_ch1_status(), 'on')
+
+if __name__ == '__main__':
+    unittest.main()
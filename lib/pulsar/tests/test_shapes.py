@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+
+import shapes
+import pulselib
+
+class ShapeTest(unittest.TestCase):
+
+    def setUp(self):
+        shapes.tabulate = True
+
+    def test_max_error(self):
+        rnd = np.random.RandomState(0)
+        for name in shapes.names():
+            s = shapes.get(name)
+            s.table()
+            self.assertTrue(s.max_error < 1e-7, name)
+
+            u = rnd.uniform(s.lo, s.hi, 100000)
+            err = np.abs(s(u) - s.exact(u)).max()
+            self.assertTrue(err <= s.max_error * 1.01 + 1e-15, name)
+
+    def test_grid_points(self):
+        for name in shapes.names():
+            s = shapes.get(name)
+            u = s.lo + s.step * np.arange(100, 200)
+            self.assertTrue(np.array_equal(s(u), s.table()[100:200]), name)
+
+    def test_outside(self):
+        for name in shapes.names():
+            s = shapes.get(name)
+            w = s.hi - s.lo
+            u = np.linspace(s.lo - w, s.hi + w, 10001)
+            err = np.abs(s(u) - s.exact(u)).max()
+            self.assertTrue(err <= s.max_error * 1.01 + 1e-15, name)
+            if not s.periodic:
+                u = u[u > s.hi]
+                self.assertTrue(np.array_equal(s(u), s.exact(u)), name)
+
+    def test_constant(self):
+        for name in shapes.names():
+            s = shapes.get(name)
+            if not s.constant:
+                continue
+            w = s.hi - s.lo
+            u = np.linspace(s.hi, s.hi + 1000*w, 100001)
+            self.assertTrue((s.exact(u) == s.table()[-1]).all(), name)
+            u = np.linspace(s.lo - 1000*w, s.lo, 100001)
+            self.assertTrue((s.exact(u) == s.table()[0]).all(), name)
+
+    def test_gaussian_tail(self):
+        s = shapes.get('gaussian')
+        u = np.array([-12., 0., 9., 10.])
+        self.assertTrue(np.array_equal(s(u)[[0, 2, 3]], 
+            np.exp(-u[[0, 2, 3]]**2/2.)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import logging
+import unittest
+import numpy as np
+
+import pulse
+import pulselib
+import element
+import synthesis
+import nco
+
+logging.disable(logging.WARNING)
+
+def mixed_element(global_time=False):
+    e = element.Element('mixed', clock=1.2e9, min_samples=0, 
+        global_time=global_time, time_offset=2e-3, use_cache=False)
+    e.define_channel('RF', delay=20e-9, high=1., low=-1.)
+    e.define_channel('I', delay=27.3e-9, high=1., low=-1.)
+    e.define_channel('Q', delay=27.3e-9, high=1., low=-1.)
+    e.define_channel('PM', type='marker', delay=44e-9, high=1., low=0.)
+
+    sine = pulse.SinePulse('RF', frequency=123.456789e6, amplitude=0.3,
+        length=200e-9)
+    mw = pulselib.MW_IQmod_pulse('mw', 'I', 'Q', 'PM', frequency=37.5e6,
+        amplitude=0.4, length=100e-9, PM_risetime=10e-9)
+    gauss = pulselib.GaussianPulse_Envelope_IQ('g', 'I', 'Q', 'PM',
+        frequency=50e6, amplitude=0.3, length=80e-9, mu=40e-9, std=10e-9)
+    for i in range(6):
+        e.append(pulse.cp(sine, phase=i*37.), pulse.cp(mw, phase=i*11.),
+            pulse.cp(gauss, phase=i*5.),
+            pulse.SquarePulse('RF', amplitude=0.1, length=(i+1)*10e-9))
+    e.append(pulse.cp(mw, length=2e-6, phase=3.))
+    return e
+
+def single_render(e):
+    """
+    Renders the element pulse by pulse through get_wfs (or render).
+    """
+    table = e._timing_table()
+    tvals = np.arange(e.samples()) / e.clock
+    wfs = {}
+    for c in e._channels:
+        wfs[c] = np.zeros(e.samples()) + e._channels[c]['offset']
+    for p in e.pulses:
+        pulsewfs = synthesis.render_pulse(e, tvals, p)
+        for c in e.pulses[p].channels:
+            s = table['start_samples'][p][c]
+            wfs[c][s:s+len(pulsewfs[c])] += pulsewfs[c]
+    return wfs
+
+class BatchRenderTest(unittest.TestCase):
+
+    def tearDown(self):
+        nco.enabled = True
+
+    def check(self, global_time, tol=1e-12):
+        e = mixed_element(global_time)
+        kinds = [kind for kind, names in synthesis.group_pulses(e)]
+        self.assertTrue('batch' in kinds)
+
+        wfs = e.ideal_waveforms()[1]
+        ref = single_render(e)
+        for c in e._channels:
+            self.assertTrue(np.abs(wfs[c] - ref[c]).max() < tol, c)
+
+    def test_local_time(self):
+        self.check(False)
+
+    def test_global_time(self):
+        # the batch starts the carrier at the first sample of a pulse, the
+        # single rendering at the first sample of its IQ part; off the
+        # sample grid, their phases agree up to the rounding of the times
+        self.check(True, 1e-9)
+
+    def test_direct_formula(self):
+        nco.enabled = False
+        self.check(False)
+        self.check(True, 1e-9)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+import pulse
+import element
+import validation
+
+from test_pulsar import simulated_pulsar
+
+class ElementTimingTest(unittest.TestCase):
+
+    def element(self, start=0., delay=0.):
+        p = simulated_pulsar()
+        p.channels['RF']['delay'] = delay
+        elt = element.Element('e', pulsar=p, use_cache=False)
+        elt.add(pulse.SquarePulse('RF', amplitude=0.5, length=1e-6), 
+            name='sq', start=start)
+        elt.add(pulse.SquarePulse('trigger', amplitude=1., length=100e-9),
+            name='trig', start=200e-9)
+        return p, elt
+
+    def early_warnings(self, report):
+        return [w for w in report.warnings if 'before time zero' in w]
+
+    def test_channel_delay(self):
+        p, elt = self.element(delay=50e-9)
+        report = p.validate(elements=[elt])
+        self.assertEqual(self.early_warnings(report), [])
+
+    def test_negative_start(self):
+        p, elt = self.element(start=-100e-9)
+        report = p.validate(elements=[elt])
+        self.assertEqual(len(self.early_warnings(report)), 1)
+        self.assertTrue("pulse 'sq'" in self.early_warnings(report)[0])
+
+    def test_negative_start_and_channel_delay(self):
+        p, elt = self.element(start=-100e-9, delay=50e-9)
+        report = validation.ValidationReport()
+        validation.check_element(elt, report, p)
+        self.assertEqual(len(self.early_warnings(report)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import numpy as np
+
+import pulse
+import pulselib
+import element
+import shapes
+import nco
+import wfcache
+
+class WaveformCacheKeyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = wfcache.WaveformCache()
+        self.pulse = pulse.SinePulse('ch1', frequency=10e6, amplitude=0.5,
+            length=1e-6)
+        self.pulse._clock = 1e9
+
+    def tearDown(self):
+        shapes.tabulate = True
+        nco.enabled = True
+
+    def key(self, p=None):
+        return self.cache.key(self.pulse if p == None else p, 1000, 1e9)
+
+    def test_same_content_same_key(self):
+        other = pulse.cp(self.pulse)
+        other.name = 'other'
+        other._t0 = 1e-6
+        self.assertEqual(self.key(), self.key(other))
+
+    def test_public_attributes(self):
+        other = pulse.cp(self.pulse, amplitude=0.6)
+        self.assertNotEqual(self.key(), self.key(other))
+
+    def test_private_attributes(self):
+        other = pulse.clone(self.pulse)
+        other._clock = 1.2e9
+        self.assertNotEqual(self.key(), self.key(other))
+
+    def test_switches(self):
+        key = self.key()
+        for m, a in wfcache.SWITCHES:
+            setattr(m, a, not getattr(m, a))
+            self.assertNotEqual(key, self.key())
+            setattr(m, a, not getattr(m, a))
+            self.assertEqual(key, self.key())
+
+    def test_unhashable(self):
+        self.pulse.extra = [[1, 2]]
+        self.assertEqual(self.key(), None)
+
+class WaveformCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = wfcache.WaveformCache(max_bytes=1000)
+
+    def test_put_get(self):
+        self.cache.put('a', {'ch1' : np.zeros(10)})
+        self.assertEqual(self.cache.get('b'), None)
+        wfs = self.cache.get('a')
+        self.assertFalse(wfs['ch1'].flags.writeable)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_eviction(self):
+        for k in range(5):
+            self.cache.put(k, {'ch1' : np.zeros(40)})
+        self.cache.get(2)
+        self.cache.put(5, {'ch1' : np.zeros(40)})
+        self.assertTrue(self.cache.stats()['bytes'] <= 1000)
+        self.assertEqual(self.cache.get(0), None)
+        self.assertNotEqual(self.cache.get(2), None)
+
+    def test_disabled(self):
+        self.cache.enabled = False
+        self.cache.put('a', {'ch1' : np.zeros(10)})
+        self.assertEqual(self.cache.get('a'), None)
+
+class ElementCacheTest(unittest.TestCase):
+
+    def tearDown(self):
+        shapes.tabulate = True
+
+    def render(self):
+        e = element.Element('e', min_samples=0)
+        for c in ['I', 'Q', 'PM']:
+            e.define_channel(c, high=1., low=-1.)
+        e.append(pulselib.GaussianPulse_Envelope_IQ('g', 'I', 'Q', 'PM',
+            length=200e-9, frequency=30e6, amplitude=0.5, PM_risetime=10e-9,
+            std=23.3e-9))
+        return e.ideal_waveforms()[1]['I']
+
+    def test_switch_renders_again(self):
+        tabulated = self.render()
+        shapes.tabulate = False
+        exact = self.render()
+        self.assertFalse(np.array_equal(tabulated, exact))
+        self.assertTrue(np.abs(tabulated - exact).max() < 1e-6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,283 @@
+# Checks of elements and sequences before they are uploaded.
+#
+# Everything here works on the timing tables of the elements and on the
+# sequence columns only; no samples are computed. Problems that would make
+# the upload or the programming fail are errors, things that are likely
+# mistakes (but play) are warnings. The report also contains the numbers
+# that describe the size of the job: samples, bytes to upload, and the
+# estimated time for the transfer and the programming.
+
+import math
+
+import scpi
+import pulsar
+
+class CommandCounter:
+    """
+    Stands in for the AWG and counts the setter calls, and the characters
+    of the corresponding SCPI commands.
+    """
+
+    def __init__(self):
+        self.commands = 0
+        self.chars = 0
+
+    def __getattr__(self, name):
+        if name[0] == '_':
+            raise AttributeError(name)
+
+        def call(*args):
+            self.commands += 1
+            cmd = scpi.command(name, *args)
+            self.chars += len(cmd) + 2 if cmd != None else 0
+        return call
+
+class ValidationReport:
+    """
+    Result of a validation: errors and warnings (lists of strings), and
+    stats, a dictionary with the numbers of the job.
+    """
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.stats = {}
+        self.occupancy = {}
+
+    def ok(self):
+        return len(self.errors) == 0
+
+    def error(self, msg):
+        self.errors.append(msg)
+
+    def warning(self, msg):
+        self.warnings.append(msg)
+
+    def raise_errors(self):
+        """
+        Raises an Exception that lists all errors, if there are any.
+        """
+        if not self.ok():
+            raise Exception('Validation failed:\n  ' + \
+                '\n  '.join(self.errors))
+
+    def __str__(self):
+        lines = []
+        for e in self.errors:
+            lines.append('ERROR: ' + e)
+        for w in self.warnings:
+            lines.append('WARNING: ' + w)
+
+        for k in sorted(self.stats):
+            v = self.stats[k]
+            if isinstance(v, float):
+                lines.append('%s: %.3g' % (k, v))
+            else:
+                lines.append('%s: %s' % (k, v))
+
+        for elt in sorted(self.occupancy):
+            lines.append('occupancy of %s: %s' % (elt, ', '.join(
+                ['%s %.1f%%' % (c, 100.*self.occupancy[elt][c]) \
+                    for c in sorted(self.occupancy[elt])])))
+
+        return '\n'.join(lines)
+
+def _intervals(element, c):
+    """
+    Returns the sample intervals (first, last, pulse) of all pulses on
+    channel c, sorted by first sample.
+    """
+    table = element._timing_table()
+    intervals = []
+    for p in table['start_samples']:
+        if c in table['start_samples'][p]:
+            intervals.append((table['start_samples'][p][c],
+                table['end_samples'][p][c], p))
+    intervals.sort()
+    return intervals
+
+def check_element(element, report, pulsar_obj=None, max_overlaps=10):
+    """
+    Adds the errors, warnings and occupancy of an element to the report.
+    Returns the number of samples of the element (0 if it is broken).
+    """
+    name = element.name
+    if len(element.pulses) == 0:
+        report.error("Element '%s' has no pulses." % name)
+        return 0
+
+    broken = False
+    for p in element.pulses:
+        pulse = element.pulses[p]
+        for c in pulse.channels:
+            if c not in element._channels:
+                report.error("Element '%s': pulse '%s' uses channel '%s', " \
+                    "which is not defined." % (name, p, c))
+                broken = True
+        if pulse.length < 0:
+            report.error("Element '%s': pulse '%s' has negative length." % \
+                (name, p))
+            broken = True
+    if broken:
+        return 0
+
+    table = element._timing_table()
+    samples = element.samples()
+    content = table['last_sample'] + 1
+
+    if pulsar_obj != None and samples < pulsar_obj.min_waveform_samples:
+        report.error("Element '%s' has %d samples, the AWG needs at " \
+            "least %d." % (name, samples, pulsar_obj.min_waveform_samples))
+    if content < element.min_samples:
+        report.warning("Element '%s' is padded from %d to %d samples " \
+            "(min_samples)." % (name, content, samples))
+
+    # a pulse that starts before time zero moves the start of the element
+    # there, such that all pulses play later after the trigger than
+    # specified. (Channel delays that make a pulse play before time zero
+    # shift the element as well, but that is what they are for.)
+    early = [(element.pulses[p].t0(), p) for p in element.pulses \
+        if element.pulses[p].t0() < 0]
+    if len(early) > 0:
+        t0, p = min(early)
+        report.warning("Element '%s': pulse '%s' starts %g s before time " \
+            "zero." % (name, p, -t0))
+
+    if pulsar_obj != None:
+        for c in element._channels:
+            if c not in pulsar_obj.channels:
+                report.warning("Element '%s': channel '%s' is not a " \
+                    "channel of the AWG and will not be uploaded." % \
+                    (name, c))
+
+    # overlaps and occupancy per channel
+    occupancy = {}
+    overlaps = 0
+    for c in element._channels:
+        covered = 0
+        last, last_pulse = -1, None
+        for s0, s1, p in _intervals(element, c):
+            if s0 <= last:
+                overlaps += 1
+                if overlaps <= max_overlaps:
+                    report.warning("Element '%s': pulses '%s' and '%s' " \
+                        "overlap on channel '%s'." % (name, last_pulse, p, c))
+            covered += max(0, s1 - max(s0, last+1) + 1)
+            if s1 > last:
+                last, last_pulse = s1, p
+        occupancy[c] = float(covered) / samples
+
+    if overlaps > max_overlaps:
+        report.warning("Element '%s': %d more overlaps." % \
+            (name, overlaps - max_overlaps))
+
+    report.occupancy[name] = occupancy
+    return samples
+
+def check_sequence(sequence, report, element_names, pulsar_obj=None,
+        loop=True, channels='all'):
+    """
+    Adds the errors and warnings of a sequence to the report.
+    element_names are the names of the elements that will be uploaded;
+    waveforms that are on the AWG already (according to the registry of
+    pulsar_obj) are fine as well.
+    """
+    name = sequence.name
+    n = sequence.element_count()
+    if n == 0:
+        report.error("Sequence '%s' is empty." % name)
+        return
+
+    names = set(sequence.names)
+    for i in range(n):
+        for kind, target in [('goto', sequence.goto_target(i)),
+                ('jump', sequence.jump_target(i))]:
+            if target != None and target not in names:
+                report.error("Sequence '%s': %s target '%s' of '%s' does " \
+                    "not exist." % (name, kind, target, sequence.names[i]))
+
+        reps = sequence.repetitions[i]
+        if reps == 0 or reps < -1 or reps > pulsar.MAX_REPETITIONS:
+            report.error("Sequence '%s': '%s' has %d repetitions." % \
+                (name, sequence.names[i], reps))
+
+    if sequence.djump_table != None:
+        if pulsar_obj != None and pulsar_obj.AWG_type not in ['opt09']:
+            report.error("Sequence '%s' uses dynamic jumping, which the " \
+                "AWG does not support." % name)
+        for pattern in sequence.djump_table:
+            if sequence.djump_table[pattern] not in names:
+                report.error("Sequence '%s': djump target '%s' does not " \
+                    "exist." % (name, sequence.djump_table[pattern]))
+
+    chan_ids = ['ch1']
+    if pulsar_obj != None:
+        chan_ids = pulsar_obj.sequence_channel_ids(channels)
+
+    for wfname in set([sequence.wfname(i) for i in range(n)]):
+        if wfname in element_names:
+            continue
+        if pulsar_obj != None and len([id for id in chan_ids \
+                if pulsar_obj._wf_names.get(wfname + '_%s' % id) in \
+                    pulsar_obj._wf_stored]) == len(chan_ids):
+            continue
+        report.error("Sequence '%s': waveform '%s' is neither uploaded " \
+            "nor on the AWG." % (name, wfname))
+
+def validate(pulsar_obj, sequence=None, elements=[], channels='all',
+        loop=True):
+    """
+    Checks the elements (and element families) and the sequence, and
+    estimates the size of the job. Returns a ValidationReport.
+    """
+    report = ValidationReport()
+
+    element_names = set()
+    total_samples = 0
+    element_cnt = 0
+    for e in elements:
+        variants = e.elements() if hasattr(e, 'elements') else [e]
+        for elt in variants:
+            if elt.name in element_names:
+                report.error("Element name '%s' is used twice." % elt.name)
+            element_names.add(elt.name)
+            total_samples += check_element(elt, report, pulsar_obj)
+            element_cnt += 1
+
+    chan_ids = pulsar_obj.sequence_channel_ids(channels)
+    upload_bytes = total_samples * len(chan_ids) * \
+        pulsar.REAL_WAVEFORM_DTYPE.itemsize
+
+    report.stats['elements'] = element_cnt
+    report.stats['samples'] = total_samples
+    report.stats['upload bytes'] = upload_bytes
+    report.stats['estimated upload time (s)'] = \
+        upload_bytes / pulsar_obj.transfer_rate + \
+        2 * element_cnt * len(chan_ids) * pulsar_obj.command_time
+
+    if sequence != None:
+        check_sequence(sequence, report, element_names, pulsar_obj,
+            loop=loop, channels=channels)
+
+    if sequence != None and report.ok():
+        # count the commands that program_sequence would send
+        table = pulsar_obj.sequence_table(sequence, chan_ids, loop=loop,
+            waveform_name=lambda wfname: wfname)
+        old_table, clear = pulsar_obj._sequence_table_base(table)
+        counter = CommandCounter()
+        for i, row in enumerate(table):
+            pulsar_obj._program_sequence_row(i+1, row, old_table[i],
+                awg=counter)
+
+        commands = counter.commands + (2 if clear else 0)
+        if pulsar_obj.batch_commands:
+            transfers = int(math.ceil(counter.chars / 4096.)) + 1
+        else:
+            transfers = commands
+
+        report.stats['sequence rows'] = len(table)
+        report.stats['sequence commands'] = commands
+        report.stats['estimated programming time (s)'] = \
+            transfers * pulsar_obj.command_time
+
+    return report
@@ -0,0 +1,198 @@
+# A process-wide cache for rendered pulse waveforms.
+#
+# Pulses are identified by their content: the class (including its source
+# code, such that changes in the implementation do not return stale
+# waveforms), all attributes but the name and the start time, the number of
+# samples, the clock, where the time values start (only relevant for
+# elements that use global time), and the module switches that change how
+# pulses are rendered (see SWITCHES). Elements that are rebuilt for every
+# point of a sweep can then reuse the samples of all pulses that did not
+# change.
+
+import os
+import atexit
+import hashlib
+import inspect
+import logging
+import cPickle as pickle
+from collections import OrderedDict
+
+import synthesis
+import shapes
+import nco
+
+# module attributes that change the waveforms of pulses; their values are
+# part of every key
+SWITCHES = [(shapes, 'tabulate'), (nco, 'enabled')]
+
+class WaveformCache:
+    """
+    LRU cache that maps pulse keys to dictionaries of channel waveforms.
+
+    The total size of the stored arrays is kept below max_bytes. If a path
+    is given, the cache is loaded from there on creation and written back
+    when the interpreter exits (or when save() is called).
+    """
+
+    def __init__(self, max_bytes=128*2**20, path=None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.enabled = True
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._class_tokens = {}
+
+        if self.path != None:
+            if os.path.exists(self.path):
+                self.load()
+            atexit.register(self.save)
+
+    ### keys
+    def _class_token(self, cls):
+        if cls not in self._class_tokens:
+            src = ''
+            for c in inspect.getmro(cls):
+                try:
+                    src += inspect.getsource(c)
+                except (IOError, TypeError):
+                    src += c.__module__ + '.' + c.__name__
+            self._class_tokens[cls] = (cls.__module__, cls.__name__,
+                hashlib.md5(src).hexdigest())
+
+        return self._class_tokens[cls]
+
+    def key(self, pulse, samples, clock, tstart=None):
+        """
+        Returns the cache key of a pulse rendered with the given number of
+        samples and clock, or None if the pulse cannot be cached.
+        tstart describes where the time values start, if they do not start
+        at zero.
+        """
+        sig = synthesis.pulse_signature(pulse)
+        if sig == None:
+            return None
+
+        switches = tuple([getattr(m, a) for m, a in SWITCHES])
+        return (self._class_token(sig[0]), sig[1], samples, clock, tstart,
+            switches)
+
+    ### access
+    def get(self, key):
+        """
+        Returns the cached waveforms for key (and marks them as recently
+        used), or None.
+        """
+        if key == None or not self.enabled:
+            return None
+
+        wfs = self._entries.pop(key, None)
+        if wfs == None:
+            self.misses += 1
+            return None
+
+        self._entries[key] = wfs
+        self.hits += 1
+        return wfs
+
+    def put(self, key, wfs):
+        """
+        Stores a dictionary of channel waveforms. The arrays are made
+        read-only, since they will be shared by all users of the cache.
+        """
+        if key == None or not self.enabled:
+            return
+
+        nbytes = sum([wfs[c].nbytes for c in wfs])
+        if nbytes > self.max_bytes:
+            return
+
+        for c in wfs:
+            wfs[c].flags.writeable = False
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = wfs
+        self._nbytes += nbytes
+        self.shrink()
+
+    def _remove(self, key):
+        wfs = self._entries.pop(key)
+        self._nbytes -= sum([wfs[c].nbytes for c in wfs])
+
+    def shrink(self, max_bytes=None):
+        """
+        Evicts the least recently used waveforms until the cache fits into
+        max_bytes (default: the configured ceiling).
+        """
+        if max_bytes == None:
+            max_bytes = self.max_bytes
+
+        while self._nbytes > max_bytes and len(self._entries) > 0:
+            self._remove(next(iter(self._entries)))
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.shrink()
+
+    def clear(self):
+        self._entries.clear()
+        self._nbytes = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'entries' : len(self._entries),
+            'bytes' : self._nbytes,
+            'max bytes' : self.max_bytes,
+            }
+
+    ### persistence
+    def save(self, path=None):
+        if path == None:
+            path = self.path
+        if path == None:
+            raise Exception('No path given to save the waveform cache.')
+
+        f = open(path, 'wb')
+        try:
+            pickle.dump(self._entries.items(), f, pickle.HIGHEST_PROTOCOL)
+        except pickle.PicklingError as e:
+            logging.warning('Could not save waveform cache to %s: %s' \
+                % (path, e))
+        finally:
+            f.close()
+
+    def load(self, path=None):
+        """
+        Adds the entries stored in path to the cache. Entries that were
+        created from a different version of the pulse classes are never
+        hit, since the source code is part of the key.
+        """
+        if path == None:
+            path = self.path
+
+        try:
+            f = open(path, 'rb')
+            try:
+                items = pickle.load(f)
+            finally:
+                f.close()
+        except Exception as e:
+            logging.warning('Could not load waveform cache from %s: %s' \
+                % (path, e))
+            return
+
+        for key, wfs in items:
+            self.put(key, wfs)
+
+# the cache that is used by all elements
+cache = WaveformCache()